@@ -48,8 +48,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'care_plans.db',
+        'TEST': {
+            'NAME': BASE_DIR / 'test_care_plans.db',
+        },
     }
 }
+TEST_RUNNER = 'care_plan_api.test_runner.CarePlanTestRunner'
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -75,6 +79,51 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
 }
+CARE_PLAN_ASYNC_VIEWS = os.getenv('CARE_PLAN_ASYNC_VIEWS', 'false').lower() in ('1', 'true', 'yes')
+CARE_PLAN_JOB_WORKERS = int(os.getenv('CARE_PLAN_JOB_WORKERS', '4'))
+CARE_PLAN_JOB_STALE_SECONDS = float(os.getenv('CARE_PLAN_JOB_STALE_SECONDS', '900'))
+CARE_PLAN_BATCH_CONCURRENCY = int(os.getenv('CARE_PLAN_BATCH_CONCURRENCY', '8'))
+CARE_PLAN_BATCH_MAX_SIZE = int(os.getenv('CARE_PLAN_BATCH_MAX_SIZE', '100'))
+CARE_PLAN_VALIDATE_BATCH_MAX_SIZE = int(os.getenv('CARE_PLAN_VALIDATE_BATCH_MAX_SIZE', '1000'))
+CARE_PLAN_DUPLICATE_ORDER_WINDOW_HOURS = float(os.getenv('CARE_PLAN_DUPLICATE_ORDER_WINDOW_HOURS', '24'))
+CARE_PLAN_MEDICATION_MATCH_IGNORE_CASE = os.getenv('CARE_PLAN_MEDICATION_MATCH_IGNORE_CASE', 'false').lower() in ('1', 'true', 'yes')
+CARE_PLAN_MEDICATION_MATCH_IGNORE_STRENGTH = os.getenv('CARE_PLAN_MEDICATION_MATCH_IGNORE_STRENGTH', 'false').lower() in ('1', 'true', 'yes')
+CARE_PLAN_FUZZY_PATIENT_THRESHOLD = float(os.getenv('CARE_PLAN_FUZZY_PATIENT_THRESHOLD', '0.85'))
+CARE_PLAN_FUZZY_PATIENT_CANDIDATES = int(os.getenv('CARE_PLAN_FUZZY_PATIENT_CANDIDATES', '50'))
+CARE_PLAN_PRESENCE_FILTER_ENABLED = os.getenv('CARE_PLAN_PRESENCE_FILTER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CARE_PLAN_PRESENCE_FILTER_ERROR_RATE = float(os.getenv('CARE_PLAN_PRESENCE_FILTER_ERROR_RATE', '0.001'))
+CARE_PLAN_PRESENCE_FILTER_MIN_CAPACITY = int(os.getenv('CARE_PLAN_PRESENCE_FILTER_MIN_CAPACITY', '100000'))
+CARE_PLAN_PRESENCE_RECONCILE_SECONDS = float(os.getenv('CARE_PLAN_PRESENCE_RECONCILE_SECONDS', '5'))
+CARE_PLAN_LLM_TIMEOUT_SECONDS = float(os.getenv('CARE_PLAN_LLM_TIMEOUT_SECONDS', '150'))
+CARE_PLAN_LLM_MAX_RETRIES = int(os.getenv('CARE_PLAN_LLM_MAX_RETRIES', '2'))
+CARE_PLAN_LLM_BACKOFF_BASE_SECONDS = float(os.getenv('CARE_PLAN_LLM_BACKOFF_BASE_SECONDS', '1'))
+CARE_PLAN_LLM_BACKOFF_MAX_SECONDS = float(os.getenv('CARE_PLAN_LLM_BACKOFF_MAX_SECONDS', '20'))
+CARE_PLAN_LLM_HEDGING_ENABLED = os.getenv('CARE_PLAN_LLM_HEDGING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+CARE_PLAN_LLM_HEDGE_MIN_SAMPLES = int(os.getenv('CARE_PLAN_LLM_HEDGE_MIN_SAMPLES', '20'))
+CARE_PLAN_LLM_HEDGE_WORKERS = int(os.getenv('CARE_PLAN_LLM_HEDGE_WORKERS', '64'))
+CARE_PLAN_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CARE_PLAN_CIRCUIT_FAILURE_THRESHOLD', '5'))
+CARE_PLAN_CIRCUIT_RESET_SECONDS = float(os.getenv('CARE_PLAN_CIRCUIT_RESET_SECONDS', '30'))
+CARE_PLAN_RATE_LIMIT_DB = Path(os.getenv('CARE_PLAN_RATE_LIMIT_DB', BASE_DIR / 'rate_limit.sqlite3'))
+CARE_PLAN_RATE_LIMIT_RPM = int(os.getenv('CARE_PLAN_RATE_LIMIT_RPM', '500'))
+CARE_PLAN_RATE_LIMIT_TPM = int(os.getenv('CARE_PLAN_RATE_LIMIT_TPM', '500000'))
+CARE_PLAN_RATE_LIMIT_COMPLETION_TOKENS = int(os.getenv('CARE_PLAN_RATE_LIMIT_COMPLETION_TOKENS', '6000'))
+CARE_PLAN_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv('CARE_PLAN_RATE_LIMIT_MAX_WAIT_SECONDS', '300'))
+CARE_PLAN_PARALLEL_SECTIONS = os.getenv('CARE_PLAN_PARALLEL_SECTIONS', 'false').lower() in ('1', 'true', 'yes')
+CARE_PLAN_RECORDS_TOKEN_BUDGET = int(os.getenv('CARE_PLAN_RECORDS_TOKEN_BUDGET', '8000'))
+CARE_PLAN_EXPORT_CHUNK_SIZE = int(os.getenv('CARE_PLAN_EXPORT_CHUNK_SIZE', '2000'))
+CARE_PLAN_EXPORT_DIR = Path(os.getenv('CARE_PLAN_EXPORT_DIR', BASE_DIR / 'exports'))
+CARE_PLAN_EXPORT_WORKERS = int(os.getenv('CARE_PLAN_EXPORT_WORKERS', '1'))
+CARE_PLAN_EXPORT_TTL_SECONDS = int(os.getenv('CARE_PLAN_EXPORT_TTL_SECONDS', '86400'))
+CARE_PLAN_EXPORT_CACHE_SIZE = int(os.getenv('CARE_PLAN_EXPORT_CACHE_SIZE', '16'))
+CARE_PLAN_EXPORT_CACHE_MAX_BYTES = int(os.getenv('CARE_PLAN_EXPORT_CACHE_MAX_BYTES', str(5 * 1024 * 1024)))
+CARE_PLAN_EXPORT_CACHE_TTL_SECONDS = int(os.getenv('CARE_PLAN_EXPORT_CACHE_TTL_SECONDS', '300'))
+CARE_PLAN_STATS_TOP_N = int(os.getenv('CARE_PLAN_STATS_TOP_N', '20'))
+CARE_PLAN_CACHE_ENABLED = os.getenv('CARE_PLAN_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CARE_PLAN_CACHE_TTL_SECONDS = int(os.getenv('CARE_PLAN_CACHE_TTL_SECONDS', '86400'))
+CARE_PLAN_CACHE_MEMORY_SIZE = int(os.getenv('CARE_PLAN_CACHE_MEMORY_SIZE', '128'))
+CARE_PLAN_CACHE_MAX_ENTRIES = int(os.getenv('CARE_PLAN_CACHE_MAX_ENTRIES', '5000'))
+CARE_PLAN_LOCK_DIR = Path(os.getenv('CARE_PLAN_LOCK_DIR', BASE_DIR / 'locks'))
+CARE_PLAN_LOCK_TIMEOUT_SECONDS = int(os.getenv('CARE_PLAN_LOCK_TIMEOUT_SECONDS', '300'))
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
 ]
@@ -0,0 +1,23 @@
+import tempfile
+from pathlib import Path
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class CarePlanTestRunner(DiscoverRunner):
+    """Runs the suite with per-process state files in a throwaway directory instead of backend/."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._state_dir = tempfile.TemporaryDirectory(prefix='care-plan-tests-')
+        state_dir = Path(self._state_dir.name)
+        self._state_override = override_settings(
+            CARE_PLAN_LOCK_DIR=state_dir / 'locks',
+            CARE_PLAN_RATE_LIMIT_DB=state_dir / 'rate_limit.sqlite3',
+        )
+        self._state_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._state_override.disable()
+        self._state_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
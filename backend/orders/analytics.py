@@ -0,0 +1,55 @@
+import logging
+from datetime import date
+from typing import Optional
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from .models import Order, OrderDailyRollup
+logger = logging.getLogger('orders')
+BUCKETS = {
+    'day': F('day'),
+    'week': TruncWeek('day'),
+    'month': TruncMonth('day'),
+}
+def rebuild_rollups(batch_size: int = 2000) -> int:
+    has_care_plan = Q(care_plan__isnull=False) & ~Q(care_plan='')
+    rows = (
+        Order.objects.order_by()
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'provider_id', 'primary_diagnosis')
+        .annotate(orders=Count('id'), care_plans=Count('id', filter=has_care_plan))
+    )
+    with transaction.atomic():
+        OrderDailyRollup.objects.all().delete()
+        rollups = OrderDailyRollup.objects.bulk_create(
+            [OrderDailyRollup(**row) for row in rows.iterator(chunk_size=batch_size)],
+            batch_size=batch_size
+        )
+    logger.info(f"Rebuilt {len(rollups)} order rollup row(s)")
+    return len(rollups)
+def order_timeseries(
+    start_day: Optional[date] = None,
+    end_day: Optional[date] = None,
+    provider_npi: Optional[str] = None,
+    diagnosis: Optional[str] = None,
+    bucket: str = 'day'
+) -> list[dict]:
+    queryset = OrderDailyRollup.objects.order_by()
+    if start_day:
+        queryset = queryset.filter(day__gte=start_day)
+    if end_day:
+        queryset = queryset.filter(day__lte=end_day)
+    if provider_npi:
+        queryset = queryset.filter(provider__npi=provider_npi)
+    if diagnosis:
+        queryset = queryset.filter(primary_diagnosis=diagnosis)
+    rows = (
+        queryset.annotate(period=BUCKETS[bucket])
+        .values('period')
+        .annotate(orders=Sum('orders'), care_plans=Sum('care_plans'))
+        .order_by('period')
+    )
+    return [
+        {"period": row['period'].isoformat(), "orders": row['orders'], "care_plans": row['care_plans']}
+        for row in rows
+    ]
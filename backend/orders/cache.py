@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional
+from django.conf import settings
+from django.utils import timezone
+from .models import CarePlanCacheEntry
+logger = logging.getLogger('orders')
+class LRUCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+    def set(self, key: str, value: str, ttl: float) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+    def __len__(self):
+        return len(self._data)
+class CarePlanCache:
+    def __init__(self):
+        self._memory = None
+    @property
+    def memory(self) -> LRUCache:
+        if self._memory is None:
+            self._memory = LRUCache(settings.CARE_PLAN_CACHE_MEMORY_SIZE)
+        return self._memory
+    @property
+    def enabled(self) -> bool:
+        return settings.CARE_PLAN_CACHE_ENABLED and settings.CARE_PLAN_CACHE_TTL_SECONDS > 0
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        care_plan = self.memory.get(key)
+        if care_plan is not None:
+            logger.debug(f"Care plan cache hit (memory) - key: {key[:12]}")
+            return care_plan
+        ttl = settings.CARE_PLAN_CACHE_TTL_SECONDS
+        now = timezone.now()
+        try:
+            entry = CarePlanCacheEntry.objects.get(key=key)
+        except CarePlanCacheEntry.DoesNotExist:
+            return None
+        if entry.created_at < now - timedelta(seconds=ttl):
+            logger.debug(f"Care plan cache entry expired - key: {key[:12]}")
+            entry.delete()
+            return None
+        CarePlanCacheEntry.objects.filter(key=key).update(last_accessed_at=now)
+        remaining = ttl - (now - entry.created_at).total_seconds()
+        self.memory.set(key, entry.care_plan, remaining)
+        logger.debug(f"Care plan cache hit (database) - key: {key[:12]}")
+        return entry.care_plan
+    def set(self, key: str, care_plan: str, model: str, prompt_version: str) -> None:
+        if not self.enabled:
+            return
+        ttl = settings.CARE_PLAN_CACHE_TTL_SECONDS
+        self.memory.set(key, care_plan, ttl)
+        CarePlanCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={
+                'care_plan': care_plan,
+                'model': model,
+                'prompt_version': prompt_version,
+                'created_at': timezone.now(),
+                'last_accessed_at': timezone.now(),
+            }
+        )
+        self.evict()
+    def evict(self) -> int:
+        cutoff = timezone.now() - timedelta(seconds=settings.CARE_PLAN_CACHE_TTL_SECONDS)
+        deleted, _ = CarePlanCacheEntry.objects.filter(created_at__lt=cutoff).delete()
+        max_entries = settings.CARE_PLAN_CACHE_MAX_ENTRIES
+        overflow = CarePlanCacheEntry.objects.count() - max_entries
+        if overflow > 0:
+            stale_keys = list(
+                CarePlanCacheEntry.objects.order_by('last_accessed_at').values_list('key', flat=True)[:overflow]
+            )
+            deleted += CarePlanCacheEntry.objects.filter(key__in=stale_keys).delete()[0]
+        if deleted:
+            logger.info(f"Evicted {deleted} care plan cache entries")
+        return deleted
+    def clear(self) -> None:
+        self.memory.clear()
+        CarePlanCacheEntry.objects.all().delete()
+care_plan_cache = CarePlanCache()
+class ExportRenderCache:
+    def __init__(self):
+        self._memory = None
+    @property
+    def memory(self) -> LRUCache:
+        if self._memory is None:
+            self._memory = LRUCache(settings.CARE_PLAN_EXPORT_CACHE_SIZE)
+        return self._memory
+    @property
+    def max_bytes(self) -> int:
+        return settings.CARE_PLAN_EXPORT_CACHE_MAX_BYTES
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is not None:
+            logger.debug(f"Export render cache hit - key: {key[:12]}")
+        return value
+    def set(self, key: str, value) -> None:
+        if isinstance(value, bytes) and len(value) > self.max_bytes:
+            return
+        self.memory.set(key, value, settings.CARE_PLAN_EXPORT_CACHE_TTL_SECONDS)
+    def clear(self) -> None:
+        self.memory.clear()
+export_render_cache = ExportRenderCache()
+
@@ -1,8 +1,13 @@
+from collections import defaultdict
 from dataclasses import dataclass
 from typing import List, Optional, Dict, Any
+from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 from .models import Patient, Provider, Order
+from .normalize import normalize_medication_name, normalize_provider_name, patient_blocking_keys
+from .presence import known_mrns, known_npis
+from .fuzzy import candidate_patient_ids, patient_ids_by_key, rank_candidate_ids, similar_patients
 
 @dataclass
 class DuplicateWarning:
@@ -21,153 +26,168 @@ class DuplicateWarning:
             result["existing_record"] = self.existing_record
         return result
 
+RECENT_ORDER_FIELDS = ['id', 'medication_name', 'primary_diagnosis', 'created_at']
+
+def medication_key(medication_name: str) -> str:
+    return normalize_medication_name(
+        medication_name,
+        ignore_case=settings.CARE_PLAN_MEDICATION_MATCH_IGNORE_CASE,
+        ignore_strength=settings.CARE_PLAN_MEDICATION_MATCH_IGNORE_STRENGTH
+    )
+
+def medication_match_is_exact() -> bool:
+    return not (settings.CARE_PLAN_MEDICATION_MATCH_IGNORE_CASE or settings.CARE_PLAN_MEDICATION_MATCH_IGNORE_STRENGTH)
+
+def duplicate_order_cutoff():
+    return timezone.now() - timedelta(hours=settings.CARE_PLAN_DUPLICATE_ORDER_WINDOW_HOURS)
+
 class DuplicateChecker:
     
     @staticmethod
-    def check_duplicate_patient(mrn: str, first_name: str, last_name: str) -> Optional[DuplicateWarning]:
-        try:
-            existing_patient = Patient.objects.get(mrn=mrn)
-            if (existing_patient.first_name.lower() != first_name.lower() or
-                existing_patient.last_name.lower() != last_name.lower()):
-                return DuplicateWarning(
-                    warning_type="duplicate_patient_name_mismatch",
-                    severity="error",
-                    message=f"Patient MRN {mrn} already exists with different name: {existing_patient.first_name} {existing_patient.last_name}",
-                    existing_record={
-                        "mrn": existing_patient.mrn,
-                        "first_name": existing_patient.first_name,
-                        "last_name": existing_patient.last_name,
-                        "created_at": existing_patient.created_at.isoformat()
-                    }
-                )
-            else:
-                return DuplicateWarning(
-                    warning_type="duplicate_patient",
-                    severity="warning",
-                    message=f"Patient MRN {mrn} already exists in system",
-                    existing_record={
-                        "mrn": existing_patient.mrn,
-                        "first_name": existing_patient.first_name,
-                        "last_name": existing_patient.last_name,
-                        "created_at": existing_patient.created_at.isoformat()
-                    }
-                )
-        except Patient.DoesNotExist:
+    def patient_warning(existing_patient: Optional[Patient], mrn: str, first_name: str, last_name: str) -> Optional[DuplicateWarning]:
+        if existing_patient is None:
             return None
+        existing_record = {
+            "mrn": existing_patient.mrn,
+            "first_name": existing_patient.first_name,
+            "last_name": existing_patient.last_name,
+            "created_at": existing_patient.created_at.isoformat()
+        }
+        if (existing_patient.first_name.lower() != first_name.lower() or
+            existing_patient.last_name.lower() != last_name.lower()):
+            return DuplicateWarning(
+                warning_type="duplicate_patient_name_mismatch",
+                severity="error",
+                message=f"Patient MRN {mrn} already exists with different name: {existing_patient.first_name} {existing_patient.last_name}",
+                existing_record=existing_record
+            )
+        return DuplicateWarning(
+            warning_type="duplicate_patient",
+            severity="warning",
+            message=f"Patient MRN {mrn} already exists in system",
+            existing_record=existing_record
+        )
     
     @staticmethod
-    def check_duplicate_provider(provider_name: str, npi: str) -> Optional[DuplicateWarning]:
-        try:
-            existing_provider_by_npi = Provider.objects.get(npi=npi)
-            if existing_provider_by_npi.name.lower() != provider_name.lower():
-                return DuplicateWarning(
-                    warning_type="duplicate_provider_npi_name_mismatch",
-                    severity="error",
-                    message=f"NPI {npi} already exists with provider name: '{existing_provider_by_npi.name}'. You are submitting a different name: '{provider_name}'. NPI has a one-to-one relationship with provider - this is a critical data integrity issue for pharma reporting.",
-                    existing_record={
-                        "npi": existing_provider_by_npi.npi,
-                        "name": existing_provider_by_npi.name,
-                        "created_at": existing_provider_by_npi.created_at.isoformat()
-                    }
-                )
-        except Provider.DoesNotExist:
-            pass
-        
-        try:
-            existing_provider_by_name = Provider.objects.get(name__iexact=provider_name)
-            if existing_provider_by_name.npi != npi:
-                return DuplicateWarning(
-                    warning_type="duplicate_provider_npi_mismatch",
-                    severity="error",
-                    message=f"Provider '{provider_name}' already exists with NPI: {existing_provider_by_name.npi}. You are submitting a different NPI: {npi}. Each provider must have exactly one NPI - this is a critical data integrity issue for pharma reporting.",
-                    existing_record={
-                        "npi": existing_provider_by_name.npi,
-                        "name": existing_provider_by_name.name,
-                        "created_at": existing_provider_by_name.created_at.isoformat()
-                    }
-                )
-        except Provider.DoesNotExist:
-            pass
-        
-        return None
+    def similar_patient_warning(mrn: str, first_name: str, last_name: str, candidates) -> Optional[DuplicateWarning]:
+        matches = similar_patients(mrn, first_name, last_name, candidates)
+        if not matches:
+            return None
+        best = matches[0]
+        others = f" and {len(matches) - 1} other patient(s)" if len(matches) > 1 else ""
+        return DuplicateWarning(
+            warning_type="possible_duplicate_patient",
+            severity="warning",
+            message=f"Possible same patient already registered under a different MRN: {best['first_name']} {best['last_name']} (MRN {best['mrn']}){others}",
+            existing_record={
+                "patients": matches,
+                "count": len(matches)
+            }
+        )
     
     @staticmethod
-    def check_duplicate_order(mrn: str, medication_name: str) -> Optional[DuplicateWarning]:
-        try:
-            patient = Patient.objects.get(mrn=mrn)
-            recent_orders = Order.objects.filter(
-                patient=patient,
-                medication_name=medication_name,
-                created_at__gte=timezone.now() - timedelta(days=1)
-            )
-            
-            if recent_orders.exists():
-                order_details = []
-                for order in recent_orders:
-                    order_details.append({
-                        "order_id": order.id,
-                        "medication_name": order.medication_name,
-                        "primary_diagnosis": order.primary_diagnosis,
-                        "created_at": order.created_at.isoformat()
-                    })
-                
-                order_ids = ', '.join(str(o.id) for o in recent_orders)
-                return DuplicateWarning(
-                    warning_type="potential_duplicate_order",
-                    severity="warning",
-                    message=f"Similar order found for this patient and medication within the last 24 hours. Order ID(s): {order_ids}",
-                    existing_record={
-                        "orders": order_details,
-                        "count": len(order_details)
-                    }
-                )
-        except Patient.DoesNotExist:
-            pass
-        
-        return None
+    def provider_npi_warning(existing_provider: Optional[Provider], provider_name: str, npi: str) -> Optional[DuplicateWarning]:
+        if existing_provider is None or existing_provider.name_normalized == normalize_provider_name(provider_name):
+            return None
+        return DuplicateWarning(
+            warning_type="duplicate_provider_npi_name_mismatch",
+            severity="error",
+            message=f"NPI {npi} already exists with provider name: '{existing_provider.name}'. You are submitting a different name: '{provider_name}'. NPI has a one-to-one relationship with provider - this is a critical data integrity issue for pharma reporting.",
+            existing_record={
+                "npi": existing_provider.npi,
+                "name": existing_provider.name,
+                "created_at": existing_provider.created_at.isoformat()
+            }
+        )
     
     @staticmethod
-    def validate_order(
-        patient_first_name: str,
-        patient_last_name: str,
-        patient_mrn: str,
-        provider_name: str,
-        provider_npi: str,
-        medication_name: str,
-        primary_diagnosis: str = None,
-        additional_diagnoses: list = None,
-        medication_history: list = None
-    ) -> Dict[str, Any]:
-        
-        warnings = []
-        errors = []
-        
-        patient_warning = DuplicateChecker.check_duplicate_patient(
-            patient_mrn, patient_first_name, patient_last_name
+    def provider_name_warning(existing_provider: Optional[Provider], provider_name: str, npi: str) -> Optional[DuplicateWarning]:
+        if existing_provider is None or existing_provider.npi == npi:
+            return None
+        return DuplicateWarning(
+            warning_type="duplicate_provider_npi_mismatch",
+            severity="error",
+            message=f"Provider '{provider_name}' already exists with NPI: {existing_provider.npi}. You are submitting a different NPI: {npi}. Each provider must have exactly one NPI - this is a critical data integrity issue for pharma reporting.",
+            existing_record={
+                "npi": existing_provider.npi,
+                "name": existing_provider.name,
+                "created_at": existing_provider.created_at.isoformat()
+            }
         )
-        if patient_warning:
-            if patient_warning.severity == "error":
-                errors.append(patient_warning.to_dict())
-            else:
-                warnings.append(patient_warning.to_dict())
-        
-        provider_warning = DuplicateChecker.check_duplicate_provider(
-            provider_name, provider_npi
+    
+    @staticmethod
+    def order_warning(recent_orders: List[Dict[str, Any]]) -> Optional[DuplicateWarning]:
+        if not recent_orders:
+            return None
+        order_details = [
+            {
+                "order_id": order['id'],
+                "medication_name": order['medication_name'],
+                "primary_diagnosis": order['primary_diagnosis'],
+                "created_at": order['created_at'].isoformat()
+            }
+            for order in recent_orders
+        ]
+        order_ids = ', '.join(str(order['order_id']) for order in order_details)
+        return DuplicateWarning(
+            warning_type="potential_duplicate_order",
+            severity="warning",
+            message=f"Similar order found for this patient and medication within the last {settings.CARE_PLAN_DUPLICATE_ORDER_WINDOW_HOURS:g} hours. Order ID(s): {order_ids}",
+            existing_record={
+                "orders": order_details,
+                "count": len(order_details)
+            }
         )
-        if provider_warning:
-            if provider_warning.severity == "error":
-                errors.append(provider_warning.to_dict())
-            else:
-                warnings.append(provider_warning.to_dict())
+    
+    @staticmethod
+    def check_duplicate_patient(mrn: str, first_name: str, last_name: str) -> Optional[DuplicateWarning]:
+        existing_patient = Patient.objects.filter(mrn=mrn).first()
+        return DuplicateChecker.patient_warning(existing_patient, mrn, first_name, last_name)
+    
+    @staticmethod
+    def check_similar_patient(mrn: str, first_name: str, last_name: str) -> Optional[DuplicateWarning]:
+        keys = patient_blocking_keys(first_name, last_name)
+        candidate_ids = candidate_patient_ids(keys, settings.CARE_PLAN_FUZZY_PATIENT_CANDIDATES)
+        candidates = Patient.objects.in_bulk(candidate_ids).values() if candidate_ids else []
+        return DuplicateChecker.similar_patient_warning(mrn, first_name, last_name, candidates)
+    
+    @staticmethod
+    def check_duplicate_provider(provider_name: str, npi: str, npi_known: bool = True) -> Optional[DuplicateWarning]:
+        if npi_known:
+            warning = DuplicateChecker.provider_npi_warning(Provider.objects.filter(npi=npi).first(), provider_name, npi)
+            if warning:
+                return warning
         
-        order_warning = DuplicateChecker.check_duplicate_order(
-            patient_mrn, medication_name
+        existing_provider_by_name = Provider.objects.filter(
+            name_normalized=normalize_provider_name(provider_name)
+        ).exclude(npi=npi).order_by('id').first()
+        return DuplicateChecker.provider_name_warning(existing_provider_by_name, provider_name, npi)
+    
+    @staticmethod
+    def check_duplicate_order(mrn: str, medication_name: str) -> Optional[DuplicateWarning]:
+        recent_orders = Order.objects.filter(
+            patient__mrn=mrn,
+            created_at__gte=duplicate_order_cutoff()
         )
-        if order_warning:
-            if order_warning.severity == "error":
-                errors.append(order_warning.to_dict())
-            else:
-                warnings.append(order_warning.to_dict())
+        if medication_match_is_exact():
+            return DuplicateChecker.order_warning(list(
+                recent_orders.filter(medication_name=medication_name).values(*RECENT_ORDER_FIELDS)
+            ))
+        key = medication_key(medication_name)
+        return DuplicateChecker.order_warning([
+            order for order in recent_orders.values(*RECENT_ORDER_FIELDS) if medication_key(order['medication_name']) == key
+        ])
+    
+    @staticmethod
+    def build_result(found: List[Optional[DuplicateWarning]]) -> Dict[str, Any]:
+        warnings = []
+        errors = []
+        for warning in found:
+            if warning:
+                if warning.severity == "error":
+                    errors.append(warning.to_dict())
+                else:
+                    warnings.append(warning.to_dict())
         
         valid = len(errors) == 0
         
@@ -183,3 +203,65 @@ class DuplicateChecker:
             "errors": errors,
             "message": message
         }
+    
+    @staticmethod
+    def validate_order(
+        patient_first_name: str,
+        patient_last_name: str,
+        patient_mrn: str,
+        provider_name: str,
+        provider_npi: str,
+        medication_name: str,
+        primary_diagnosis: str = None,
+        additional_diagnoses: list = None,
+        medication_history: list = None
+    ) -> Dict[str, Any]:
+        
+        patient_known = known_mrns.might_exist(patient_mrn)
+        return DuplicateChecker.build_result([
+            DuplicateChecker.check_duplicate_patient(patient_mrn, patient_first_name, patient_last_name) if patient_known else None,
+            DuplicateChecker.check_similar_patient(patient_mrn, patient_first_name, patient_last_name),
+            DuplicateChecker.check_duplicate_provider(provider_name, provider_npi, known_npis.might_exist(provider_npi)),
+            DuplicateChecker.check_duplicate_order(patient_mrn, medication_name) if patient_known else None,
+        ])
+    
+    @staticmethod
+    def validate_orders(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        mrns = known_mrns.existing(item['patient_mrn'] for item in items)
+        npis = known_npis.existing(item['provider_npi'] for item in items)
+        names = {normalize_provider_name(item['provider_name']) for item in items}
+        blocking_keys = [patient_blocking_keys(item['patient_first_name'], item['patient_last_name']) for item in items]
+        limit = settings.CARE_PLAN_FUZZY_PATIENT_CANDIDATES
+        
+        patients = Patient.objects.in_bulk(list(mrns), field_name='mrn')
+        providers_by_npi = Provider.objects.in_bulk(list(npis), field_name='npi')
+        providers_by_name = defaultdict(list)
+        for provider in Provider.objects.filter(name_normalized__in=names).order_by('id'):
+            providers_by_name[provider.name_normalized].append(provider)
+        recent_orders = defaultdict(list)
+        orders = Order.objects.filter(
+            patient__mrn__in=mrns,
+            created_at__gte=duplicate_order_cutoff()
+        )
+        if medication_match_is_exact():
+            orders = orders.filter(medication_name__in={item['medication_name'] for item in items})
+        for order in orders.values('patient__mrn', *RECENT_ORDER_FIELDS):
+            recent_orders[(order['patient__mrn'], medication_key(order['medication_name']))].append(order)
+        ids_by_key = patient_ids_by_key(set().union(*blocking_keys))
+        candidate_ids = [rank_candidate_ids(keys, ids_by_key, limit) for keys in blocking_keys]
+        candidates = Patient.objects.in_bulk({patient_id for ids in candidate_ids for patient_id in ids}) if ids_by_key else {}
+        
+        results = []
+        for item, ids in zip(items, candidate_ids):
+            mrn, npi, provider_name = item['patient_mrn'], item['provider_npi'], item['provider_name']
+            provider_warning = DuplicateChecker.provider_npi_warning(providers_by_npi.get(npi), provider_name, npi)
+            if provider_warning is None:
+                mismatched = [p for p in providers_by_name[normalize_provider_name(provider_name)] if p.npi != npi]
+                provider_warning = DuplicateChecker.provider_name_warning(mismatched[0] if mismatched else None, provider_name, npi)
+            results.append(DuplicateChecker.build_result([
+                DuplicateChecker.patient_warning(patients.get(mrn), mrn, item['patient_first_name'], item['patient_last_name']),
+                DuplicateChecker.similar_patient_warning(mrn, item['patient_first_name'], item['patient_last_name'], [candidates[i] for i in ids]),
+                provider_warning,
+                DuplicateChecker.order_warning(recent_orders[(mrn, medication_key(item['medication_name']))]),
+            ]))
+        return results
@@ -1,22 +1,68 @@
+import base64
 import csv
-import io
+import hashlib
+import json
 import logging
+import pickle
+import tempfile
 from datetime import datetime
-from typing import Optional, List
+from typing import BinaryIO, Iterable, Iterator, Optional, List, Tuple
+from django.conf import settings
 from django.utils import timezone
-from django.db.models import Q
-from .models import Order, Patient, Provider
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Length
+from .models import DeletionWatermark, Order, Patient, Provider
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.utils import get_column_letter
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
 
 logger = logging.getLogger('orders')
+EXCEL_SPOOL_MEMORY_BYTES = 8 * 1024 * 1024
+CARE_PLAN_EXPORT_FIELDS = [
+    'id', 'primary_diagnosis', 'medication_name', 'care_plan', 'created_at',
+    'patient__first_name', 'patient__last_name', 'patient__mrn',
+    'provider__name', 'provider__npi',
+]
 
-def get_orders_for_export(
+EXPORT_HEADERS = [
+    'Order ID',
+    'Order Date',
+    'Patient MRN',
+    'Patient First Name',
+    'Patient Last Name',
+    'Provider Name',
+    'Provider NPI',
+    'Primary Diagnosis (ICD-10)',
+    'Additional Diagnoses (ICD-10)',
+    'Medication Name',
+    'Medication History',
+    'Care Plan Generated',
+    'Care Plan Generated At',
+    'Care Plan Length'
+]
+
+def filter_by_diagnosis(queryset, diagnosis: Optional[str]):
+    if not diagnosis:
+        return queryset
+    return queryset.filter(diagnoses__icd10_code=diagnosis)
+
+def get_export_queryset(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     provider_npi: Optional[str] = None,
     diagnosis: Optional[str] = None
-) -> List[Order]:
+):
     queryset = Order.objects.select_related('patient', 'provider').all()
     
     if start_date:
@@ -28,12 +74,18 @@ def get_orders_for_export(
     if provider_npi:
         queryset = queryset.filter(provider__npi=provider_npi)
     
-    queryset = queryset.order_by('-created_at')
+    queryset = filter_by_diagnosis(queryset, diagnosis)
     
-    orders = list(queryset)
+    return queryset.order_by('-created_at')
+
+def get_orders_for_export(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    provider_npi: Optional[str] = None,
+    diagnosis: Optional[str] = None
+) -> List[Order]:
+    orders = list(get_export_queryset(start_date, end_date, provider_npi, diagnosis))
     
-    if diagnosis:
-        orders = [o for o in orders if o.primary_diagnosis == diagnosis or diagnosis in (o.additional_diagnoses or [])]
     logger.info(f"Export query returned {len(orders)} orders")
     if start_date or end_date:
         logger.info(f"Date filter - start: {start_date}, end: {end_date}")
@@ -44,63 +96,346 @@ def get_orders_for_export(
     
     return orders
 
+def export_watermark(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    provider_npi: Optional[str] = None,
+    diagnosis: Optional[str] = None
+) -> dict:
+    marks = get_export_queryset(start_date, end_date, provider_npi, diagnosis).order_by().aggregate(
+        count=Count('id'),
+        last_updated=Max('updated_at')
+    )
+    # Deleted rows leave no updated_at behind, so fold in the last delete time;
+    # otherwise an If-Modified-Since client would get a 304 for a shrunken export.
+    marks['last_deleted'] = DeletionWatermark.last_deleted(Order._meta.db_table)
+    timestamps = [marks[key] for key in ('last_updated', 'last_deleted') if marks[key]]
+    return {
+        "count": marks['count'],
+        "last_modified": max(timestamps) if timestamps else None,
+        "marks": [marks['count']] + [marks[key].isoformat() if marks[key] else None for key in ('last_updated', 'last_deleted')],
+    }
+
+def export_cache_key(kind: str, filters: dict, watermark: dict) -> str:
+    payload = {
+        "kind": kind,
+        "filters": {key: value.isoformat() if isinstance(value, datetime) else value for key, value in filters.items()},
+        "watermark": watermark['marks'],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def get_export_stats(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    provider_npi: Optional[str] = None,
+    diagnosis: Optional[str] = None,
+    top: int = 20
+) -> dict:
+    queryset = get_export_queryset(start_date, end_date, provider_npi, diagnosis).order_by()
+    has_care_plan = Q(care_plan__isnull=False) & ~Q(care_plan='')
+    
+    totals = queryset.aggregate(
+        total_orders=Count('id'),
+        care_plans_generated=Count('id', filter=has_care_plan),
+        provider_count=Count('provider', distinct=True),
+        diagnosis_count=Count('primary_diagnosis', distinct=True)
+    )
+    
+    top_providers = list(
+        queryset.values('provider__npi', 'provider__name')
+        .annotate(orders=Count('id'), care_plans=Count('id', filter=has_care_plan))
+        .order_by('-orders', 'provider__name')[:top]
+    )
+    top_diagnoses = list(
+        queryset.values('primary_diagnosis')
+        .annotate(orders=Count('id'), care_plans=Count('id', filter=has_care_plan))
+        .order_by('-orders', 'primary_diagnosis')[:top]
+    )
+    
+    logger.info(f"Export stats aggregated - total_orders: {totals['total_orders']}, providers: {totals['provider_count']}, diagnoses: {totals['diagnosis_count']}")
+    
+    return {
+        **totals,
+        "providers": [row['provider__name'] for row in top_providers],
+        "diagnoses": [row['primary_diagnosis'] for row in top_diagnoses],
+        "top_providers": [
+            {"npi": row['provider__npi'], "name": row['provider__name'], "orders": row['orders'], "care_plans": row['care_plans']}
+            for row in top_providers
+        ],
+        "top_diagnoses": [
+            {"icd10_code": row['primary_diagnosis'], "orders": row['orders'], "care_plans": row['care_plans']}
+            for row in top_diagnoses
+        ]
+    }
+
+def iter_orders_for_export(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    provider_npi: Optional[str] = None,
+    diagnosis: Optional[str] = None,
+    chunk_size: Optional[int] = None
+) -> Iterator[Order]:
+    queryset = get_export_queryset(start_date, end_date, provider_npi, diagnosis)
+    yield from queryset.iterator(chunk_size=chunk_size or settings.CARE_PLAN_EXPORT_CHUNK_SIZE)
+
+def order_export_row(order: Order) -> list:
+    additional_diagnoses_str = ', '.join(order.additional_diagnoses) if order.additional_diagnoses else ''
+    medication_history_str = ', '.join(order.medication_history) if order.medication_history else ''
+    care_plan_generated = 'Yes' if order.care_plan else 'No'
+    care_plan_generated_at = order.care_plan_generated_at.strftime('%Y-%m-%d %H:%M:%S') if order.care_plan_generated_at else ''
+    care_plan_length = len(order.care_plan) if order.care_plan else 0
+    
+    return [
+        order.id,
+        order.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        order.patient.mrn,
+        order.patient.first_name,
+        order.patient.last_name,
+        order.provider.name,
+        order.provider.npi,
+        order.primary_diagnosis,
+        additional_diagnoses_str,
+        order.medication_name,
+        medication_history_str,
+        care_plan_generated,
+        care_plan_generated_at,
+        care_plan_length
+    ]
+
+def care_plan_export_queryset(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    provider_npi: Optional[str] = None,
+    diagnosis: Optional[str] = None
+):
+    return get_export_queryset(start_date, end_date, provider_npi, diagnosis).filter(
+        care_plan__isnull=False
+    ).exclude(care_plan='').only(*CARE_PLAN_EXPORT_FIELDS)
+
+def care_plan_export_record(order: Order) -> dict:
+    return {
+        "order_id": order.id,
+        "patient": {
+            "name": f"{order.patient.first_name} {order.patient.last_name}",
+            "mrn": order.patient.mrn,
+        },
+        "provider": {
+            "name": order.provider.name,
+            "npi": order.provider.npi,
+        },
+        "primary_diagnosis": order.primary_diagnosis,
+        "medication": order.medication_name,
+        "care_plan": order.care_plan,
+        "created_at": order.created_at.isoformat(),
+    }
+
+def _dumps_line(record: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n').encode()
+
+def stream_care_plans_ndjson(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    provider_npi: Optional[str] = None,
+    diagnosis: Optional[str] = None,
+    after_order_id: Optional[int] = None,
+    chunk_size: Optional[int] = None
+) -> Iterator[bytes]:
+    queryset = care_plan_export_queryset(start_date, end_date, provider_npi, diagnosis).order_by('id')
+    if after_order_id is not None:
+        queryset = queryset.filter(id__gt=after_order_id)
+    
+    count = 0
+    for order in queryset.iterator(chunk_size=chunk_size or settings.CARE_PLAN_EXPORT_CHUNK_SIZE):
+        count += 1
+        yield _dumps_line(care_plan_export_record(order))
+    
+    logger.info(f"NDJSON care plan export streamed with {count} orders (after order_id: {after_order_id})")
+
+def encode_change_cursor(position: Tuple[datetime, int]) -> str:
+    updated_at, order_id = position
+    payload = json.dumps({"u": updated_at.isoformat(), "i": order_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_change_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        updated_at = datetime.fromisoformat(payload['u'])
+        order_id = int(payload['i'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+    if updated_at.tzinfo is None:
+        updated_at = timezone.make_aware(updated_at)
+    return updated_at, order_id
+
+def latest_change_position() -> Optional[Tuple[datetime, int]]:
+    return Order.objects.order_by('-updated_at', '-id').values_list('updated_at', 'id').first()
+
+def changed_orders_queryset(since: Optional[Tuple[datetime, int]], until: Tuple[datetime, int]):
+    queryset = Order.objects.select_related('patient', 'provider').order_by('updated_at', 'id')
+    if since:
+        queryset = queryset.filter(Q(updated_at__gt=since[0]) | Q(updated_at=since[0], id__gt=since[1]))
+    return queryset.filter(Q(updated_at__lt=until[0]) | Q(updated_at=until[0], id__lte=until[1]))
+
+def order_change_record(order: Order) -> dict:
+    return {
+        "order_id": order.id,
+        "created_at": order.created_at.isoformat(),
+        "updated_at": order.updated_at.isoformat(),
+        "patient": {
+            "mrn": order.patient.mrn,
+            "first_name": order.patient.first_name,
+            "last_name": order.patient.last_name,
+        },
+        "provider": {
+            "name": order.provider.name,
+            "npi": order.provider.npi,
+        },
+        "primary_diagnosis": order.primary_diagnosis,
+        "additional_diagnoses": order.additional_diagnoses or [],
+        "medication_name": order.medication_name,
+        "medication_history": order.medication_history or [],
+        "care_plan": order.care_plan,
+        "care_plan_generated_at": order.care_plan_generated_at.isoformat() if order.care_plan_generated_at else None,
+    }
+
+def stream_changes(
+    format: str,
+    since: Optional[Tuple[datetime, int]],
+    until: Optional[Tuple[datetime, int]],
+    chunk_size: Optional[int] = None
+) -> Iterator:
+    writer = csv.writer(_Echo())
+    if format == 'csv':
+        yield writer.writerow(EXPORT_HEADERS + ['Last Modified'])
+    if until is None:
+        return
+    
+    count = 0
+    for order in changed_orders_queryset(since, until).iterator(chunk_size=chunk_size or settings.CARE_PLAN_EXPORT_CHUNK_SIZE):
+        count += 1
+        if format == 'csv':
+            yield writer.writerow(order_export_row(order) + [order.updated_at.strftime('%Y-%m-%d %H:%M:%S')])
+        else:
+            yield _dumps_line(order_change_record(order))
+    
+    logger.info(f"Change export streamed {count} orders ({format})")
+
+class _Echo:
+    def write(self, value):
+        return value
+
+def stream_csv(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    provider_npi: Optional[str] = None,
+    diagnosis: Optional[str] = None,
+    chunk_size: Optional[int] = None
+) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_HEADERS)
+    
+    count = 0
+    for order in iter_orders_for_export(start_date, end_date, provider_npi, diagnosis, chunk_size):
+        count += 1
+        yield writer.writerow(order_export_row(order))
+    
+    logger.info(f"CSV export streamed with {count} orders")
+
 def export_to_csv(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     provider_npi: Optional[str] = None,
     diagnosis: Optional[str] = None
 ) -> str:
-    orders = get_orders_for_export(start_date, end_date, provider_npi, diagnosis)
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    writer.writerow([
-        'Order ID',
-        'Order Date',
-        'Patient MRN',
-        'Patient First Name',
-        'Patient Last Name',
-        'Provider Name',
-        'Provider NPI',
-        'Primary Diagnosis (ICD-10)',
-        'Additional Diagnoses (ICD-10)',
-        'Medication Name',
-        'Medication History',
-        'Care Plan Generated',
-        'Care Plan Generated At',
-        'Care Plan Length'
-    ])
-    
+    return ''.join(stream_csv(start_date, end_date, provider_npi, diagnosis))
+
+def _spool_rows(orders: Iterable[Order], spool, widths: List[int]) -> Tuple[int, int]:
+    total = 0
+    care_plans_count = 0
     for order in orders:
-        additional_diagnoses_str = ', '.join(order.additional_diagnoses) if order.additional_diagnoses else ''
-        medication_history_str = ', '.join(order.medication_history) if order.medication_history else ''
-        care_plan_generated = 'Yes' if order.care_plan else 'No'
-        care_plan_generated_at = order.care_plan_generated_at.strftime('%Y-%m-%d %H:%M:%S') if order.care_plan_generated_at else ''
-        care_plan_length = len(order.care_plan) if order.care_plan else 0
+        row = order_export_row(order)
+        for col_idx, value in enumerate(row):
+            widths[col_idx] = max(widths[col_idx], len(str(value)) if value else 0)
+        pickle.dump(row, spool, protocol=pickle.HIGHEST_PROTOCOL)
+        total += 1
+        if order.care_plan:
+            care_plans_count += 1
+    return total, care_plans_count
+
+def _replay_rows(spool) -> Iterator[list]:
+    spool.seek(0)
+    while True:
+        try:
+            yield pickle.load(spool)
+        except EOFError:
+            return
+
+def write_excel(
+    output: BinaryIO,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    provider_npi: Optional[str] = None,
+    diagnosis: Optional[str] = None,
+    chunk_size: Optional[int] = None
+) -> int:
+    widths = [len(header) for header in EXPORT_HEADERS]
+    
+    with tempfile.SpooledTemporaryFile(max_size=EXCEL_SPOOL_MEMORY_BYTES) as spool:
+        orders = iter_orders_for_export(start_date, end_date, provider_npi, diagnosis, chunk_size)
+        total, care_plans_count = _spool_rows(orders, spool, widths)
+        
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Care Plans Export")
+        
+        for col_idx, width in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(col_idx)].width = min(width + 2, 50)
         
-        writer.writerow([
-            order.id,
-            order.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            order.patient.mrn,
-            order.patient.first_name,
-            order.patient.last_name,
-            order.provider.name,
-            order.provider.npi,
-            order.primary_diagnosis,
-            additional_diagnoses_str,
-            order.medication_name,
-            medication_history_str,
-            care_plan_generated,
-            care_plan_generated_at,
-            care_plan_length
-        ])
-    
-    csv_content = output.getvalue()
-    output.close()
-    
-    logger.info(f"CSV export generated with {len(orders)} orders")
-    return csv_content
+        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        header_font = Font(bold=True, color="FFFFFF")
+        header_alignment = Alignment(horizontal="center", vertical="center")
+        
+        header_row = []
+        for header in EXPORT_HEADERS:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.fill = header_fill
+            cell.font = header_font
+            cell.alignment = header_alignment
+            header_row.append(cell)
+        ws.append(header_row)
+        
+        for row in _replay_rows(spool):
+            ws.append(row)
+        
+        summary_font = Font(bold=True)
+        ws.append([])
+        total_label = WriteOnlyCell(ws, value="Total Orders:")
+        total_label.font = summary_font
+        ws.append([total_label, total])
+        generated_label = WriteOnlyCell(ws, value="Care Plans Generated:")
+        generated_label.font = summary_font
+        ws.append([generated_label, care_plans_count])
+        
+        wb.save(output)
+    
+    logger.info(f"Excel export generated with {total} orders")
+    return total
+
+def export_to_excel_file(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    provider_npi: Optional[str] = None,
+    diagnosis: Optional[str] = None
+) -> BinaryIO:
+    output = tempfile.TemporaryFile()
+    try:
+        write_excel(output, start_date, end_date, provider_npi, diagnosis)
+    except Exception:
+        output.close()
+        raise
+    output.seek(0)
+    return output
 
 def export_to_excel(
     start_date: Optional[datetime] = None,
@@ -108,85 +443,140 @@ def export_to_excel(
     provider_npi: Optional[str] = None,
     diagnosis: Optional[str] = None
 ) -> bytes:
-    orders = get_orders_for_export(start_date, end_date, provider_npi, diagnosis)
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Care Plans Export"
-    
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    
-    headers = [
-        'Order ID',
-        'Order Date',
-        'Patient MRN',
-        'Patient First Name',
-        'Patient Last Name',
-        'Provider Name',
-        'Provider NPI',
-        'Primary Diagnosis (ICD-10)',
-        'Additional Diagnoses (ICD-10)',
-        'Medication Name',
-        'Medication History',
-        'Care Plan Generated',
-        'Care Plan Generated At',
-        'Care Plan Length'
-    ]
+    with export_to_excel_file(start_date, end_date, provider_npi, diagnosis) as output:
+        return output.read()
+
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+COLUMNAR_EXPORT_FIELDS = [
+    'id', 'created_at', 'patient__mrn', 'patient__first_name', 'patient__last_name',
+    'provider__name', 'provider__npi', 'primary_diagnosis', 'additional_diagnoses',
+    'medication_name', 'medication_history', 'care_plan_generated_at', 'care_plan_length',
+]
+
+def columnar_export_available() -> bool:
+    return pa is not None
+
+def order_arrow_schema():
+    timestamp = pa.timestamp('us', tz='UTC')
+    category = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('order_id', pa.int64()),
+        ('created_at', timestamp),
+        ('patient_mrn', pa.string()),
+        ('patient_first_name', pa.string()),
+        ('patient_last_name', pa.string()),
+        ('provider_name', category),
+        ('provider_npi', category),
+        ('primary_diagnosis', category),
+        ('additional_diagnoses', pa.list_(pa.string())),
+        ('medication_name', category),
+        ('medication_history', pa.list_(pa.string())),
+        ('care_plan_generated', pa.bool_()),
+        ('care_plan_generated_at', timestamp),
+        ('care_plan_length', pa.int64()),
+    ])
+
+def iter_order_record_batches(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    provider_npi: Optional[str] = None,
+    diagnosis: Optional[str] = None,
+    chunk_size: Optional[int] = None
+) -> Iterator:
+    schema = order_arrow_schema()
+    chunk_size = chunk_size or settings.CARE_PLAN_EXPORT_CHUNK_SIZE
+    queryset = get_export_queryset(start_date, end_date, provider_npi, diagnosis).annotate(
+        care_plan_length=Length('care_plan')
+    ).values_list(*COLUMNAR_EXPORT_FIELDS)
     
-    for col_idx, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_idx, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_alignment
-    
-    for row_idx, order in enumerate(orders, 2):
-        additional_diagnoses_str = ', '.join(order.additional_diagnoses) if order.additional_diagnoses else ''
-        medication_history_str = ', '.join(order.medication_history) if order.medication_history else ''
-        care_plan_generated = 'Yes' if order.care_plan else 'No'
-        care_plan_generated_at = order.care_plan_generated_at.strftime('%Y-%m-%d %H:%M:%S') if order.care_plan_generated_at else ''
-        care_plan_length = len(order.care_plan) if order.care_plan else 0
-        
-        ws.cell(row=row_idx, column=1, value=order.id)
-        ws.cell(row=row_idx, column=2, value=order.created_at.strftime('%Y-%m-%d %H:%M:%S'))
-        ws.cell(row=row_idx, column=3, value=order.patient.mrn)
-        ws.cell(row=row_idx, column=4, value=order.patient.first_name)
-        ws.cell(row=row_idx, column=5, value=order.patient.last_name)
-        ws.cell(row=row_idx, column=6, value=order.provider.name)
-        ws.cell(row=row_idx, column=7, value=order.provider.npi)
-        ws.cell(row=row_idx, column=8, value=order.primary_diagnosis)
-        ws.cell(row=row_idx, column=9, value=additional_diagnoses_str)
-        ws.cell(row=row_idx, column=10, value=order.medication_name)
-        ws.cell(row=row_idx, column=11, value=medication_history_str)
-        ws.cell(row=row_idx, column=12, value=care_plan_generated)
-        ws.cell(row=row_idx, column=13, value=care_plan_generated_at)
-        ws.cell(row=row_idx, column=14, value=care_plan_length)
-    
-    summary_row = len(orders) + 3
-    care_plans_count = sum(1 for order in orders if order.care_plan)
-    
-    ws.cell(row=summary_row, column=1, value="Total Orders:").font = Font(bold=True)
-    ws.cell(row=summary_row, column=2, value=len(orders))
-    
-    ws.cell(row=summary_row + 1, column=1, value="Care Plans Generated:").font = Font(bold=True)
-    ws.cell(row=summary_row + 1, column=2, value=care_plans_count)
-    
-    for col in range(1, len(headers) + 1):
-        column_letter = ws.cell(row=1, column=col).column_letter
-        max_length = 0
-        for row in ws.iter_rows(min_row=1, max_row=len(orders) + 1, min_col=col, max_col=col):
-            cell_value = str(row[0].value) if row[0].value else ''
-            max_length = max(max_length, len(cell_value))
-        ws.column_dimensions[column_letter].width = min(max_length + 2, 50)
-    
-    output = io.BytesIO()
-    wb.save(output)
-    excel_content = output.getvalue()
-    output.close()
-    
-    logger.info(f"Excel export generated with {len(orders)} orders")
-    return excel_content
+    rows = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            yield _order_record_batch(rows, schema)
+            rows = []
+    if rows:
+        yield _order_record_batch(rows, schema)
+
+def _order_record_batch(rows: List[tuple], schema):
+    columns = list(zip(*rows))
+    columns[8] = [list(value or []) for value in columns[8]]
+    columns[10] = [list(value or []) for value in columns[10]]
+    lengths = [length or 0 for length in columns[12]]
+    values = columns[:11] + [[length > 0 for length in lengths], columns[11], lengths]
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(values, schema)],
+        schema=schema
+    )
+
+def write_columnar(
+    output: BinaryIO,
+    format: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    provider_npi: Optional[str] = None,
+    diagnosis: Optional[str] = None,
+    chunk_size: Optional[int] = None
+) -> int:
+    if pa is None:
+        raise RuntimeError("Parquet and Arrow exports require pyarrow")
+    schema = order_arrow_schema()
+    if format == 'parquet':
+        writer = pq.ParquetWriter(output, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(output, schema)
+    
+    total = 0
+    with writer:
+        for batch in iter_order_record_batches(start_date, end_date, provider_npi, diagnosis, chunk_size):
+            writer.write_batch(batch)
+            total += batch.num_rows
+    
+    logger.info(f"{format.capitalize()} export generated with {total} orders")
+    return total
+
+def export_to_columnar_file(
+    format: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    provider_npi: Optional[str] = None,
+    diagnosis: Optional[str] = None
+) -> BinaryIO:
+    output = tempfile.TemporaryFile()
+    try:
+        write_columnar(output, format, start_date, end_date, provider_npi, diagnosis)
+    except Exception:
+        output.close()
+        raise
+    output.seek(0)
+    return output
+
+def render_export_file(
+    path,
+    format: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    provider_npi: Optional[str] = None,
+    diagnosis: Optional[str] = None
+) -> int:
+    if format == 'csv':
+        rows = -1
+        with open(path, 'w', newline='', encoding='utf-8') as output:
+            for line in stream_csv(start_date, end_date, provider_npi, diagnosis):
+                output.write(line)
+                rows += 1
+        return rows
+    with open(path, 'wb') as output:
+        if format in COLUMNAR_FORMATS:
+            return write_columnar(output, format, start_date, end_date, provider_npi, diagnosis)
+        return write_excel(output, start_date, end_date, provider_npi, diagnosis)
+
+def file_checksum(path, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 def get_export_filename(
     format: str,
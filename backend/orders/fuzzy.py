@@ -0,0 +1,62 @@
+import logging
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from .models import Patient, PatientBlockingKey
+from .normalize import name_similarity
+logger = logging.getLogger('orders')
+def rebuild_blocking_keys(batch_size: int = 2000) -> int:
+    count = 0
+    batch = []
+    with transaction.atomic():
+        PatientBlockingKey.objects.all().delete()
+        for patient in Patient.objects.only('id', 'first_name', 'last_name').iterator(chunk_size=batch_size):
+            batch.extend(PatientBlockingKey.rows_for(patient))
+            if len(batch) >= batch_size:
+                PatientBlockingKey.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            PatientBlockingKey.objects.bulk_create(batch)
+            count += len(batch)
+    logger.info(f"Rebuilt {count} patient blocking key(s)")
+    return count
+def candidate_patient_ids(keys, limit: int) -> list:
+    if not keys:
+        return []
+    return list(
+        PatientBlockingKey.objects.filter(key__in=keys)
+        .values('patient_id')
+        .annotate(shared=Count('id'))
+        .order_by('-shared', 'patient_id')
+        .values_list('patient_id', flat=True)[:limit]
+    )
+def patient_ids_by_key(keys) -> dict:
+    ids_by_key = defaultdict(list)
+    if keys:
+        for key, patient_id in PatientBlockingKey.objects.filter(key__in=keys).values_list('key', 'patient_id'):
+            ids_by_key[key].append(patient_id)
+    return ids_by_key
+def rank_candidate_ids(keys, ids_by_key: dict, limit: int) -> list:
+    shared = Counter()
+    for key in keys:
+        shared.update(ids_by_key.get(key, ()))
+    return [patient_id for patient_id, _ in sorted(shared.items(), key=lambda item: (-item[1], item[0]))[:limit]]
+def similar_patients(mrn: str, first_name: str, last_name: str, candidates) -> list:
+    threshold = settings.CARE_PLAN_FUZZY_PATIENT_THRESHOLD
+    matches = []
+    for patient in candidates:
+        if patient.mrn == mrn:
+            continue
+        score = name_similarity(first_name, last_name, patient.first_name, patient.last_name)
+        if score >= threshold:
+            matches.append({
+                "mrn": patient.mrn,
+                "first_name": patient.first_name,
+                "last_name": patient.last_name,
+                "similarity": round(score, 3),
+                "created_at": patient.created_at.isoformat()
+            })
+    matches.sort(key=lambda match: (-match['similarity'], match['mrn']))
+    return matches
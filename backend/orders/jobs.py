@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import CarePlanJob, ExportJob, Order
+from .export import file_checksum, render_export_file
+from .services import generate_for_order
+logger = logging.getLogger('orders')
+_executors = {}
+_executor_lock = threading.Lock()
+def get_executor(name: str = 'care-plan-job', workers: int = None):
+    executor = _executors.get(name)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                workers = workers or settings.CARE_PLAN_JOB_WORKERS
+                logger.info(f"Starting {name} pool with {workers} worker(s)")
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+                _executors[name] = executor
+    return executor
+def run_care_plan_job(job_id) -> None:
+    try:
+        job = CarePlanJob.objects.select_related('order__patient').get(id=job_id)
+        job.status = CarePlanJob.STATUS_RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+        order = job.order
+        if order is None:
+            logger.error(f"Care plan job {job_id} has no order, it was deleted before the job ran")
+            job.status = CarePlanJob.STATUS_FAILED
+            job.error = "Order was deleted before its care plan was generated"
+        else:
+            try:
+                generate_for_order(order)
+                job.status = CarePlanJob.STATUS_SUCCEEDED
+            except Exception as e:
+                logger.error(f"Care plan job {job_id} failed for order ID: {order.id}, error: {str(e)}")
+                logger.error(f"Traceback: {traceback.format_exc()}")
+                Order.objects.filter(id=order.id).delete()
+                logger.info(f"Order {order.id} deleted due to care plan generation failure")
+                job.order = None
+                job.status = CarePlanJob.STATUS_FAILED
+                job.error = f"Failed to generate care plan: {str(e)}"
+        job.finished_at = timezone.now()
+        job.save(update_fields=['order', 'status', 'error', 'finished_at'])
+        logger.info(f"Care plan job {job_id} finished with status: {job.status}")
+    except CarePlanJob.DoesNotExist:
+        logger.error(f"Care plan job {job_id} not found")
+def _run_pooled_job(job_id, run=run_care_plan_job) -> None:
+    close_old_connections()
+    try:
+        run(job_id)
+    finally:
+        close_old_connections()
+def recover_stale_care_plan_jobs(**filters) -> int:
+    # Jobs only live in this process's executor, so a restart strands any that
+    # were queued or running. Settle them instead of leaving them pending forever.
+    cutoff = timezone.now() - timedelta(seconds=settings.CARE_PLAN_JOB_STALE_SECONDS)
+    stale = CarePlanJob.objects.select_related('order').filter(
+        Q(status=CarePlanJob.STATUS_PENDING, created_at__lt=cutoff) | Q(status=CarePlanJob.STATUS_RUNNING, started_at__lt=cutoff),
+        **filters
+    )
+    recovered = 0
+    for job in stale:
+        order = job.order
+        if order is not None and order.care_plan:
+            outcome = {'status': CarePlanJob.STATUS_SUCCEEDED}
+        else:
+            outcome = {
+                'order': None,
+                'status': CarePlanJob.STATUS_FAILED,
+                'error': "Care plan job was lost before it finished, most likely because its worker restarted",
+            }
+        with transaction.atomic():
+            claimed = CarePlanJob.objects.filter(id=job.id, status=job.status).update(finished_at=timezone.now(), **outcome)
+            if claimed and outcome['status'] == CarePlanJob.STATUS_FAILED and order is not None:
+                Order.objects.filter(id=order.id).delete()
+        if claimed:
+            recovered += 1
+            logger.warning(f"Care plan job {job.id} was stuck {job.status}, marked {outcome['status']}")
+    return recovered
+def submit_care_plan_job(order: Order) -> CarePlanJob:
+    job = CarePlanJob.objects.create(order=order)
+    logger.info(f"Care plan job {job.id} queued for order ID: {order.id}")
+    if settings.CARE_PLAN_JOB_WORKERS <= 0:
+        transaction.on_commit(lambda: run_care_plan_job(job.id))
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_run_pooled_job, job.id))
+    return job
+def _export_path(job: ExportJob) -> Path:
+    return Path(settings.CARE_PLAN_EXPORT_DIR) / f"{job.id}.{job.format}"
+def _export_filters(job: ExportJob) -> dict:
+    filters = dict(job.filters)
+    for key in ('start_date', 'end_date'):
+        if filters.get(key):
+            filters[key] = datetime.fromisoformat(filters[key])
+    return filters
+def run_export_job(job_id) -> None:
+    try:
+        job = ExportJob.objects.get(id=job_id)
+    except ExportJob.DoesNotExist:
+        logger.error(f"Export job {job_id} not found")
+        return
+    job.status = ExportJob.STATUS_RUNNING
+    job.started_at = timezone.now()
+    job.save(update_fields=['status', 'started_at'])
+    path = _export_path(job)
+    partial = path.with_name(path.name + '.part')
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        job.row_count = render_export_file(partial, job.format, **_export_filters(job))
+        os.replace(partial, path)
+        job.file_path = str(path)
+        job.file_size = path.stat().st_size
+        job.checksum = file_checksum(path)
+        job.status = ExportJob.STATUS_SUCCEEDED
+    except Exception as e:
+        logger.error(f"Export job {job_id} failed, error: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        partial.unlink(missing_ok=True)
+        job.status = ExportJob.STATUS_FAILED
+        job.error = f"Export failed: {str(e)}"
+    job.finished_at = timezone.now()
+    job.expires_at = job.finished_at + timedelta(seconds=settings.CARE_PLAN_EXPORT_TTL_SECONDS)
+    job.save(update_fields=[
+        'status', 'error', 'file_path', 'file_size', 'checksum', 'row_count', 'finished_at', 'expires_at'
+    ])
+    logger.info(f"Export job {job_id} finished with status: {job.status}, rows: {job.row_count}")
+def cleanup_expired_exports() -> int:
+    expired = list(ExportJob.objects.filter(expires_at__lt=timezone.now()))
+    for job in expired:
+        if job.file_path:
+            Path(job.file_path).unlink(missing_ok=True)
+    ExportJob.objects.filter(id__in=[job.id for job in expired]).delete()
+    removed = len(expired)
+    export_dir = Path(settings.CARE_PLAN_EXPORT_DIR)
+    if export_dir.exists():
+        cutoff = time.time() - settings.CARE_PLAN_EXPORT_TTL_SECONDS
+        known = {Path(path).name for path in ExportJob.objects.exclude(file_path='').values_list('file_path', flat=True)}
+        for path in export_dir.iterdir():
+            try:
+                if path.name not in known and path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    if removed:
+        logger.info(f"Removed {removed} expired export file(s)")
+    return removed
+def submit_export_job(format: str, filters: dict, filename: str) -> ExportJob:
+    cleanup_expired_exports()
+    job = ExportJob.objects.create(format=format, filters=filters, filename=filename)
+    logger.info(f"Export job {job.id} queued - format: {format}, filters: {filters}")
+    if settings.CARE_PLAN_EXPORT_WORKERS <= 0:
+        transaction.on_commit(lambda: run_export_job(job.id))
+    else:
+        executor = get_executor('export-job', settings.CARE_PLAN_EXPORT_WORKERS)
+        transaction.on_commit(lambda: executor.submit(_run_pooled_job, job.id, run_export_job))
+    return job
@@ -1,73 +1,43 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from typing import Iterator
+import asyncio
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 import os
+import weakref
+import hashlib
+import json
 import logging
+import math
 import re
 from dotenv import load_dotenv
+from django.conf import settings
+from .cache import care_plan_cache
+from asgiref.sync import sync_to_async
+from .prompt_compaction import compact_patient_records, count_tokens
+from .rate_limit import openai_rate_limiter
+from .resilience import CircuitOpenError, call_with_resilience, acall_with_resilience
+from .singleflight import SingleFlight, AsyncSingleFlight, file_lock
 load_dotenv()
 logger = logging.getLogger('orders')
-_client = None
-def get_client():
-    global _client
-    if _client is None:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            logger.error("OPENAI_API_KEY not found in environment variables")
-            raise ValueError("OPENAI_API_KEY not found in environment variables. Please set it in .env file")
-        logger.debug("Initializing OpenAI client")
-        _client = OpenAI(api_key=api_key)
-    return _client
-def clean_care_plan(care_plan: str) -> str:
-    conversational_markers = [
-        "this care plan is intended to be used",
-        "if you want, i will prepare",
-        "if you want, i can",
-        "if you need, i will",
-        "if you need, i can",
-        "would you like me to",
-        "let me know if you",
-        "i can also create",
-        "i will also prepare",
-    ]
-    lines = care_plan.split('\n')
-    last_valid_idx = len(lines) - 1
-    signature_pattern = r'Date:\s*\d{4}-\d{2}-\d{2}'
-    for i, line in enumerate(lines):
-        if re.search(signature_pattern, line):
-            last_valid_idx = i
-    for i in range(last_valid_idx + 1, len(lines)):
-        line_lower = lines[i].lower().strip()
-        if any(marker in line_lower for marker in conversational_markers):
-            logger.debug(f"Removing conversational ending starting at line {i}: {lines[i][:50]}...")
-            return '\n'.join(lines[:i]).strip()
-    return care_plan.strip()
-def generate_care_plan(
-    patient_records: str,
-    primary_diagnosis: str,
-    medication_name: str,
-    patient_first_name: str,
-    patient_last_name: str,
-    patient_mrn: str,
-    additional_diagnoses: list[str] = None,
-    medication_history: list[str] = None,
-) -> str:
-    if additional_diagnoses is None:
-        additional_diagnoses = []
-    if medication_history is None:
-        medication_history = []
-    prompt = f"""You are an expert clinical pharmacist creating a comprehensive care plan for specialty pharmacy use.
-**PATIENT INFORMATION:**
-Name: {patient_first_name} {patient_last_name}
-MRN: {patient_mrn}
-Primary Diagnosis: {primary_diagnosis}
-Additional Diagnoses: {', '.join(additional_diagnoses) if additional_diagnoses else 'None'}
-Current Medication: {medication_name}
-Medication History: {', '.join(medication_history) if medication_history else 'None'}
-**CLINICAL RECORDS:**
-{patient_records}
-**TASK:** Generate a comprehensive pharmacist care plan that meets Medicare documentation requirements and pharma reporting standards.
-**REQUIRED FORMAT:**
-**START YOUR OUTPUT WITH A PATIENT HEADER:**
-```
+CARE_PLAN_MODEL = "gpt-5-mini"
+PROMPT_VERSION = "1"
+CACHE_HIT = 'hit'
+CACHE_COALESCED = 'coalesced'
+CACHE_MISS = 'miss'
+SYSTEM_PROMPT = """You are an expert clinical pharmacist with 15+ years of experience in specialty pharmacy, Medicare Part D documentation, and pharmaceutical reporting.
+You create OFFICIAL MEDICAL DOCUMENTATION - not conversational responses.
+CRITICAL RULES:
+- Generate ONLY the care plan document itself
+- Start with patient demographics header
+- Include all 6 required sections
+- End with provider signature line
+- Do NOT add conversational text at the end ("If you want...", "I will prepare...", "Let me know...")
+- Do NOT offer to create additional materials after the document
+- Do NOT address the reader directly
+- Stay in professional clinical documentation mode throughout
+- This is a final, complete document ready for regulatory submission and clinical use
+Your care plans are detailed, actionable, meet all regulatory standards, and are immediately usable by pharmacy staff."""
+PATIENT_HEADER_FORMAT = """```
 [Patient First Name] [Patient Last Name] — Comprehensive Pharmacist Care Plan (Specialty Pharmacy)
 MRN: [MRN]
 DOB: [extract from records if available]  Sex: [extract]  Weight: [extract]
@@ -76,50 +46,50 @@ Additional diagnoses: [list with ICD-10 codes]
 Current specialty medication: [medication name and details]
 Date of plan: [current date]
 Prepared by: Clinical Pharmacist (specialty pharmacy)
-```
-**THEN INCLUDE THESE NUMBERED SECTIONS:**
-**1) PROBLEM LIST / Drug Therapy Problems (DTPs)**
+```"""
+CARE_PLAN_SECTIONS = [
+    """**1) PROBLEM LIST / Drug Therapy Problems (DTPs)**
 Organize into subsections:
 - A. Current therapy-related problems (list all potential adverse effects, infusion reactions, organ toxicity risks)
 - B. Drug-drug interactions / contraindications / cautions (evaluate all medications)
-- C. Priority safety concerns to address now (immediate risks)
-**2) SMART GOALS (Specific, Measurable, Achievable, Relevant, Time-bound)**
+- C. Priority safety concerns to address now (immediate risks)""",
+    """**2) SMART GOALS (Specific, Measurable, Achievable, Relevant, Time-bound)**
 Include:
 - Clinical goals (with measurable outcomes and timeframes)
 - Safety goals (with specific numeric thresholds)
-- Quality-of-life / medication use goals (patient education, adherence)
-**3) PHARMACIST INTERVENTIONS / PLAN**
+- Quality-of-life / medication use goals (patient education, adherence)""",
+    """**3) PHARMACIST INTERVENTIONS / PLAN**
 Organize into subsections:
 - A. Verify and optimize therapy (dosing, product selection, administration strategy, premedication, hydration, prophylaxis)
 - B. Monitoring & follow-up interventions (refer to section 4 for schedule)
 - C. Patient education (verbal + written) - list specific topics and warning signs
-- D. Coordination with providers (communication plan)
-**4) MONITORING PLAN & LAB SCHEDULE (specific, actionable)**
+- D. Coordination with providers (communication plan)""",
+    """**4) MONITORING PLAN & LAB SCHEDULE (specific, actionable)**
 Include:
 - Baseline (pre-treatment) requirements
 - During treatment monitoring (vitals frequency, parameters)
 - Laboratory schedule (specific tests and timing: baseline, mid-course, post-course)
 - Triggers for escalation / thresholds (numeric criteria for urgent action)
 - Follow-up schedule (specific timeframes)
-- Contingency / alternative plans (if adverse events occur)
-**5) DOCUMENTATION / REPORTING**
+- Contingency / alternative plans (if adverse events occur)""",
+    """**5) DOCUMENTATION / REPORTING**
 Include:
 - Product lot number documentation
 - Adverse event reporting procedures
 - Communication to providers
-- Record-keeping requirements
-**6) SUMMARY — Clinical impression & plan for this patient**
+- Record-keeping requirements""",
+    """**6) SUMMARY — Clinical impression & plan for this patient**
 Provide:
 - Clinical summary (brief overview of patient status)
 - Expected course and outcomes
-- Next steps and follow-up plan
-**END THE DOCUMENT WITH:**
-```
+- Next steps and follow-up plan""",
+]
+SIGNATURE_BLOCK = """```
 Provider signature:
 [Clinical Pharmacist — Name, Credentials]
 Date: [current date in YYYY-MM-DD format]
-```
-**CRITICAL REQUIREMENTS:**
+```"""
+CRITICAL_REQUIREMENTS = """**CRITICAL REQUIREMENTS:**
 - Extract patient-specific details (DOB, sex, weight, allergies) from the clinical records
 - Use specific numeric values from patient records (lab values, vital signs, doses, weights)
 - Include exact timeframes (hours, days, weeks)
@@ -127,50 +97,491 @@ Date: [current date in YYYY-MM-DD format]
 - Provide measurable thresholds for escalation
 - Use appropriate medical terminology
 - Make the plan immediately actionable for pharmacy staff
-- Ensure Medicare documentation compliance (diagnoses with ICD-10, medications, lot numbers)
-**DOCUMENT ENDING RULES:**
+- Ensure Medicare documentation compliance (diagnoses with ICD-10, medications, lot numbers)"""
+DOCUMENT_ENDING_RULES = """**DOCUMENT ENDING RULES:**
 - The document MUST end with the provider signature block
 - You may include ONE optional "Addendum: Quick-reference escalation thresholds" section after the signature if clinically appropriate
 - Do NOT add conversational text after the signature (no "If you want, I will prepare..." or similar)
 - Do NOT offer to create additional materials
-- This is a final, complete clinical document
-Format as a professional clinical document suitable for regulatory review and clinical use."""
-    try:
-        logger.info(f"Calling OpenAI API - Model: gpt-5-mini, Patient: {patient_first_name} {patient_last_name}, MRN: {patient_mrn}")
-        logger.debug(f"Primary Diagnosis: {primary_diagnosis}, Medication: {medication_name}")
-        logger.debug(f"Prompt length: {len(prompt)} characters")
-        client = get_client()
-        response = client.chat.completions.create(
-            model="gpt-5-mini",
-            messages=[
-                {
-                    "role": "system", 
-                    "content": """You are an expert clinical pharmacist with 15+ years of experience in specialty pharmacy, Medicare Part D documentation, and pharmaceutical reporting.
-You create OFFICIAL MEDICAL DOCUMENTATION - not conversational responses.
+- This is a final, complete clinical document"""
+DOCUMENT_FORMAT_INSTRUCTION = "Format as a professional clinical document suitable for regulatory review and clinical use."
+SECTION_SYSTEM_PROMPT = """You are an expert clinical pharmacist with 15+ years of experience in specialty pharmacy, Medicare Part D documentation, and pharmaceutical reporting.
+You write ONE part of an OFFICIAL MEDICAL DOCUMENT that is assembled from separately written parts - not conversational responses.
 CRITICAL RULES:
-- Generate ONLY the care plan document itself
-- Start with patient demographics header
-- Include all 6 required sections
-- End with provider signature line
-- Do NOT add conversational text at the end ("If you want...", "I will prepare...", "Let me know...")
-- Do NOT offer to create additional materials after the document
+- Generate ONLY the requested part, starting with its heading
+- Do NOT write other sections, an introduction, or a summary of the whole plan unless it is the requested part
+- Do NOT add conversational text ("If you want...", "I will prepare...", "Let me know...")
 - Do NOT address the reader directly
-- Stay in professional clinical documentation mode throughout
-- This is a final, complete document ready for regulatory submission and clinical use
-Your care plans are detailed, actionable, meet all regulatory standards, and are immediately usable by pharmacy staff."""
-                },
-                {"role": "user", "content": prompt}
+- Stay in professional clinical documentation mode throughout"""
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+def _get_api_key() -> str:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        logger.error("OPENAI_API_KEY not found in environment variables")
+        raise ValueError("OPENAI_API_KEY not found in environment variables. Please set it in .env file")
+    return api_key
+def get_client():
+    global _client
+    if _client is None:
+        api_key = _get_api_key()
+        logger.debug("Initializing OpenAI client")
+        _client = OpenAI(api_key=api_key)
+    return _client
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        api_key = _get_api_key()
+        logger.debug("Initializing async OpenAI client")
+        client = AsyncOpenAI(api_key=api_key)
+        _async_clients[loop] = client
+    return client
+CONVERSATIONAL_MARKERS = [
+    "this care plan is intended to be used",
+    "if you want, i will prepare",
+    "if you want, i can",
+    "if you need, i will",
+    "if you need, i can",
+    "would you like me to",
+    "let me know if you",
+    "i can also create",
+    "i will also prepare",
+]
+SIGNATURE_PATTERN = re.compile(r'Date:\s*\d{4}-\d{2}-\d{2}')
+class CarePlanStreamCleaner:
+    def __init__(self):
+        self._line = ''
+        self._line_emitted = 0
+        self._signed = False
+        self._held = []
+    def _accept_line(self, line: str) -> str:
+        emitted = self._line_emitted
+        self._line_emitted = 0
+        if self._held:
+            self._held.append(line)
+            if SIGNATURE_PATTERN.search(line):
+                text = '\n'.join(self._held) + '\n'
+                self._held = []
+                return text
+            return ''
+        if SIGNATURE_PATTERN.search(line):
+            self._signed = True
+            return line[emitted:] + '\n'
+        if self._signed and any(marker in line.lower().strip() for marker in CONVERSATIONAL_MARKERS):
+            self._held.append(line)
+            return ''
+        return line[emitted:] + '\n'
+    def feed(self, chunk: str) -> str:
+        parts = (self._line + chunk).split('\n')
+        self._line = parts.pop()
+        output = [self._accept_line(line) for line in parts]
+        if not self._signed:
+            output.append(self._line[self._line_emitted:])
+            self._line_emitted = len(self._line)
+        return ''.join(output)
+    def finish(self) -> str:
+        text = self._accept_line(self._line)
+        self._line = ''
+        if text.endswith('\n'):
+            text = text[:-1]
+        if self._held:
+            logger.debug(f"Removing conversational ending: {self._held[0][:50]}...")
+            self._held = []
+        return text
+def clean_care_plan(care_plan: str) -> str:
+    cleaner = CarePlanStreamCleaner()
+    return (cleaner.feed(care_plan) + cleaner.finish()).strip()
+def _patient_context(
+    patient_records: str,
+    primary_diagnosis: str,
+    medication_name: str,
+    patient_first_name: str,
+    patient_last_name: str,
+    patient_mrn: str,
+    additional_diagnoses: list[str] = None,
+    medication_history: list[str] = None,
+) -> str:
+    if additional_diagnoses is None:
+        additional_diagnoses = []
+    if medication_history is None:
+        medication_history = []
+    compaction = compact_patient_records(patient_records, settings.CARE_PLAN_RECORDS_TOKEN_BUDGET)
+    logger.info(f"Patient records compacted - MRN: {patient_mrn}, tokens before: {compaction.tokens_before}, after: {compaction.tokens_after}, budget: {settings.CARE_PLAN_RECORDS_TOKEN_BUDGET}, truncated: {compaction.truncated}")
+    patient_records = compaction.text
+    return f"""You are an expert clinical pharmacist creating a comprehensive care plan for specialty pharmacy use.
+**PATIENT INFORMATION:**
+Name: {patient_first_name} {patient_last_name}
+MRN: {patient_mrn}
+Primary Diagnosis: {primary_diagnosis}
+Additional Diagnoses: {', '.join(additional_diagnoses) if additional_diagnoses else 'None'}
+Current Medication: {medication_name}
+Medication History: {', '.join(medication_history) if medication_history else 'None'}
+**CLINICAL RECORDS:**
+{patient_records}"""
+def build_care_plan_messages(**kwargs) -> list[dict]:
+    sections = '\n'.join(CARE_PLAN_SECTIONS)
+    prompt = f"""{_patient_context(**kwargs)}
+**TASK:** Generate a comprehensive pharmacist care plan that meets Medicare documentation requirements and pharma reporting standards.
+**REQUIRED FORMAT:**
+**START YOUR OUTPUT WITH A PATIENT HEADER:**
+{PATIENT_HEADER_FORMAT}
+**THEN INCLUDE THESE NUMBERED SECTIONS:**
+{sections}
+**END THE DOCUMENT WITH:**
+{SIGNATURE_BLOCK}
+{CRITICAL_REQUIREMENTS}
+{DOCUMENT_ENDING_RULES}
+{DOCUMENT_FORMAT_INSTRUCTION}"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+def build_care_plan_section_messages(**kwargs) -> list[list[dict]]:
+    context = _patient_context(**kwargs)
+    parts = [f"**PATIENT HEADER:**\n{PATIENT_HEADER_FORMAT}"] + CARE_PLAN_SECTIONS
+    messages = []
+    for index, part in enumerate(parts):
+        closing = f"\n**END THIS PART WITH:**\n{SIGNATURE_BLOCK}" if index == len(parts) - 1 else ""
+        prompt = f"""{context}
+**TASK:** Write ONE part of a comprehensive pharmacist care plan that meets Medicare documentation requirements and pharma reporting standards. The other parts are written separately and assembled in order, so write ONLY the part below, starting with its heading. Do not write any other part, introduction or closing remarks.
+**PART TO WRITE:**
+{part}{closing}
+{CRITICAL_REQUIREMENTS}
+{DOCUMENT_FORMAT_INSTRUCTION}"""
+        messages.append([
+            {"role": "system", "content": SECTION_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ])
+    return messages
+def _estimate_tokens(messages: list[dict], completion_tokens: int = None) -> int:
+    prompt_tokens = sum(count_tokens(message['content']) for message in messages)
+    if completion_tokens is None:
+        completion_tokens = settings.CARE_PLAN_RATE_LIMIT_COMPLETION_TOKENS
+    return prompt_tokens + completion_tokens
+def _record_usage(usage, estimated_tokens: int) -> None:
+    if usage is not None and getattr(usage, 'total_tokens', None) is not None:
+        openai_rate_limiter.record_usage(estimated_tokens, usage.total_tokens)
+def _create_completion(client, messages: list[dict], timeout: float, **kwargs):
+    return client.with_options(timeout=timeout, max_retries=0).chat.completions.create(
+        model=CARE_PLAN_MODEL,
+        messages=messages,
+        **kwargs
+    )
+async def _acreate_completion(client, messages: list[dict], timeout: float, **kwargs):
+    return await client.with_options(timeout=timeout, max_retries=0).chat.completions.create(
+        model=CARE_PLAN_MODEL,
+        messages=messages,
+        **kwargs
+    )
+def _complete(client, messages: list[dict], completion_tokens: int = None):
+    estimated_tokens = _estimate_tokens(messages, completion_tokens)
+    response = call_with_resilience(lambda timeout: _create_completion(client, messages, timeout), tokens=estimated_tokens)
+    _record_usage(getattr(response, 'usage', None), estimated_tokens)
+    return response
+async def _acomplete(client, messages: list[dict], completion_tokens: int = None):
+    estimated_tokens = _estimate_tokens(messages, completion_tokens)
+    response = await acall_with_resilience(lambda timeout: _acreate_completion(client, messages, timeout), tokens=estimated_tokens)
+    await asyncio.to_thread(_record_usage, getattr(response, 'usage', None), estimated_tokens)
+    return response
+def _care_plan_from_response(response) -> str:
+    care_plan = response.choices[0].message.content
+    logger.info(f"OpenAI API call successful - Response length: {len(care_plan)} characters")
+    if hasattr(response, 'usage'):
+        logger.debug(f"Tokens used - Prompt: {response.usage.prompt_tokens}, Completion: {response.usage.completion_tokens}, Total: {response.usage.total_tokens}")
+    care_plan = clean_care_plan(care_plan)
+    logger.debug(f"Care plan cleaned - Final length: {len(care_plan)} characters")
+    return care_plan
+def _strip_conversational_tail(part: str) -> str:
+    lines = part.split('\n')
+    while lines and (not lines[-1].strip() or any(marker in lines[-1].lower() for marker in CONVERSATIONAL_MARKERS)):
+        lines.pop()
+    return '\n'.join(lines)
+def _assemble_sections(responses) -> str:
+    last = len(responses) - 1
+    parts = []
+    for index, response in enumerate(responses):
+        part = clean_care_plan(response.choices[0].message.content or '')
+        if index < last:
+            part = _strip_conversational_tail(part)
+        if part:
+            parts.append(part)
+    care_plan = '\n\n'.join(parts)
+    logger.info(f"Assembled care plan from {len(responses)} parallel sections - length: {len(care_plan)} characters")
+    return care_plan
+def _section_completion_tokens(sections: int) -> int:
+    return math.ceil(settings.CARE_PLAN_RATE_LIMIT_COMPLETION_TOKENS / max(sections, 1))
+def generate_care_plan_sections(**kwargs) -> str:
+    section_messages = build_care_plan_section_messages(**kwargs)
+    logger.info(f"Calling OpenAI API for {len(section_messages)} sections in parallel - Model: {CARE_PLAN_MODEL}, MRN: {kwargs.get('patient_mrn')}")
+    client = get_client()
+    completion_tokens = _section_completion_tokens(len(section_messages))
+    executor = ThreadPoolExecutor(max_workers=len(section_messages), thread_name_prefix='care-plan-section')
+    try:
+        futures = [
+            executor.submit(_complete, client, messages, completion_tokens)
+            for messages in section_messages
+        ]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in futures:
+            if future in done and future.exception() is not None:
+                raise future.exception()
+        responses = [future.result() for future in futures]
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return _assemble_sections(responses)
+async def agenerate_care_plan_sections(**kwargs) -> str:
+    section_messages = build_care_plan_section_messages(**kwargs)
+    logger.info(f"Calling OpenAI API (async) for {len(section_messages)} sections in parallel - Model: {CARE_PLAN_MODEL}, MRN: {kwargs.get('patient_mrn')}")
+    client = get_async_client()
+    completion_tokens = _section_completion_tokens(len(section_messages))
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [
+                group.create_task(_acomplete(client, messages, completion_tokens))
+                for messages in section_messages
             ]
-        )
-        care_plan = response.choices[0].message.content
-        logger.info(f"OpenAI API call successful - Response length: {len(care_plan)} characters")
-        if hasattr(response, 'usage'):
-            logger.debug(f"Tokens used - Prompt: {response.usage.prompt_tokens}, Completion: {response.usage.completion_tokens}, Total: {response.usage.total_tokens}")
-        care_plan = clean_care_plan(care_plan)
-        logger.debug(f"Care plan cleaned - Final length: {len(care_plan)} characters")
-        return care_plan
+    except ExceptionGroup as errors:
+        raise errors.exceptions[0]
+    return _assemble_sections([task.result() for task in tasks])
+def generate_care_plan(
+    patient_records: str,
+    primary_diagnosis: str,
+    medication_name: str,
+    patient_first_name: str,
+    patient_last_name: str,
+    patient_mrn: str,
+    additional_diagnoses: list[str] = None,
+    medication_history: list[str] = None,
+) -> str:
+    if settings.CARE_PLAN_PARALLEL_SECTIONS:
+        try:
+            return generate_care_plan_sections(
+                patient_records=patient_records,
+                primary_diagnosis=primary_diagnosis,
+                medication_name=medication_name,
+                patient_first_name=patient_first_name,
+                patient_last_name=patient_last_name,
+                patient_mrn=patient_mrn,
+                additional_diagnoses=additional_diagnoses,
+                medication_history=medication_history,
+            )
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"OpenAI API call failed: {str(e)}")
+            import traceback
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            raise Exception(f"Failed to generate care plan: {str(e)}")
+    messages = build_care_plan_messages(
+        patient_records=patient_records,
+        primary_diagnosis=primary_diagnosis,
+        medication_name=medication_name,
+        patient_first_name=patient_first_name,
+        patient_last_name=patient_last_name,
+        patient_mrn=patient_mrn,
+        additional_diagnoses=additional_diagnoses,
+        medication_history=medication_history,
+    )
+    try:
+        logger.info(f"Calling OpenAI API - Model: {CARE_PLAN_MODEL}, Patient: {patient_first_name} {patient_last_name}, MRN: {patient_mrn}")
+        logger.debug(f"Primary Diagnosis: {primary_diagnosis}, Medication: {medication_name}")
+        logger.debug(f"Prompt length: {len(messages[1]['content'])} characters")
+        client = get_client()
+        response = _complete(client, messages)
+        return _care_plan_from_response(response)
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"OpenAI API call failed: {str(e)}")
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
-        raise Exception(f"Failed to generate care plan: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Failed to generate care plan: {str(e)}")
+async def agenerate_care_plan(
+    patient_records: str,
+    primary_diagnosis: str,
+    medication_name: str,
+    patient_first_name: str,
+    patient_last_name: str,
+    patient_mrn: str,
+    additional_diagnoses: list[str] = None,
+    medication_history: list[str] = None,
+) -> str:
+    if settings.CARE_PLAN_PARALLEL_SECTIONS:
+        try:
+            return await agenerate_care_plan_sections(
+                patient_records=patient_records,
+                primary_diagnosis=primary_diagnosis,
+                medication_name=medication_name,
+                patient_first_name=patient_first_name,
+                patient_last_name=patient_last_name,
+                patient_mrn=patient_mrn,
+                additional_diagnoses=additional_diagnoses,
+                medication_history=medication_history,
+            )
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"OpenAI API call failed: {str(e)}")
+            import traceback
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            raise Exception(f"Failed to generate care plan: {str(e)}")
+    messages = build_care_plan_messages(
+        patient_records=patient_records,
+        primary_diagnosis=primary_diagnosis,
+        medication_name=medication_name,
+        patient_first_name=patient_first_name,
+        patient_last_name=patient_last_name,
+        patient_mrn=patient_mrn,
+        additional_diagnoses=additional_diagnoses,
+        medication_history=medication_history,
+    )
+    try:
+        logger.info(f"Calling OpenAI API (async) - Model: {CARE_PLAN_MODEL}, Patient: {patient_first_name} {patient_last_name}, MRN: {patient_mrn}")
+        logger.debug(f"Prompt length: {len(messages[1]['content'])} characters")
+        client = get_async_client()
+        response = await _acomplete(client, messages)
+        return _care_plan_from_response(response)
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"OpenAI API call failed: {str(e)}")
+        import traceback
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise Exception(f"Failed to generate care plan: {str(e)}")
+def _normalize_text(value: str) -> str:
+    return re.sub(r'\s+', ' ', value or '').strip()
+def care_plan_cache_key(
+    patient_records: str,
+    primary_diagnosis: str,
+    medication_name: str,
+    patient_first_name: str,
+    patient_last_name: str,
+    patient_mrn: str,
+    additional_diagnoses: list[str] = None,
+    medication_history: list[str] = None,
+) -> str:
+    normalized = {
+        "patient_records": _normalize_text(patient_records),
+        "primary_diagnosis": _normalize_text(primary_diagnosis).upper(),
+        "medication_name": _normalize_text(medication_name).lower(),
+        "patient_first_name": _normalize_text(patient_first_name).lower(),
+        "patient_last_name": _normalize_text(patient_last_name).lower(),
+        "patient_mrn": _normalize_text(patient_mrn),
+        "additional_diagnoses": sorted({_normalize_text(d).upper() for d in additional_diagnoses or [] if d.strip()}),
+        "medication_history": [_normalize_text(m).lower() for m in medication_history or [] if m.strip()],
+        "prompt_version": PROMPT_VERSION,
+        "model": CARE_PLAN_MODEL,
+        "records_token_budget": settings.CARE_PLAN_RECORDS_TOKEN_BUDGET,
+    }
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+care_plan_flight = SingleFlight()
+def _generate_and_store(key: str, kwargs: dict) -> tuple[str, str]:
+    if not care_plan_cache.enabled:
+        return generate_care_plan(**kwargs), CACHE_MISS
+    with file_lock(settings.CARE_PLAN_LOCK_DIR, key, settings.CARE_PLAN_LOCK_TIMEOUT_SECONDS) as acquired:
+        if acquired:
+            care_plan = care_plan_cache.get(key)
+            if care_plan is not None:
+                logger.info(f"Care plan produced by another worker - MRN: {kwargs.get('patient_mrn')}, key: {key[:12]}")
+                return care_plan, CACHE_COALESCED
+        care_plan = generate_care_plan(**kwargs)
+        care_plan_cache.set(key, care_plan, CARE_PLAN_MODEL, PROMPT_VERSION)
+    return care_plan, CACHE_MISS
+def generate_care_plan_cached(**kwargs) -> tuple[str, str]:
+    key = care_plan_cache_key(**kwargs)
+    care_plan = care_plan_cache.get(key)
+    if care_plan is not None:
+        logger.info(f"Care plan cache hit - MRN: {kwargs.get('patient_mrn')}, key: {key[:12]}")
+        return care_plan, CACHE_HIT
+    logger.info(f"Care plan cache miss - MRN: {kwargs.get('patient_mrn')}, key: {key[:12]}")
+    (care_plan, cache_status), shared = care_plan_flight.do(key, lambda: _generate_and_store(key, kwargs))
+    return care_plan, CACHE_COALESCED if shared else cache_status
+care_plan_async_flight = AsyncSingleFlight()
+async def _agenerate_and_store(key: str, kwargs: dict) -> str:
+    care_plan = await agenerate_care_plan(**kwargs)
+    await sync_to_async(care_plan_cache.set)(key, care_plan, CARE_PLAN_MODEL, PROMPT_VERSION)
+    return care_plan
+async def agenerate_care_plan_cached(**kwargs) -> tuple[str, str]:
+    key = care_plan_cache_key(**kwargs)
+    care_plan = await sync_to_async(care_plan_cache.get)(key)
+    if care_plan is not None:
+        logger.info(f"Care plan cache hit - MRN: {kwargs.get('patient_mrn')}, key: {key[:12]}")
+        return care_plan, CACHE_HIT
+    logger.info(f"Care plan cache miss - MRN: {kwargs.get('patient_mrn')}, key: {key[:12]}")
+    care_plan, shared = await care_plan_async_flight.do(key, lambda: _agenerate_and_store(key, kwargs))
+    return care_plan, CACHE_COALESCED if shared else CACHE_MISS
+def stream_care_plan(
+    patient_records: str,
+    primary_diagnosis: str,
+    medication_name: str,
+    patient_first_name: str,
+    patient_last_name: str,
+    patient_mrn: str,
+    additional_diagnoses: list[str] = None,
+    medication_history: list[str] = None,
+) -> Iterator[str]:
+    messages = build_care_plan_messages(
+        patient_records=patient_records,
+        primary_diagnosis=primary_diagnosis,
+        medication_name=medication_name,
+        patient_first_name=patient_first_name,
+        patient_last_name=patient_last_name,
+        patient_mrn=patient_mrn,
+        additional_diagnoses=additional_diagnoses,
+        medication_history=medication_history,
+    )
+    key = care_plan_cache_key(
+        patient_records=patient_records,
+        primary_diagnosis=primary_diagnosis,
+        medication_name=medication_name,
+        patient_first_name=patient_first_name,
+        patient_last_name=patient_last_name,
+        patient_mrn=patient_mrn,
+        additional_diagnoses=additional_diagnoses,
+        medication_history=medication_history,
+    )
+    cached = care_plan_cache.get(key)
+    if cached is not None:
+        logger.info(f"Care plan cache hit (streaming) - MRN: {patient_mrn}, key: {key[:12]}")
+        yield cached
+        return
+    try:
+        logger.info(f"Calling OpenAI API (streaming) - Model: {CARE_PLAN_MODEL}, Patient: {patient_first_name} {patient_last_name}, MRN: {patient_mrn}")
+        client = get_client()
+        estimated_tokens = _estimate_tokens(messages)
+        stream = call_with_resilience(
+            lambda timeout: _create_completion(client, messages, timeout, stream=True, stream_options={"include_usage": True}),
+            hedge=False,
+            tokens=estimated_tokens
+        )
+        cleaner = CarePlanStreamCleaner()
+        received = 0
+        parts = []
+        usage = None
+        for chunk in stream:
+            if getattr(chunk, 'usage', None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            received += len(delta)
+            text = cleaner.feed(delta)
+            if text:
+                parts.append(text)
+                yield text
+        text = cleaner.finish()
+        if text:
+            parts.append(text)
+            yield text
+        logger.info(f"OpenAI API stream complete - Response length: {received} characters")
+        _record_usage(usage, estimated_tokens)
+        care_plan_cache.set(key, ''.join(parts).strip(), CARE_PLAN_MODEL, PROMPT_VERSION)
+    except Exception as e:
+        logger.error(f"OpenAI API stream failed: {str(e)}")
+        import traceback
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise Exception(f"Failed to generate care plan: {str(e)}")
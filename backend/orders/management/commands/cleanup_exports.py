@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from orders.jobs import cleanup_expired_exports
+
+
+class Command(BaseCommand):
+    help = "Delete export job files and records that are past their TTL"
+
+    def handle(self, *args, **options):
+        removed = cleanup_expired_exports()
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} expired export(s)"))
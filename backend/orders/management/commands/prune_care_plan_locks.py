@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from orders.singleflight import prune_lock_files
+
+
+class Command(BaseCommand):
+    help = "Delete care plan lock files that are idle and not held by any worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=float, default=settings.CARE_PLAN_LOCK_TIMEOUT_SECONDS * 2)
+
+    def handle(self, *args, **options):
+        removed = prune_lock_files(settings.CARE_PLAN_LOCK_DIR, options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} lock file(s)"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from orders.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the day x provider x primary diagnosis order rollups from the orders table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        count = rebuild_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} rollup row(s)"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from orders.fuzzy import rebuild_blocking_keys
+
+
+class Command(BaseCommand):
+    help = "Rebuild the phonetic and trigram blocking keys used for fuzzy patient duplicate detection"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        count = rebuild_blocking_keys(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} blocking key(s)"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from orders.jobs import recover_stale_care_plan_jobs
+
+
+class Command(BaseCommand):
+    help = "Settle care plan jobs left pending or running by a worker restart"
+
+    def handle(self, *args, **options):
+        recovered = recover_stale_care_plan_jobs()
+        self.stdout.write(self.style.SUCCESS(f"Recovered {recovered} stale care plan job(s)"))
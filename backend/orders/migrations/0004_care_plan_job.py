@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-17 00:50
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_care_plan_generated_at_patient_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarePlanJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='orders.order')),
+            ],
+            options={
+                'db_table': 'care_plan_jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status'], name='care_plan_j_status_f0a319_idx')],
+            },
+        ),
+    ]
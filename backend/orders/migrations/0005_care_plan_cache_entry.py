@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-17 00:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_care_plan_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarePlanCacheEntry',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('care_plan', models.TextField()),
+                ('model', models.CharField(max_length=100)),
+                ('prompt_version', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_accessed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'care_plan_cache',
+                'indexes': [models.Index(fields=['created_at'], name='care_plan_c_created_3be15a_idx'), models.Index(fields=['last_accessed_at'], name='care_plan_c_last_ac_a063eb_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_order_diagnoses(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderDiagnosis = apps.get_model('orders', 'OrderDiagnosis')
+    batch = []
+    for order in Order.objects.only('id', 'primary_diagnosis', 'additional_diagnoses').iterator(chunk_size=2000):
+        batch.append(OrderDiagnosis(order_id=order.id, icd10_code=order.primary_diagnosis, is_primary=True))
+        seen = {order.primary_diagnosis}
+        for code in order.additional_diagnoses or []:
+            if code and code not in seen:
+                seen.add(code)
+                batch.append(OrderDiagnosis(order_id=order.id, icd10_code=code, is_primary=False))
+        if len(batch) >= 2000:
+            OrderDiagnosis.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        OrderDiagnosis.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_care_plan_cache_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderDiagnosis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('icd10_code', models.CharField(max_length=20)),
+                ('is_primary', models.BooleanField(default=False)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='diagnoses', to='orders.order')),
+            ],
+            options={
+                'db_table': 'order_diagnoses',
+                'indexes': [models.Index(fields=['icd10_code', 'order'], name='order_diagn_icd10_c_1b4b4b_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='orderdiagnosis',
+            constraint=models.UniqueConstraint(fields=('order', 'icd10_code'), name='unique_order_diagnosis'),
+        ),
+        migrations.RunPython(backfill_order_diagnoses, migrations.RunPython.noop),
+    ]
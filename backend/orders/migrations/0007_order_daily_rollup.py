@@ -0,0 +1,57 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+
+
+def backfill_order_daily_rollups(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderDailyRollup = apps.get_model('orders', 'OrderDailyRollup')
+    has_care_plan = Q(care_plan__isnull=False) & ~Q(care_plan='')
+    rows = (
+        Order.objects.order_by()
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'provider_id', 'primary_diagnosis')
+        .annotate(orders=Count('id'), care_plans=Count('id', filter=has_care_plan))
+    )
+    OrderDailyRollup.objects.all().delete()
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        batch.append(OrderDailyRollup(**row))
+        if len(batch) >= 2000:
+            OrderDailyRollup.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        OrderDailyRollup.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_order_diagnosis'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('primary_diagnosis', models.CharField(max_length=20)),
+                ('orders', models.IntegerField(default=0)),
+                ('care_plans', models.IntegerField(default=0)),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='orders.provider')),
+            ],
+            options={
+                'db_table': 'order_daily_rollups',
+                'indexes': [models.Index(fields=['day'], name='order_daily_day_3adbf7_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='orderdailyrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'provider', 'primary_diagnosis'), name='unique_order_daily_rollup'),
+        ),
+        migrations.RunPython(backfill_order_daily_rollups, migrations.RunPython.noop),
+    ]
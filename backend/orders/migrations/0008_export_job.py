@@ -0,0 +1,38 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:09
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_order_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'Excel')], max_length=10)),
+                ('filters', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True, default='')),
+                ('filename', models.CharField(blank=True, default='', max_length=255)),
+                ('file_path', models.CharField(blank=True, default='', max_length=500)),
+                ('file_size', models.BigIntegerField(blank=True, null=True)),
+                ('checksum', models.CharField(blank=True, default='', max_length=64)),
+                ('row_count', models.IntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'export_jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['expires_at'], name='export_jobs_expires_89b852_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:17
+
+from django.db import migrations, models
+from orders.normalize import normalize_provider_name
+
+
+def backfill_name_normalized(apps, schema_editor):
+    Provider = apps.get_model('orders', 'Provider')
+    batch = []
+    for provider in Provider.objects.only('id', 'name').iterator(chunk_size=2000):
+        provider.name_normalized = normalize_provider_name(provider.name)
+        batch.append(provider)
+        if len(batch) >= 2000:
+            Provider.objects.bulk_update(batch, ['name_normalized'])
+            batch = []
+    if batch:
+        Provider.objects.bulk_update(batch, ['name_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_export_job_columnar_formats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='provider',
+            name='name_normalized',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(backfill_name_normalized, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='provider',
+            index=models.Index(fields=['name_normalized'], name='providers_name_no_d028bc_idx'),
+        ),
+    ]
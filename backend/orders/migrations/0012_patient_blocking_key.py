@@ -0,0 +1,48 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+from orders.normalize import patient_blocking_keys
+
+
+def backfill_blocking_keys(apps, schema_editor):
+    Patient = apps.get_model('orders', 'Patient')
+    PatientBlockingKey = apps.get_model('orders', 'PatientBlockingKey')
+    batch = []
+    for patient in Patient.objects.only('id', 'first_name', 'last_name').iterator(chunk_size=2000):
+        batch.extend(
+            PatientBlockingKey(patient_id=patient.id, key=key)
+            for key in sorted(patient_blocking_keys(patient.first_name, patient.last_name))
+        )
+        if len(batch) >= 2000:
+            PatientBlockingKey.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        PatientBlockingKey.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_provider_name_normalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientBlockingKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=32)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blocking_keys', to='orders.patient')),
+            ],
+            options={
+                'db_table': 'patient_blocking_keys',
+                'indexes': [models.Index(fields=['key', 'patient'], name='patient_blo_key_58e0e5_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='patientblockingkey',
+            constraint=models.UniqueConstraint(fields=('patient', 'key'), name='unique_patient_blocking_key'),
+        ),
+        migrations.RunPython(backfill_blocking_keys, migrations.RunPython.noop),
+    ]
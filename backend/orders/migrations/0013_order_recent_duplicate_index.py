@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_patient_blocking_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['patient', 'created_at', 'medication_name', 'primary_diagnosis'], name='orders_patient_499528_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_order_recent_duplicate_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionWatermark',
+            fields=[
+                ('table', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('deleted_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'deletion_watermarks',
+            },
+        ),
+    ]
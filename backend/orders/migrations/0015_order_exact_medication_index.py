@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_deletion_watermark'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['patient', 'medication_name', 'created_at', 'primary_diagnosis'], name='orders_patient_ad473c_idx'),
+        ),
+    ]
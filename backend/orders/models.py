@@ -1,5 +1,11 @@
-from django.db import models
+import uuid
+from django.db import connection, models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from django.core.validators import RegexValidator
+from .normalize import normalize_provider_name, patient_blocking_keys
+from .presence import known_mrns, known_npis
 class Patient(models.Model):
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
@@ -17,8 +23,39 @@ class Patient(models.Model):
         ]
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.mrn})"
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if update_fields is None or {'first_name', 'last_name'} & set(update_fields):
+                PatientBlockingKey.sync([self])
+        known_mrns.add([self.mrn])
+class PatientBlockingKey(models.Model):
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='blocking_keys')
+    key = models.CharField(max_length=32)
+    class Meta:
+        db_table = 'patient_blocking_keys'
+        indexes = [
+            models.Index(fields=['key', 'patient']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'key'], name='unique_patient_blocking_key')
+        ]
+    def __str__(self):
+        return f"{self.key} - Patient {self.patient_id}"
+    @classmethod
+    def rows_for(cls, patient: Patient) -> list:
+        return [cls(patient_id=patient.id, key=key) for key in sorted(patient_blocking_keys(patient.first_name, patient.last_name))]
+    @classmethod
+    def sync(cls, patients) -> None:
+        patients = list(patients)
+        if not patients:
+            return
+        cls.objects.filter(patient_id__in=[patient.id for patient in patients]).delete()
+        cls.objects.bulk_create([row for patient in patients for row in cls.rows_for(patient)])
 class Provider(models.Model):
     name = models.CharField(max_length=200)
+    name_normalized = models.CharField(max_length=200, blank=True, default='', editable=False)
     npi = models.CharField(
         max_length=10,
         unique=True,
@@ -30,6 +67,7 @@ class Provider(models.Model):
         db_table = 'providers'
         indexes = [
             models.Index(fields=['npi']),
+            models.Index(fields=['name_normalized']),
         ]
         constraints = [
             models.UniqueConstraint(fields=['npi'], name='unique_provider_npi')
@@ -39,7 +77,12 @@ class Provider(models.Model):
     def save(self, *args, **kwargs):
         if len(self.npi) != 10:
             raise ValueError("NPI must be exactly 10 digits")
+        self.name_normalized = normalize_provider_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_normalized'}
         super().save(*args, **kwargs)
+        known_npis.add([self.npi])
 class Order(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='orders')
     provider = models.ForeignKey(Provider, on_delete=models.CASCADE, related_name='orders')
@@ -51,8 +94,240 @@ class Order(models.Model):
     care_plan = models.TextField(blank=True, null=True)
     care_plan_generated_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     class Meta:
         db_table = 'orders'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['updated_at', 'id']),
+            models.Index(fields=['patient', 'created_at', 'medication_name', 'primary_diagnosis']),
+            models.Index(fields=['patient', 'medication_name', 'created_at', 'primary_diagnosis']),
+        ]
+    def __str__(self):
+        return f"Order {self.id} - {self.patient} - {self.medication_name}"
+    def diagnosis_rows(self) -> list:
+        rows = [OrderDiagnosis(order=self, icd10_code=self.primary_diagnosis, is_primary=True)]
+        seen = {self.primary_diagnosis}
+        for code in self.additional_diagnoses or []:
+            if code and code not in seen:
+                seen.add(code)
+                rows.append(OrderDiagnosis(order=self, icd10_code=code, is_primary=False))
+        return rows
+    def sync_diagnoses(self, created: bool = False) -> None:
+        if not created:
+            self.diagnoses.all().delete()
+        OrderDiagnosis.objects.bulk_create(self.diagnosis_rows())
+    ROLLUP_FIELDS = {'created_at', 'provider_id', 'primary_diagnosis', 'care_plan'}
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_rollup_state()
+        return instance
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.remember_rollup_state()
+    def remember_rollup_state(self) -> None:
+        if self.ROLLUP_FIELDS & self.get_deferred_fields():
+            self._rollup_state = None
+        else:
+            self._rollup_state = OrderDailyRollup.state_for(self)
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if update_fields is None or {'primary_diagnosis', 'additional_diagnoses'} & set(update_fields):
+                self.sync_diagnoses(created=created)
+            previous = getattr(self, '_rollup_state', None)
+            if created:
+                OrderDailyRollup.move(None, OrderDailyRollup.state_for(self))
+                self.remember_rollup_state()
+            elif previous is not None and (update_fields is None or (self.ROLLUP_FIELDS | {'provider'}) & set(update_fields)):
+                OrderDailyRollup.move(previous, OrderDailyRollup.state_for(self))
+                self.remember_rollup_state()
+class OrderDiagnosis(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='diagnoses')
+    icd10_code = models.CharField(max_length=20)
+    is_primary = models.BooleanField(default=False)
+    class Meta:
+        db_table = 'order_diagnoses'
+        indexes = [
+            models.Index(fields=['icd10_code', 'order']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'icd10_code'], name='unique_order_diagnosis')
+        ]
+    def __str__(self):
+        return f"{self.icd10_code} ({'primary' if self.is_primary else 'additional'}) - Order {self.order_id}"
+class CarePlanJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    class Meta:
+        db_table = 'care_plan_jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status']),
+        ]
+    def __str__(self):
+        return f"Job {self.id} - {self.status}"
+class ExportJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    FORMAT_CSV = 'csv'
+    FORMAT_XLSX = 'xlsx'
+    FORMAT_PARQUET = 'parquet'
+    FORMAT_ARROW = 'arrow'
+    FORMAT_CHOICES = [
+        (FORMAT_CSV, 'CSV'),
+        (FORMAT_XLSX, 'Excel'),
+        (FORMAT_PARQUET, 'Parquet'),
+        (FORMAT_ARROW, 'Arrow IPC stream'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    filters = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    error = models.TextField(blank=True, default='')
+    filename = models.CharField(max_length=255, blank=True, default='')
+    file_path = models.CharField(max_length=500, blank=True, default='')
+    file_size = models.BigIntegerField(blank=True, null=True)
+    checksum = models.CharField(max_length=64, blank=True, default='')
+    row_count = models.IntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    expires_at = models.DateTimeField(blank=True, null=True)
+    class Meta:
+        db_table = 'export_jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+    def __str__(self):
+        return f"Export job {self.id} ({self.format}) - {self.status}"
+class CarePlanCacheEntry(models.Model):
+    key = models.CharField(max_length=64, primary_key=True)
+    care_plan = models.TextField()
+    model = models.CharField(max_length=100)
+    prompt_version = models.CharField(max_length=20)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_accessed_at = models.DateTimeField(default=timezone.now)
+    class Meta:
+        db_table = 'care_plan_cache'
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['last_accessed_at']),
+        ]
+    def __str__(self):
+        return f"Cached care plan {self.key[:12]} ({self.model})"
+class OrderDailyRollup(models.Model):
+    day = models.DateField()
+    provider = models.ForeignKey(Provider, on_delete=models.CASCADE, related_name='daily_rollups')
+    primary_diagnosis = models.CharField(max_length=20)
+    orders = models.IntegerField(default=0)
+    care_plans = models.IntegerField(default=0)
+    class Meta:
+        db_table = 'order_daily_rollups'
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'provider', 'primary_diagnosis'], name='unique_order_daily_rollup')
+        ]
+    def __str__(self):
+        return f"{self.day} - {self.provider_id} - {self.primary_diagnosis}: {self.orders} orders, {self.care_plans} care plans"
+    @classmethod
+    def key_for(cls, order: Order) -> tuple:
+        return (timezone.localtime(order.created_at).date(), order.provider_id, order.primary_diagnosis)
+    @classmethod
+    def apply(cls, deltas: dict) -> None:
+        rows = [
+            (day.isoformat(), provider_id, primary_diagnosis, order_delta, care_plan_delta)
+            for (day, provider_id, primary_diagnosis), (order_delta, care_plan_delta) in deltas.items()
+            if order_delta or care_plan_delta
+        ]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {cls._meta.db_table} (day, provider_id, primary_diagnosis, orders, care_plans) "
+                "VALUES (%s, %s, %s, %s, %s) "
+                "ON CONFLICT (day, provider_id, primary_diagnosis) DO UPDATE SET "
+                "orders = orders + excluded.orders, care_plans = care_plans + excluded.care_plans",
+                rows
+            )
+        for day, provider_id, primary_diagnosis, order_delta, _ in rows:
+            if order_delta <= 0:
+                cls.objects.filter(
+                    day=day, provider_id=provider_id, primary_diagnosis=primary_diagnosis, orders__lte=0
+                ).delete()
+    @classmethod
+    def state_for(cls, order: Order) -> tuple:
+        return cls.key_for(order), bool(order.care_plan)
+    @classmethod
+    def record_orders(cls, orders, sign: int = 1) -> None:
+        deltas = {}
+        for order in orders:
+            counts = deltas.setdefault(cls.key_for(order), [0, 0])
+            counts[0] += sign
+            if order.care_plan:
+                counts[1] += sign
+        cls.apply(deltas)
+    @classmethod
+    def move(cls, previous, current) -> None:
+        deltas = {}
+        for state, sign in ((previous, -1), (current, 1)):
+            if state is None:
+                continue
+            key, has_care_plan = state
+            counts = deltas.setdefault(key, [0, 0])
+            counts[0] += sign
+            if has_care_plan:
+                counts[1] += sign
+        cls.apply(deltas)
+class DeletionWatermark(models.Model):
+    table = models.CharField(max_length=50, primary_key=True)
+    deleted_at = models.DateTimeField()
+    class Meta:
+        db_table = 'deletion_watermarks'
     def __str__(self):
-        return f"Order {self.id} - {self.patient} - {self.medication_name}"
\ No newline at end of file
+        return f"{self.table} last deleted at {self.deleted_at}"
+    @classmethod
+    def touch(cls, table: str) -> None:
+        cls.objects.bulk_create(
+            [cls(table=table, deleted_at=timezone.now())],
+            update_conflicts=True, unique_fields=['table'], update_fields=['deleted_at']
+        )
+    @classmethod
+    def last_deleted(cls, table: str):
+        return cls.objects.filter(table=table).values_list('deleted_at', flat=True).first()
+@receiver(post_delete, sender=Order)
+def remove_deleted_order_from_rollups(sender, instance, **kwargs):
+    previous = getattr(instance, '_rollup_state', None)
+    OrderDailyRollup.move(previous or OrderDailyRollup.state_for(instance), None)
+@receiver(post_delete, sender=Order)
+def record_order_deletion(sender, instance, **kwargs):
+    DeletionWatermark.touch(Order._meta.db_table)
@@ -0,0 +1,63 @@
+import re
+from difflib import SequenceMatcher
+NON_WORD_PATTERN = re.compile(r'[\W_]+')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+STRENGTH_PATTERN = re.compile(
+    r'\b\d+(?:[.,]\d+)?\s*(?:mg|mcg|µg|ug|g|kg|ml|l|units?|iu|meq|mmol|%)'
+    r'(?:\s*/\s*\d*(?:[.,]\d+)?\s*(?:ml|l|kg|m2|hr|h|dose))?(?![\w%])',
+    re.IGNORECASE
+)
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+def normalize_name(name: str) -> str:
+    return NON_WORD_PATTERN.sub(' ', (name or '').casefold()).strip()
+def normalize_provider_name(name: str) -> str:
+    return normalize_name(name)
+def normalize_medication_name(name: str, ignore_case: bool = False, ignore_strength: bool = False) -> str:
+    name = name or ''
+    if ignore_strength:
+        name = STRENGTH_PATTERN.sub(' ', name)
+    if ignore_case or ignore_strength:
+        name = WHITESPACE_PATTERN.sub(' ', name).strip()
+    return name.casefold() if ignore_case else name
+def soundex(name: str) -> str:
+    letters = [c for c in normalize_name(name) if 'a' <= c <= 'z']
+    if not letters:
+        return ''
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], '')
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if letter not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+def _trigrams(value: str) -> set:
+    if len(value) <= 3:
+        return {value} if value else set()
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+def patient_blocking_keys(first_name: str, last_name: str) -> set:
+    first = normalize_name(first_name).replace(' ', '')
+    last = normalize_name(last_name).replace(' ', '')
+    first_code, last_code = soundex(first), soundex(last)
+    keys = set()
+    if first_code and last_code:
+        keys.add('p:' + ':'.join(sorted([first_code, last_code])))
+    keys.update(f"l:{trigram}:{first_code}" for trigram in _trigrams(last))
+    keys.update(f"f:{trigram}:{last_code}" for trigram in _trigrams(first))
+    return keys
+def name_similarity(first_a: str, last_a: str, first_b: str, last_b: str) -> float:
+    a = f"{normalize_name(first_a)} {normalize_name(last_a)}"
+    return max(
+        SequenceMatcher(None, a, f"{normalize_name(first_b)} {normalize_name(last_b)}").ratio(),
+        SequenceMatcher(None, a, f"{normalize_name(last_b)} {normalize_name(first_b)}").ratio(),
+    )
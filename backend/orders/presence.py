@@ -0,0 +1,89 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from django.apps import apps
+from django.conf import settings
+logger = logging.getLogger('orders')
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(capacity, 1)
+        self.size = max(64, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+    def add(self, value: str) -> None:
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+class PresenceFilter:
+    def __init__(self, model_name: str, field: str):
+        self.model_name = model_name
+        self.field = field
+        self._filter = None
+        self._max_id = 0
+        self._reconcile_floor = 0
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+    @property
+    def model(self):
+        return apps.get_model('orders', self.model_name)
+    def _load(self) -> None:
+        queryset = self.model.objects.order_by()
+        capacity = max(queryset.count() * 2, settings.CARE_PLAN_PRESENCE_FILTER_MIN_CAPACITY)
+        bloom = BloomFilter(capacity, settings.CARE_PLAN_PRESENCE_FILTER_ERROR_RATE)
+        max_id = 0
+        for row_id, value in queryset.values_list('id', self.field).iterator(chunk_size=10000):
+            bloom.add(value)
+            max_id = max(max_id, row_id)
+        self._filter = bloom
+        self._max_id = max_id
+        self._reconcile_floor = max_id
+        logger.info(f"Loaded {self.model_name.lower()} {self.field} presence filter - {bloom.count} value(s), {len(bloom.bits)} bytes")
+    def _reconcile(self) -> None:
+        # Rescan from the previous reconcile's high-water mark so rows committed
+        # out of id order within one reconcile interval are still picked up.
+        rows = self.model.objects.order_by().filter(id__gt=self._reconcile_floor).values_list('id', self.field)
+        self._reconcile_floor = self._max_id
+        for row_id, value in rows:
+            if value not in self._filter:
+                self._filter.add(value)
+            self._max_id = max(self._max_id, row_id)
+    def _sync(self) -> None:
+        now = time.monotonic()
+        if self._filter is None or self._filter.count > self._filter.capacity:
+            self._load()
+            self._synced_at = now
+        elif now - self._synced_at >= settings.CARE_PLAN_PRESENCE_RECONCILE_SECONDS:
+            self._reconcile()
+            self._synced_at = now
+    def existing(self, values) -> set:
+        values = set(values)
+        if not settings.CARE_PLAN_PRESENCE_FILTER_ENABLED:
+            return values
+        with self._lock:
+            self._sync()
+            return {value for value in values if value in self._filter}
+    def might_exist(self, value: str) -> bool:
+        return value in self.existing([value])
+    def add(self, values) -> None:
+        with self._lock:
+            if self._filter is not None:
+                for value in values:
+                    self._filter.add(value)
+    def reset(self) -> None:
+        with self._lock:
+            self._filter = None
+            self._max_id = 0
+            self._reconcile_floor = 0
+            self._synced_at = 0.0
+known_mrns = PresenceFilter('Patient', 'mrn')
+known_npis = PresenceFilter('Provider', 'npi')
@@ -0,0 +1,106 @@
+import logging
+import re
+import threading
+from dataclasses import dataclass
+logger = logging.getLogger('orders')
+TOKENIZER_ENCODING = "o200k_base"
+CHARS_PER_TOKEN = 4
+BOILERPLATE_PATTERN = re.compile(
+    r'confidential|page \d+ of \d+|electronically signed|disclaimer|do not (copy|distribute)'
+    r'|printed (on|by)|intended (only )?for the (use|recipient)|this (fax|message|document) (is|may)',
+    re.IGNORECASE
+)
+CLINICAL_PATTERN = re.compile(
+    r'\b(allerg\w*|diagnos\w*|assessment|plan|medications?|dose|dosing|mg|mcg|ml|units?|kg|lbs?'
+    r'|labs?|cr|creatinine|egfr|bun|alt|ast|hgb|hemoglobin|platelets?|wbc|inr|a1c|bp|hr|weight'
+    r'|dob|sex|history|icd-?10|lot|infusion|reaction|contraindicat\w*)\b',
+    re.IGNORECASE
+)
+NUMBER_PATTERN = re.compile(r'\d+(\.\d+)?')
+_encoding = None
+_encoding_lock = threading.Lock()
+@dataclass
+class CompactionResult:
+    text: str
+    tokens_before: int
+    tokens_after: int
+    truncated: bool = False
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                except Exception as e:
+                    logger.warning(f"tiktoken unavailable ({str(e)}), estimating tokens at {CHARS_PER_TOKEN} chars/token")
+                    _encoding = False
+    return _encoding or None
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text)[:max_tokens])
+    return text[:max_tokens * CHARS_PER_TOKEN]
+def normalize_whitespace(text: str) -> str:
+    lines = [re.sub(r'[ \t\f\v]+', ' ', line).strip() for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n')]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+def _dedupe_key(text: str) -> str:
+    return re.sub(r'\s+', ' ', text).strip().lower()
+def drop_duplicates(text: str) -> str:
+    seen_sections = set()
+    sections = []
+    for section in text.split('\n\n'):
+        section_key = _dedupe_key(section)
+        if not section_key or section_key in seen_sections:
+            continue
+        seen_sections.add(section_key)
+        seen_lines = set()
+        lines = []
+        for line in section.split('\n'):
+            line_key = _dedupe_key(line)
+            if line_key and (NUMBER_PATTERN.search(line_key) or len(line_key) >= 20):
+                if line_key in seen_lines:
+                    continue
+                seen_lines.add(line_key)
+            lines.append(line)
+        if any(line.strip() for line in lines):
+            sections.append('\n'.join(lines))
+    return '\n\n'.join(sections)
+def section_value(section: str, tokens: int) -> float:
+    if BOILERPLATE_PATTERN.search(section):
+        return 0.0
+    clinical_hits = len(CLINICAL_PATTERN.findall(section))
+    numeric_hits = len(NUMBER_PATTERN.findall(section))
+    return (1 + 2 * clinical_hits + numeric_hits) / max(tokens, 1)
+def compact_patient_records(records: str, token_budget: int) -> CompactionResult:
+    tokens_before = count_tokens(records)
+    text = drop_duplicates(normalize_whitespace(records))
+    tokens = count_tokens(text)
+    truncated = False
+    if token_budget > 0 and tokens > token_budget:
+        sections = text.split('\n\n')
+        section_tokens = [count_tokens(section) for section in sections]
+        keep = [True] * len(sections)
+        ranked = sorted(range(1, len(sections)), key=lambda i: (section_value(sections[i], section_tokens[i]), -i))
+        total = sum(section_tokens)
+        for i in ranked:
+            if total <= token_budget:
+                break
+            keep[i] = False
+            total -= section_tokens[i]
+        text = '\n\n'.join(section for section, kept in zip(sections, keep) if kept)
+        if count_tokens(text) > token_budget:
+            text = truncate_to_tokens(text, token_budget)
+        truncated = True
+    return CompactionResult(
+        text=text,
+        tokens_before=tokens_before,
+        tokens_after=count_tokens(text),
+        truncated=truncated,
+    )
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from django.conf import settings
+logger = logging.getLogger('orders')
+class SharedRateLimiter:
+    def __init__(self, db_path=None):
+        self._db_path = db_path
+        self._initialized = set()
+        self._lock = threading.Lock()
+    @property
+    def db_path(self) -> Path:
+        return Path(self._db_path or settings.CARE_PLAN_RATE_LIMIT_DB)
+    @property
+    def enabled(self) -> bool:
+        return settings.CARE_PLAN_RATE_LIMIT_RPM > 0 or settings.CARE_PLAN_RATE_LIMIT_TPM > 0
+    def _limits(self) -> dict:
+        limits = {}
+        if settings.CARE_PLAN_RATE_LIMIT_RPM > 0:
+            limits['requests'] = settings.CARE_PLAN_RATE_LIMIT_RPM
+        if settings.CARE_PLAN_RATE_LIMIT_TPM > 0:
+            limits['tokens'] = settings.CARE_PLAN_RATE_LIMIT_TPM
+        return limits
+    def _connect(self) -> sqlite3.Connection:
+        path = self.db_path
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        if str(path) not in self._initialized:
+            with self._lock:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+                )
+                self._initialized.add(str(path))
+        return connection
+    def try_acquire(self, requests: int = 1, tokens: int = 0) -> float:
+        limits = self._limits()
+        wanted = {'requests': requests, 'tokens': tokens}
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            levels = {}
+            for name, per_minute in limits.items():
+                row = connection.execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+                if row is None:
+                    level = float(per_minute)
+                else:
+                    level = min(float(per_minute), row[0] + (now - row[1]) * per_minute / 60.0)
+                levels[name] = level
+            wait = 0.0
+            for name, per_minute in limits.items():
+                needed = min(wanted[name], per_minute)
+                if levels[name] < needed:
+                    wait = max(wait, (needed - levels[name]) * 60.0 / per_minute)
+            if wait == 0.0:
+                for name in limits:
+                    levels[name] -= wanted[name]
+            for name, level in levels.items():
+                connection.execute(
+                    "INSERT INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                    (name, level, now)
+                )
+            connection.execute("COMMIT")
+            return wait
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+    def acquire(self, requests: int = 1, tokens: int = 0) -> float:
+        if not self.enabled:
+            return 0.0
+        started = time.monotonic()
+        deadline = started + settings.CARE_PLAN_RATE_LIMIT_MAX_WAIT_SECONDS
+        while True:
+            wait = self.try_acquire(requests, tokens)
+            if wait == 0.0:
+                waited = time.monotonic() - started
+                if waited > 0.5:
+                    logger.info(f"Waited {waited:.1f}s for OpenAI rate limit capacity - tokens: {tokens}")
+                return waited
+            if time.monotonic() + wait > deadline:
+                logger.warning(f"Rate limit wait would exceed {settings.CARE_PLAN_RATE_LIMIT_MAX_WAIT_SECONDS}s, proceeding without capacity")
+                return time.monotonic() - started
+            time.sleep(min(wait, 5.0))
+    async def aacquire(self, requests: int = 1, tokens: int = 0) -> float:
+        if not self.enabled:
+            return 0.0
+        started = time.monotonic()
+        deadline = started + settings.CARE_PLAN_RATE_LIMIT_MAX_WAIT_SECONDS
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire, requests, tokens)
+            if wait == 0.0:
+                return time.monotonic() - started
+            if time.monotonic() + wait > deadline:
+                logger.warning(f"Rate limit wait would exceed {settings.CARE_PLAN_RATE_LIMIT_MAX_WAIT_SECONDS}s, proceeding without capacity")
+                return time.monotonic() - started
+            await asyncio.sleep(min(wait, 5.0))
+    def record_usage(self, estimated_tokens: int, actual_tokens: int) -> None:
+        if settings.CARE_PLAN_RATE_LIMIT_TPM <= 0 or actual_tokens == estimated_tokens:
+            return
+        connection = self._connect()
+        try:
+            connection.execute(
+                "UPDATE buckets SET tokens = tokens - ? WHERE name = 'tokens'",
+                (actual_tokens - estimated_tokens,)
+            )
+        finally:
+            connection.close()
+    def reset(self) -> None:
+        connection = self._connect()
+        try:
+            connection.execute("DELETE FROM buckets")
+        finally:
+            connection.close()
+openai_rate_limiter = SharedRateLimiter()
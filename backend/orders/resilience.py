@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Optional
+import openai
+from django.conf import settings
+from .rate_limit import openai_rate_limiter
+logger = logging.getLogger('orders')
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    TimeoutError,
+)
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"LLM upstream is degraded, circuit open for another {retry_after:.0f}s")
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    def __init__(self, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+    @property
+    def failure_threshold(self) -> int:
+        if self._failure_threshold is not None:
+            return self._failure_threshold
+        return settings.CARE_PLAN_CIRCUIT_FAILURE_THRESHOLD
+    @property
+    def reset_timeout(self) -> float:
+        if self._reset_timeout is not None:
+            return self._reset_timeout
+        return settings.CARE_PLAN_CIRCUIT_RESET_SECONDS
+    def before_call(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN:
+                elapsed = time.monotonic() - self.opened_at
+                if elapsed < self.reset_timeout:
+                    raise CircuitOpenError(self.reset_timeout - elapsed)
+                logger.info("LLM circuit half-open, allowing a trial call")
+                self.state = self.HALF_OPEN
+            elif self.state == self.HALF_OPEN and self._probing:
+                raise CircuitOpenError(self.reset_timeout)
+            self._probing = self.state == self.HALF_OPEN
+            return self._probing
+    def release_probe(self) -> None:
+        with self._lock:
+            self._probing = False
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("LLM circuit closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"LLM circuit opened after {self.failures} consecutive failure(s)")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+    def reset(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = 0.0
+            self._probing = False
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+    def percentile(self, fraction: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < max(min_samples, 1):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+llm_circuit_breaker = CircuitBreaker()
+llm_latency_tracker = LatencyTracker()
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=settings.CARE_PLAN_LLM_HEDGE_WORKERS, thread_name_prefix='llm-hedge')
+    return _hedge_executor
+def backoff_delay(attempt: int, error: Exception = None) -> float:
+    delay = random.uniform(0, min(settings.CARE_PLAN_LLM_BACKOFF_MAX_SECONDS, settings.CARE_PLAN_LLM_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay
+def _hedge_delay() -> Optional[float]:
+    if not settings.CARE_PLAN_LLM_HEDGING_ENABLED:
+        return None
+    return llm_latency_tracker.percentile(0.95, settings.CARE_PLAN_LLM_HEDGE_MIN_SAMPLES)
+def _reserve(tokens: int) -> None:
+    openai_rate_limiter.acquire(tokens=tokens)
+def _try_reserve(tokens: int) -> bool:
+    return not openai_rate_limiter.enabled or openai_rate_limiter.try_acquire(tokens=tokens) == 0.0
+def _timed(fn: Callable[[float], Any], timeout: float) -> tuple[Any, float]:
+    started = time.monotonic()
+    result = fn(timeout)
+    return result, time.monotonic() - started
+def _hedged_attempt(fn: Callable[[float], Any], timeout: float, hedge_delay: Optional[float], tokens: int = 0) -> Any:
+    if hedge_delay is None:
+        result, elapsed = _timed(fn, timeout)
+        llm_latency_tracker.record(elapsed)
+        return result
+    executor = _get_hedge_executor()
+    started = threading.Event()
+    def primary(timeout: float) -> Any:
+        started.set()
+        return fn(timeout)
+    pending = {executor.submit(_timed, primary, timeout)}
+    started.wait()
+    done, _ = wait(pending, timeout=hedge_delay)
+    if not done:
+        if _try_reserve(tokens):
+            logger.info(f"LLM call exceeded p95 ({hedge_delay:.1f}s), starting hedged request")
+            pending.add(executor.submit(_timed, fn, timeout))
+        else:
+            logger.info(f"LLM call exceeded p95 ({hedge_delay:.1f}s), no rate limit capacity for a hedged request")
+    # A running thread cannot be cancelled, so the losing request keeps its
+    # pool thread until the SDK timeout and its result is discarded. Only the
+    # winner's latency is recorded so losers do not skew the p95.
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                result, elapsed = future.result()
+                llm_latency_tracker.record(elapsed)
+                return result
+            error = future.exception()
+    raise error
+def call_with_resilience(fn: Callable[[float], Any], hedge: bool = True, tokens: int = 0) -> Any:
+    timeout = settings.CARE_PLAN_LLM_TIMEOUT_SECONDS
+    max_retries = settings.CARE_PLAN_LLM_MAX_RETRIES
+    attempt = 0
+    while True:
+        probe = llm_circuit_breaker.before_call()
+        try:
+            _reserve(tokens)
+            result = _hedged_attempt(fn, timeout, _hedge_delay() if hedge else None, tokens)
+        except RETRYABLE_ERRORS as e:
+            llm_circuit_breaker.record_failure()
+            if attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt, e)
+            logger.warning(f"LLM attempt {attempt + 1} failed ({type(e).__name__}: {str(e)}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except BaseException:
+            if probe:
+                llm_circuit_breaker.release_probe()
+            raise
+        llm_circuit_breaker.record_success()
+        return result
+async def _atimed(fn: Callable[[float], Awaitable[Any]], timeout: float) -> Any:
+    started = time.monotonic()
+    try:
+        result = await asyncio.wait_for(fn(timeout), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"LLM call timed out after {timeout}s")
+    llm_latency_tracker.record(time.monotonic() - started)
+    return result
+async def _ahedged_attempt(fn: Callable[[float], Awaitable[Any]], timeout: float, hedge_delay: Optional[float], tokens: int = 0) -> Any:
+    if hedge_delay is None:
+        return await _atimed(fn, timeout)
+    pending = {asyncio.ensure_future(_atimed(fn, timeout))}
+    done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+    if not done:
+        if await asyncio.to_thread(_try_reserve, tokens):
+            logger.info(f"LLM call exceeded p95 ({hedge_delay:.1f}s), starting hedged request")
+            pending.add(asyncio.ensure_future(_atimed(fn, timeout)))
+        else:
+            logger.info(f"LLM call exceeded p95 ({hedge_delay:.1f}s), no rate limit capacity for a hedged request")
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for loser in pending:
+            loser.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+async def acall_with_resilience(fn: Callable[[float], Awaitable[Any]], hedge: bool = True, tokens: int = 0) -> Any:
+    timeout = settings.CARE_PLAN_LLM_TIMEOUT_SECONDS
+    max_retries = settings.CARE_PLAN_LLM_MAX_RETRIES
+    attempt = 0
+    while True:
+        probe = llm_circuit_breaker.before_call()
+        try:
+            await openai_rate_limiter.aacquire(tokens=tokens)
+            result = await _ahedged_attempt(fn, timeout, _hedge_delay() if hedge else None, tokens)
+        except RETRYABLE_ERRORS as e:
+            llm_circuit_breaker.record_failure()
+            if attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt, e)
+            logger.warning(f"LLM attempt {attempt + 1} failed ({type(e).__name__}: {str(e)}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        except BaseException:
+            if probe:
+                llm_circuit_breaker.release_probe()
+            raise
+        llm_circuit_breaker.record_success()
+        return result
@@ -1,5 +1,8 @@
+from django.conf import settings
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Patient, Provider, Order
+from .llm import CACHE_COALESCED, CACHE_HIT, CACHE_MISS
+from .models import Patient, Provider, Order, CarePlanJob, ExportJob
 import re
 class OrderCreateSerializer(serializers.Serializer):
     patient_first_name = serializers.CharField()
@@ -32,6 +35,13 @@ class OrderCreateSerializer(serializers.Serializer):
         if not re.match(r'^[A-Z]\d{2}(\.\d{1,2})?$', value):
             raise serializers.ValidationError('Invalid ICD-10 code format. Expected format: Letter + 2 digits + optional .digit(s) (e.g., G70.00)')
         return value
+class OrderBatchSerializer(serializers.Serializer):
+    orders = OrderCreateSerializer(many=True, allow_empty=False)
+    def validate_orders(self, value):
+        max_size = self.context.get('max_size', settings.CARE_PLAN_BATCH_MAX_SIZE)
+        if len(value) > max_size:
+            raise serializers.ValidationError(f'A batch may contain at most {max_size} orders')
+        return value
 class OrderResponseSerializer(serializers.ModelSerializer):
     patient_mrn = serializers.CharField(source='patient.mrn', read_only=True)
     provider_npi = serializers.CharField(source='provider.npi', read_only=True)
@@ -45,4 +55,30 @@ class ValidationResponseSerializer(serializers.Serializer):
     )
 class CarePlanResponseSerializer(serializers.Serializer):
     care_plan = serializers.CharField()
-    order_id = serializers.IntegerField()
\ No newline at end of file
+    order_id = serializers.IntegerField()
+    cache_hit = serializers.BooleanField(required=False, default=False)
+    cache_status = serializers.ChoiceField(choices=[CACHE_HIT, CACHE_COALESCED, CACHE_MISS], required=False, default=CACHE_MISS)
+class CarePlanJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='id', read_only=True)
+    order_id = serializers.IntegerField(source='order.id', read_only=True, default=None)
+    care_plan = serializers.SerializerMethodField()
+    class Meta:
+        model = CarePlanJob
+        fields = ['job_id', 'status', 'order_id', 'care_plan', 'error', 'created_at', 'started_at', 'finished_at']
+    def get_care_plan(self, obj):
+        if obj.status == CarePlanJob.STATUS_SUCCEEDED and obj.order is not None:
+            return obj.order.care_plan
+        return None
+class ExportJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='id', read_only=True)
+    download_url = serializers.SerializerMethodField()
+    class Meta:
+        model = ExportJob
+        fields = [
+            'job_id', 'format', 'status', 'filters', 'filename', 'row_count', 'file_size', 'checksum', 'error',
+            'download_url', 'created_at', 'started_at', 'finished_at', 'expires_at'
+        ]
+    def get_download_url(self, obj):
+        if obj.status == ExportJob.STATUS_SUCCEEDED:
+            return reverse('download_export_job', args=[obj.id])
+        return None
@@ -0,0 +1,200 @@
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from .models import Patient, PatientBlockingKey, Provider, Order, OrderDiagnosis, OrderDailyRollup
+from .llm import CACHE_HIT, generate_care_plan_cached, agenerate_care_plan_cached
+from .normalize import normalize_provider_name
+from .presence import known_mrns, known_npis
+logger = logging.getLogger('orders')
+def touch_orders(**filters) -> int:
+    return Order.objects.filter(**filters).update(updated_at=timezone.now())
+def upsert_patient(data) -> Patient:
+    patient, created = Patient.objects.get_or_create(
+        mrn=data['patient_mrn'],
+        defaults={
+            'first_name': data['patient_first_name'],
+            'last_name': data['patient_last_name']
+        }
+    )
+    if created:
+        logger.info(f"New patient created - MRN: {patient.mrn}, Name: {patient.first_name} {patient.last_name}")
+    if patient.first_name != data['patient_first_name'] or patient.last_name != data['patient_last_name']:
+        logger.info(f"Updating patient names - MRN: {patient.mrn}")
+        patient.first_name = data['patient_first_name']
+        patient.last_name = data['patient_last_name']
+        patient.save()
+        touch_orders(patient=patient)
+    return patient
+def upsert_provider(data) -> Provider:
+    try:
+        provider = Provider.objects.get(npi=data['provider_npi'])
+        logger.debug(f"Existing provider found - NPI: {provider.npi}, Name: {provider.name}")
+        if provider.name_normalized != normalize_provider_name(data['provider_name']):
+            logger.info(f"Updating provider name - NPI: {provider.npi}, Old: {provider.name}, New: {data['provider_name']}")
+            provider.name = data['provider_name']
+            provider.save()
+            touch_orders(provider=provider)
+    except Provider.DoesNotExist:
+        logger.info(f"New provider created - NPI: {data['provider_npi']}, Name: {data['provider_name']}")
+        provider = Provider.objects.create(
+            npi=data['provider_npi'],
+            name=data['provider_name']
+        )
+    return provider
+def create_order(data) -> Order:
+    patient = upsert_patient(data)
+    provider = upsert_provider(data)
+    order = Order.objects.create(
+        patient=patient,
+        provider=provider,
+        primary_diagnosis=data['primary_diagnosis'],
+        additional_diagnoses=data.get('additional_diagnoses', []),
+        medication_name=data['medication_name'],
+        medication_history=data.get('medication_history', []),
+        patient_records=data['patient_records'],
+    )
+    logger.info(f"Order created - ID: {order.id}, Patient MRN: {patient.mrn}, Medication: {data['medication_name']}")
+    return order
+acreate_order = sync_to_async(create_order)
+def upsert_patients_bulk(items) -> dict:
+    latest = {}
+    for data in items:
+        latest[data['patient_mrn']] = data
+    patients = Patient.objects.in_bulk(list(latest), field_name='mrn')
+    new_patients = [
+        Patient(mrn=mrn, first_name=data['patient_first_name'], last_name=data['patient_last_name'])
+        for mrn, data in latest.items() if mrn not in patients
+    ]
+    changed = []
+    for mrn, patient in patients.items():
+        data = latest[mrn]
+        if patient.first_name != data['patient_first_name'] or patient.last_name != data['patient_last_name']:
+            patient.first_name = data['patient_first_name']
+            patient.last_name = data['patient_last_name']
+            patient.updated_at = timezone.now()
+            changed.append(patient)
+    if new_patients:
+        Patient.objects.bulk_create(new_patients)
+        known_mrns.add(patient.mrn for patient in new_patients)
+        logger.info(f"Bulk created {len(new_patients)} patient(s)")
+    if changed:
+        Patient.objects.bulk_update(changed, ['first_name', 'last_name', 'updated_at'])
+        touch_orders(patient__in=changed)
+        logger.info(f"Bulk updated names for {len(changed)} patient(s)")
+    patients = Patient.objects.in_bulk(list(latest), field_name='mrn')
+    PatientBlockingKey.sync(patients[patient.mrn] for patient in new_patients + changed)
+    return patients
+def upsert_providers_bulk(items) -> dict:
+    latest = {}
+    for data in items:
+        latest[data['provider_npi']] = data
+    providers = Provider.objects.in_bulk(list(latest), field_name='npi')
+    new_providers = [
+        Provider(npi=npi, name=data['provider_name'], name_normalized=normalize_provider_name(data['provider_name']))
+        for npi, data in latest.items() if npi not in providers
+    ]
+    changed = []
+    for npi, provider in providers.items():
+        name = latest[npi]['provider_name']
+        if provider.name_normalized != normalize_provider_name(name):
+            provider.name = name
+            provider.name_normalized = normalize_provider_name(name)
+            changed.append(provider)
+    if new_providers:
+        Provider.objects.bulk_create(new_providers)
+        known_npis.add(provider.npi for provider in new_providers)
+        logger.info(f"Bulk created {len(new_providers)} provider(s)")
+    if changed:
+        Provider.objects.bulk_update(changed, ['name', 'name_normalized'])
+        touch_orders(provider__in=changed)
+        logger.info(f"Bulk updated names for {len(changed)} provider(s)")
+    return Provider.objects.in_bulk(list(latest), field_name='npi')
+def create_orders_bulk(items) -> list[Order]:
+    with transaction.atomic():
+        patients = upsert_patients_bulk(items)
+        providers = upsert_providers_bulk(items)
+        orders = Order.objects.bulk_create([
+            Order(
+                patient=patients[data['patient_mrn']],
+                provider=providers[data['provider_npi']],
+                primary_diagnosis=data['primary_diagnosis'],
+                additional_diagnoses=data.get('additional_diagnoses', []),
+                medication_name=data['medication_name'],
+                medication_history=data.get('medication_history', []),
+                patient_records=data['patient_records'],
+            )
+            for data in items
+        ])
+        OrderDiagnosis.objects.bulk_create([row for order in orders for row in order.diagnosis_rows()])
+        OrderDailyRollup.record_orders(orders)
+        for order in orders:
+            order.remember_rollup_state()
+    logger.info(f"Bulk created {len(orders)} order(s): {', '.join(str(o.id) for o in orders)}")
+    return orders
+def care_plan_inputs(order: Order) -> dict:
+    return {
+        'patient_records': order.patient_records,
+        'primary_diagnosis': order.primary_diagnosis,
+        'medication_name': order.medication_name,
+        'additional_diagnoses': order.additional_diagnoses or [],
+        'medication_history': order.medication_history or [],
+        'patient_first_name': order.patient.first_name,
+        'patient_last_name': order.patient.last_name,
+        'patient_mrn': order.patient.mrn,
+    }
+def save_care_plan(order: Order, care_plan: str) -> Order:
+    order.care_plan = care_plan
+    order.care_plan_generated_at = timezone.now()
+    order.save(update_fields=['care_plan', 'care_plan_generated_at', 'updated_at'])
+    logger.info(f"Care plan generated successfully for order ID: {order.id}, length: {len(care_plan)} chars")
+    return order
+def generate_for_order(order: Order) -> tuple[str, str]:
+    logger.info(f"Starting LLM care plan generation for order ID: {order.id}")
+    care_plan, cache_status = generate_care_plan_cached(**care_plan_inputs(order))
+    save_care_plan(order, care_plan)
+    return care_plan, cache_status
+async def agenerate_for_order(order: Order) -> tuple[str, str]:
+    logger.info(f"Starting async LLM care plan generation for order ID: {order.id}")
+    care_plan, cache_status = await agenerate_care_plan_cached(**care_plan_inputs(order))
+    await sync_to_async(save_care_plan)(order, care_plan)
+    return care_plan, cache_status
+def _generate_batch_item(order: Order, pooled: bool) -> dict:
+    if pooled:
+        close_old_connections()
+    try:
+        care_plan, cache_status = generate_for_order(order)
+        return {
+            "order_id": order.id,
+            "status": "succeeded",
+            "care_plan": care_plan,
+            "cache_hit": cache_status == CACHE_HIT,
+            "cache_status": cache_status,
+        }
+    except Exception as e:
+        logger.error(f"Failed to generate care plan for order ID: {order.id}, error: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        order_id = order.id
+        order.delete()
+        logger.info(f"Order {order_id} deleted due to care plan generation failure")
+        return {
+            "order_id": None,
+            "status": "failed",
+            "detail": f"Failed to generate care plan: {str(e)}",
+        }
+    finally:
+        if pooled:
+            close_old_connections()
+def generate_for_orders(orders: list[Order], concurrency: int) -> list[dict]:
+    concurrency = max(1, min(concurrency, len(orders)))
+    logger.info(f"Generating {len(orders)} care plan(s) with concurrency {concurrency}")
+    if concurrency == 1:
+        results = [_generate_batch_item(order, False) for order in orders]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='care-plan-batch') as executor:
+            results = list(executor.map(lambda order: _generate_batch_item(order, True), orders))
+    for index, result in enumerate(results):
+        result["index"] = index
+    return results
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+logger = logging.getLogger('orders')
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+    def do(self, key: str, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        if not leader:
+            logger.info(f"Joining in-flight care plan generation - key: {key[:12]}")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+class AsyncSingleFlight:
+    def __init__(self):
+        self._tasks = {}
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        task = self._tasks.get(key)
+        if task is not None:
+            logger.info(f"Joining in-flight care plan generation - key: {key[:12]}")
+            return await asyncio.shield(task), True
+        task = asyncio.ensure_future(fn())
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task), False
+    def in_flight(self) -> int:
+        return len(self._tasks)
+def _same_file(handle, path: Path) -> bool:
+    try:
+        return os.fstat(handle.fileno()).st_ino == path.stat().st_ino
+    except FileNotFoundError:
+        return False
+def _try_lock(path: Path):
+    handle = open(path, 'a')
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return None
+    if not _same_file(handle, path):
+        handle.close()
+        return None
+    return handle
+@contextmanager
+def file_lock(lock_dir, name: str, timeout: float, poll_interval: float = 0.1):
+    if fcntl is None:
+        yield False
+        return
+    lock_dir = Path(lock_dir)
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    path = lock_dir / f"{name}.lock"
+    deadline = time.monotonic() + timeout
+    handle = _try_lock(path)
+    while handle is None and time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        handle = _try_lock(path)
+    if handle is None:
+        logger.warning(f"Timed out after {timeout}s waiting for lock {name[:12]}")
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        os.utime(path)
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        handle.close()
+def prune_lock_files(lock_dir, max_age: float) -> int:
+    lock_dir = Path(lock_dir)
+    if fcntl is None or not lock_dir.exists():
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for path in lock_dir.glob('*.lock'):
+        try:
+            if path.stat().st_mtime >= cutoff:
+                continue
+            handle = _try_lock(path)
+        except FileNotFoundError:
+            continue
+        if handle is None:
+            continue
+        try:
+            path.unlink()
+            removed += 1
+        finally:
+            handle.close()
+    return removed
@@ -1,10 +1,51 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, AsyncRequestFactory, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from datetime import datetime, timedelta
+from unittest.mock import patch, AsyncMock
+import asyncio
+import hashlib
+import os
+from importlib import import_module
+from io import BytesIO, StringIO
+from django.apps import apps as django_apps
+from django.core.management import call_command
 import json
-from .models import Patient, Provider, Order
+from openpyxl import load_workbook
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipUnless
+from .models import Patient, PatientBlockingKey, Provider, Order, OrderDiagnosis, OrderDailyRollup, CarePlanJob, CarePlanCacheEntry, ExportJob
 from .duplicate_checker import DuplicateChecker, DuplicateWarning
-from .export import export_to_csv, export_to_excel, get_orders_for_export, get_export_filename
+from .export import (
+    columnar_export_available, export_to_csv, export_to_excel, get_orders_for_export,
+    get_export_filename, stream_csv, write_columnar
+)
+from .llm import clean_care_plan, CarePlanStreamCleaner, care_plan_cache_key, generate_care_plan_cached, stream_care_plan
+from .cache import LRUCache, care_plan_cache, export_render_cache
+from .services import create_order, create_orders_bulk, save_care_plan, upsert_patient, upsert_provider
+from .jobs import run_care_plan_job
+from .normalize import name_similarity, patient_blocking_keys, soundex
+from .presence import BloomFilter, known_mrns, known_npis
+from .singleflight import SingleFlight, AsyncSingleFlight, file_lock
+from . import views
+from .prompt_compaction import compact_patient_records, count_tokens, drop_duplicates, normalize_whitespace
+from .llm import (
+    build_care_plan_messages, build_care_plan_section_messages, generate_care_plan,
+    generate_care_plan_sections, agenerate_care_plan_sections
+)
+from .rate_limit import SharedRateLimiter
+from .resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    acall_with_resilience,
+    call_with_resilience,
+    llm_circuit_breaker,
+    llm_latency_tracker
+)
 
 
 class PatientModelTest(TestCase):
@@ -71,6 +112,25 @@ class ProviderModelTest(TestCase):
             provider = Provider(npi="123456789")
             provider.save()
 
+    def test_provider_name_normalized_on_save(self):
+        self.assertEqual(self.provider.name_normalized, "dr alice johnson")
+        self.provider.name = "  DR. ALICE   Johnson-Smith "
+        self.provider.save(update_fields=['name'])
+        self.provider.refresh_from_db()
+        self.assertEqual(self.provider.name_normalized, "dr alice johnson smith")
+
+    def test_upsert_provider_ignores_formatting_only_name_changes(self):
+        provider = upsert_provider({'provider_npi': "1234567890", 'provider_name': "DR ALICE JOHNSON"})
+        self.assertEqual(provider.name, "Dr. Alice Johnson")
+        provider = upsert_provider({'provider_npi': "1234567890", 'provider_name': "Dr. Alicia Johnson"})
+        self.assertEqual(Provider.objects.get(npi="1234567890").name_normalized, "dr alicia johnson")
+
+    def test_provider_name_lookup_uses_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN SELECT id FROM providers WHERE name_normalized = %s", ["dr alice johnson"])
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn("INDEX providers_name_no", plan)
+
 
 class OrderModelTest(TestCase):
     def setUp(self):
@@ -108,6 +168,29 @@ class OrderModelTest(TestCase):
         self.patient.delete()
         self.assertEqual(Order.objects.count(), 0)
 
+    def test_diagnosis_index_synced_on_create(self):
+        rows = sorted(self.order.diagnoses.values_list('icd10_code', 'is_primary'))
+        self.assertEqual(rows, [("G70.00", True), ("I10", False), ("K21.9", False)])
+
+    def test_diagnosis_index_synced_on_update(self):
+        self.order.additional_diagnoses = ["E11.9", "G70.00"]
+        self.order.save()
+        rows = sorted(self.order.diagnoses.values_list('icd10_code', 'is_primary'))
+        self.assertEqual(rows, [("E11.9", False), ("G70.00", True)])
+
+    def test_diagnosis_index_untouched_by_care_plan_update(self):
+        ids = set(self.order.diagnoses.values_list('id', flat=True))
+        self.order.care_plan = "Updated"
+        self.order.save(update_fields=['care_plan'])
+        self.assertEqual(set(self.order.diagnoses.values_list('id', flat=True)), ids)
+
+    def test_diagnosis_backfill_migration(self):
+        backfill = import_module('orders.migrations.0006_order_diagnosis').backfill_order_diagnoses
+        OrderDiagnosis.objects.all().delete()
+        backfill(django_apps, None)
+        self.assertEqual(OrderDiagnosis.objects.filter(order=self.order).count(), 3)
+        self.assertTrue(OrderDiagnosis.objects.get(order=self.order, icd10_code="G70.00").is_primary)
+
 
 class DuplicateCheckerTest(TestCase):
     def setUp(self):
@@ -156,6 +239,13 @@ class DuplicateCheckerTest(TestCase):
         self.assertEqual(warning.warning_type, "duplicate_provider_npi_mismatch")
         self.assertEqual(warning.severity, "error")
 
+    def test_check_duplicate_provider_normalizes_name(self):
+        Provider.objects.create(name="dr alice johnson", npi="5555555555")
+        warning = DuplicateChecker.check_duplicate_provider("Dr.  Alice  JOHNSON", "9999999999")
+        self.assertEqual(warning.warning_type, "duplicate_provider_npi_mismatch")
+        self.assertEqual(warning.existing_record["npi"], "1234567890")
+        self.assertEqual(DuplicateChecker.check_duplicate_provider("DR ALICE JOHNSON", "1234567890").existing_record["npi"], "5555555555")
+
     def test_check_duplicate_provider_not_exists(self):
         warning = DuplicateChecker.check_duplicate_provider("Dr. New Provider", "9999999999")
         self.assertIsNone(warning)
@@ -172,6 +262,41 @@ class DuplicateCheckerTest(TestCase):
         warning = DuplicateChecker.check_duplicate_order("123456", "IVIG (Privigen)")
         self.assertIsNone(warning)
 
+    def duplicate_order_plan(self, medication_name):
+        with CaptureQueriesContext(connection) as queries:
+            DuplicateChecker.check_duplicate_order("123456", medication_name)
+        sql = queries.captured_queries[0]['sql']
+        self.assertNotIn('"care_plan"', sql)
+        self.assertNotIn('"patient_records"', sql)
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return sql, ' '.join(str(row) for row in cursor.fetchall())
+
+    def test_check_duplicate_order_uses_covering_index(self):
+        sql, plan = self.duplicate_order_plan("IVIG (Privigen)")
+        self.assertIn('"medication_name" =', sql)
+        self.assertIn("COVERING INDEX orders_patient_ad473c_idx", plan)
+        with override_settings(CARE_PLAN_MEDICATION_MATCH_IGNORE_CASE=True):
+            sql, plan = self.duplicate_order_plan("IVIG (Privigen)")
+        self.assertNotIn('"medication_name" =', sql)
+        self.assertIn("COVERING INDEX orders_patient_499528_idx", plan)
+
+    def test_check_duplicate_order_window_and_medication_normalization(self):
+        self.assertIsNotNone(DuplicateChecker.check_duplicate_order("123456", "IVIG (Privigen)"))
+        self.assertIsNone(DuplicateChecker.check_duplicate_order("123456", "ivig (privigen)"))
+        self.assertIsNone(DuplicateChecker.check_duplicate_order("123456", "IVIG  (Privigen)"))
+        self.assertIsNone(DuplicateChecker.check_duplicate_order("123456", "IVIG (Privigen) 10 g"))
+        with override_settings(CARE_PLAN_MEDICATION_MATCH_IGNORE_CASE=True):
+            self.assertIsNotNone(DuplicateChecker.check_duplicate_order("123456", "ivig  (PRIVIGEN)"))
+        with override_settings(CARE_PLAN_MEDICATION_MATCH_IGNORE_STRENGTH=True):
+            warning = DuplicateChecker.check_duplicate_order("123456", "IVIG (Privigen) 0.4 g/kg")
+            self.assertEqual(warning.existing_record["orders"][0]["order_id"], self.order.id)
+        Order.objects.filter(id=self.order.id).update(created_at=timezone.now() - timedelta(hours=30))
+        self.assertIsNone(DuplicateChecker.check_duplicate_order("123456", "IVIG (Privigen)"))
+        with override_settings(CARE_PLAN_DUPLICATE_ORDER_WINDOW_HOURS=48):
+            warning = DuplicateChecker.check_duplicate_order("123456", "IVIG (Privigen)")
+            self.assertIn("within the last 48 hours", warning.message)
+
     def test_check_duplicate_order_different_medication(self):
         warning = DuplicateChecker.check_duplicate_order("123456", "Different Medication")
         self.assertIsNone(warning)
@@ -204,6 +329,47 @@ class DuplicateCheckerTest(TestCase):
         self.assertFalse(result["valid"])
         self.assertGreater(len(result["errors"]), 0)
 
+    def test_validate_orders_matches_single_validation_in_constant_queries(self):
+        items = [
+            {"patient_first_name": "John", "patient_last_name": "Doe", "patient_mrn": "123456",
+             "provider_name": "Dr. Alice Johnson", "provider_npi": "1234567890", "medication_name": "IVIG (Privigen)"},
+            {"patient_first_name": "Jane", "patient_last_name": "Smith", "patient_mrn": "123456",
+             "provider_name": "DR. ALICE JOHNSON", "provider_npi": "9999999999", "medication_name": "Other"},
+            {"patient_first_name": "New", "patient_last_name": "Patient", "patient_mrn": "999999",
+             "provider_name": "Dr. Different Name", "provider_npi": "1234567890", "medication_name": "IVIG (Privigen)"},
+            {"patient_first_name": "Jon", "patient_last_name": "Doe", "patient_mrn": "777777",
+             "provider_name": "Dr. Alice Johnson", "provider_npi": "1234567890", "medication_name": "Other"},
+        ]
+        expected = [DuplicateChecker.validate_order(**item) for item in items]
+        with CaptureQueriesContext(connection) as queries:
+            results = DuplicateChecker.validate_orders(items * 50)
+        self.assertEqual(len(queries), 6)
+        self.assertEqual(results, expected * 50)
+        self.assertEqual(results[0]["warnings"][1]["existing_record"]["orders"][0]["order_id"], self.order.id)
+        self.assertEqual(results[1]["errors"][1]["type"], "duplicate_provider_npi_mismatch")
+        self.assertEqual(results[3]["warnings"][0]["type"], "possible_duplicate_patient")
+
+    def test_validate_batch_endpoint(self):
+        payload = [
+            {**ORDER_PAYLOAD},
+            {**ORDER_PAYLOAD, "patient_mrn": "123456"},
+        ]
+        response = self.client.post('/api/orders/validate/batch', data=json.dumps({"orders": payload}), content_type='application/json')
+        self.assertEqual(response.status_code, 207)
+        data = response.json()
+        self.assertEqual((data["total"], data["valid"], data["invalid"]), (2, 1, 1))
+        self.assertEqual([r["index"] for r in data["results"]], [0, 1])
+        self.assertEqual(data["results"][1]["errors"][0]["type"], "duplicate_patient_name_mismatch")
+        response = self.client.post('/api/orders/validate/batch', data=json.dumps([ORDER_PAYLOAD]), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/api/orders/validate/batch', data=json.dumps([{"patient_mrn": "12"}]), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_validate_batch_rejects_scalar_body(self):
+        for body in (5, "abc", None):
+            response = self.client.post('/api/orders/validate/batch', data=json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
 
 class ExportTest(TestCase):
     def setUp(self):
@@ -246,6 +412,13 @@ class ExportTest(TestCase):
         orders = get_orders_for_export(provider_npi="1234567890")
         self.assertEqual(len(orders), 2)
 
+    def test_get_orders_for_export_filters_additional_diagnosis_in_sql(self):
+        self.order2.additional_diagnoses = ["E11.9"]
+        self.order2.save()
+        with self.assertNumQueries(1):
+            orders = get_orders_for_export(diagnosis="E11.9")
+        self.assertEqual([order.id for order in orders], [self.order2.id])
+
     def test_get_orders_for_export_with_diagnosis_filter(self):
         orders = get_orders_for_export(diagnosis="G70.00")
         self.assertGreaterEqual(len(orders), 1)
@@ -263,11 +436,38 @@ class ExportTest(TestCase):
         self.assertIn("Yes", csv_content)
         self.assertIn("No", csv_content)
 
+    def test_stream_csv_yields_header_then_rows(self):
+        chunks = list(stream_csv(chunk_size=1))
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(chunks[0].startswith("Order ID,Order Date"))
+        self.assertTrue(chunks[1].startswith(f"{self.order2.id},"))
+        self.assertEqual(''.join(chunks), export_to_csv())
+
+    def test_stream_csv_diagnosis_filter_matches_additional_diagnoses(self):
+        self.order2.additional_diagnoses = ["G70.00"]
+        self.order2.save()
+        self.assertEqual(len(list(stream_csv(diagnosis="G70.00"))), 3)
+        self.assertEqual(len(list(stream_csv(diagnosis="I10"))), 2)
+
     def test_export_to_excel(self):
         excel_content = export_to_excel()
         self.assertIsInstance(excel_content, bytes)
         self.assertGreater(len(excel_content), 0)
 
+    def test_export_to_excel_contents_and_widths(self):
+        wb = load_workbook(BytesIO(export_to_excel()))
+        ws = wb["Care Plans Export"]
+        rows = list(ws.iter_rows(values_only=True))
+        self.assertEqual(rows[0][0], "Order ID")
+        self.assertTrue(ws["A1"].font.bold)
+        self.assertEqual([row[0] for row in rows[1:3]], [self.order2.id, self.order1.id])
+        self.assertEqual(rows[1][11], "No")
+        self.assertEqual(rows[2][13], len("Test care plan"))
+        self.assertEqual(rows[4][:2], ("Total Orders:", 2))
+        self.assertEqual(rows[5][:2], ("Care Plans Generated:", 1))
+        self.assertEqual(ws.column_dimensions["F"].width, len("Dr. Alice Johnson") + 2)
+        self.assertEqual(ws.column_dimensions["H"].width, len("Primary Diagnosis (ICD-10)") + 2)
+
     def test_get_export_filename_no_dates(self):
         filename = get_export_filename("csv")
         self.assertIn("care_plans_export", filename)
@@ -362,6 +562,9 @@ class ViewsTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'text/csv')
         self.assertIn('attachment', response['Content-Disposition'])
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn("Test Medication", content)
 
     def test_export_orders_excel(self):
         Order.objects.create(
@@ -376,6 +579,72 @@ class ViewsTest(TestCase):
         self.assertIn('spreadsheetml.sheet', response['Content-Type'])
         self.assertIn('attachment', response['Content-Disposition'])
 
+    def test_get_orders_filters_by_any_diagnosis(self):
+        Order.objects.create(
+            patient=self.patient,
+            provider=self.provider,
+            primary_diagnosis="G70.00",
+            additional_diagnoses=["I10"],
+            medication_name="Test Medication",
+            patient_records="Test records"
+        )
+        Order.objects.create(
+            patient=self.patient,
+            provider=self.provider,
+            primary_diagnosis="E11.9",
+            medication_name="Metformin",
+            patient_records="Test records"
+        )
+        response = self.client.get('/api/orders/?diagnosis=I10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order['medication_name'] for order in response.json()], ["Test Medication"])
+
+    def create_care_plan_orders(self, count):
+        other = Provider.objects.create(name="Dr. Bob Lee", npi="2222222222")
+        return [
+            Order.objects.create(
+                patient=self.patient,
+                provider=other if i % 2 else self.provider,
+                primary_diagnosis="G70.00",
+                medication_name=f"Medication {i}",
+                patient_records="Test records",
+                care_plan=f"Plan {i}"
+            )
+            for i in range(count)
+        ]
+
+    def test_export_all_care_plans_json_without_n_plus_one(self):
+        self.create_care_plan_orders(4)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/orders/export/all')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_orders'], 4)
+
+    def test_export_all_care_plans_ndjson_stream_and_resume(self):
+        orders = self.create_care_plan_orders(4)
+        Order.objects.create(
+            patient=self.patient,
+            provider=self.provider,
+            primary_diagnosis="G70.00",
+            medication_name="No plan",
+            patient_records="Test records"
+        )
+        response = self.client.get('/api/orders/export/all?stream=1')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        with self.assertNumQueries(1):
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([r['order_id'] for r in records], [o.id for o in orders])
+        self.assertEqual(records[0]['patient'], {"name": "John Doe", "mrn": "123456"})
+        self.assertEqual(records[1]['provider']['npi'], "2222222222")
+        response = self.client.get(f'/api/orders/export/all?stream=1&provider_npi=1234567890&after_order_id={orders[0].id}')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([r['order_id'] for r in records], [orders[2].id])
+
+    def test_export_all_care_plans_invalid_resume_cursor(self):
+        response = self.client.get('/api/orders/export/all?stream=1&after_order_id=abc')
+        self.assertEqual(response.status_code, 400)
+
     def test_export_orders_invalid_format(self):
         response = self.client.get('/api/orders/export?format=invalid')
         self.assertEqual(response.status_code, 400)
@@ -425,3 +694,1540 @@ class ViewsTest(TestCase):
         self.assertEqual(response.status_code, 200)
         response_data = json.loads(response.content)
         self.assertEqual(response_data['total_orders'], 1)
+
+    def test_export_stats_per_provider_and_diagnosis_counts(self):
+        other = Provider.objects.create(name="Dr. Bob Lee", npi="2222222222")
+        for provider, diagnosis, care_plan in [
+            (self.provider, "G70.00", "Plan"),
+            (self.provider, "G70.00", None),
+            (self.provider, "I10", ""),
+            (other, "I10", "Plan"),
+        ]:
+            Order.objects.create(
+                patient=self.patient,
+                provider=provider,
+                primary_diagnosis=diagnosis,
+                medication_name="Test Medication",
+                patient_records="Test records",
+                care_plan=care_plan
+            )
+        response = self.client.get('/api/orders/export/stats?top=1')
+        self.assertEqual(response.status_code, 200)
+        response_data = json.loads(response.content)
+        self.assertEqual(response_data['total_orders'], 4)
+        self.assertEqual(response_data['care_plans_generated'], 2)
+        self.assertEqual(response_data['provider_count'], 2)
+        self.assertEqual(response_data['diagnosis_count'], 2)
+        self.assertEqual(response_data['providers'], ["Dr. Alice Johnson"])
+        self.assertEqual(response_data['top_providers'], [{"npi": "1234567890", "name": "Dr. Alice Johnson", "orders": 3, "care_plans": 1}])
+        self.assertEqual(response_data['top_diagnoses'], [{"icd10_code": "G70.00", "orders": 2, "care_plans": 1}])
+
+    def test_export_stats_does_not_load_text_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/orders/export/stats?diagnosis=G70.00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 5)
+        for query in queries:
+            self.assertNotIn('patient_records', query['sql'])
+            self.assertNotRegex(query['sql'], r'"orders"\."care_plan"(,| FROM)')
+
+    def test_export_conditional_get_and_render_cache(self):
+        export_render_cache.clear()
+        order = Order.objects.create(
+            patient=self.patient,
+            provider=self.provider,
+            primary_diagnosis="G70.00",
+            medication_name="Test Medication",
+            patient_records="Test records"
+        )
+        response = self.client.get('/api/orders/export?format=csv')
+        content = b''.join(response.streaming_content)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/orders/export?format=csv', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/orders/export?format=csv')
+        self.assertEqual(response.content, content)
+        self.assertNotEqual(self.client.get('/api/orders/export?format=xlsx')['ETag'], etag)
+        save_care_plan(order, "New plan")
+        response = self.client.get('/api/orders/export?format=csv', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_export_etag_changes_on_provider_rename(self):
+        export_render_cache.clear()
+        Order.objects.create(
+            patient=self.patient,
+            provider=self.provider,
+            primary_diagnosis="G70.00",
+            medication_name="Test Medication",
+            patient_records="Test records"
+        )
+        response = self.client.get('/api/orders/export?format=csv')
+        etag = response['ETag']
+        b''.join(response.streaming_content)
+        upsert_provider({"provider_npi": self.provider.npi, "provider_name": "Dr. Renamed Provider"})
+        response = self.client.get('/api/orders/export?format=csv', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn(b"Dr. Renamed Provider", b''.join(response.streaming_content))
+
+    def test_export_if_modified_since_sees_deletes(self):
+        export_render_cache.clear()
+        orders = [
+            Order.objects.create(
+                patient=self.patient,
+                provider=self.provider,
+                primary_diagnosis="G70.00",
+                medication_name=f"Medication {index}",
+                patient_records="Test records"
+            )
+            for index in range(2)
+        ]
+        Order.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        last_modified = self.client.get('/api/orders/export/stats')['Last-Modified']
+        response = self.client.get('/api/orders/export/stats', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        orders[0].delete()
+        response = self.client.get('/api/orders/export/stats', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['total_orders'], 1)
+
+    def test_export_stats_conditional_get(self):
+        export_render_cache.clear()
+        response = self.client.get('/api/orders/export/stats?top=5')
+        etag = response['ETag']
+        response = self.client.get('/api/orders/export/stats?top=5', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/orders/export/stats?top=6', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_stats_invalid_top(self):
+        response = self.client.get('/api/orders/export/stats?top=0')
+        self.assertEqual(response.status_code, 400)
+
+
+ORDER_PAYLOAD = {
+    "patient_first_name": "Jane",
+    "patient_last_name": "Smith",
+    "patient_mrn": "999999",
+    "provider_name": "Dr. New Provider",
+    "provider_npi": "9999999999",
+    "primary_diagnosis": "G70.00",
+    "medication_name": "IVIG (Privigen)",
+    "patient_records": "Test records"
+}
+
+
+@override_settings(CARE_PLAN_JOB_WORKERS=0)
+class GenerateOrderTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        care_plan_cache.clear()
+
+    def post_generate(self, url='/api/orders/generate', payload=None):
+        return self.client.post(
+            url,
+            data=json.dumps(payload or ORDER_PAYLOAD),
+            content_type='application/json'
+        )
+
+    @patch('orders.llm.generate_care_plan', return_value="Generated plan")
+    def test_generate_order_sync(self, mock_generate):
+        response = self.post_generate()
+        self.assertEqual(response.status_code, 201)
+        response_data = json.loads(response.content)
+        self.assertEqual(response_data['care_plan'], "Generated plan")
+        order = Order.objects.get(id=response_data['order_id'])
+        self.assertEqual(order.care_plan, "Generated plan")
+        self.assertIsNotNone(order.care_plan_generated_at)
+
+    @patch('orders.llm.generate_care_plan', side_effect=Exception("LLM down"))
+    def test_generate_order_sync_failure_deletes_order(self, mock_generate):
+        response = self.post_generate()
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(Order.objects.count(), 0)
+
+    @patch('orders.llm.generate_care_plan', return_value="Generated plan")
+    def test_generate_order_async_returns_job(self, mock_generate):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_generate('/api/orders/generate?async=1')
+        self.assertEqual(response.status_code, 202)
+        job_id = json.loads(response.content)['job_id']
+        response = self.client.get(f'/api/orders/jobs/{job_id}')
+        self.assertEqual(response.status_code, 200)
+        response_data = json.loads(response.content)
+        self.assertEqual(response_data['status'], CarePlanJob.STATUS_SUCCEEDED)
+        self.assertEqual(response_data['care_plan'], "Generated plan")
+        self.assertIsNotNone(response_data['order_id'])
+
+    @patch('orders.llm.generate_care_plan', side_effect=Exception("LLM down"))
+    def test_generate_order_async_failure(self, mock_generate):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_generate('/api/orders/generate?async=1')
+        job = CarePlanJob.objects.get(id=json.loads(response.content)['job_id'])
+        self.assertEqual(job.status, CarePlanJob.STATUS_FAILED)
+        self.assertIn("LLM down", job.error)
+        self.assertIsNone(job.order)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_get_job_not_found(self):
+        response = self.client.get('/api/orders/jobs/00000000-0000-0000-0000-000000000000')
+        self.assertEqual(response.status_code, 404)
+
+    def create_stale_job(self, status, care_plan=None):
+        order = create_order(ORDER_PAYLOAD)
+        if care_plan:
+            save_care_plan(order, care_plan)
+        job = CarePlanJob.objects.create(order=order, status=status)
+        stale = timezone.now() - timedelta(hours=1)
+        CarePlanJob.objects.filter(id=job.id).update(created_at=stale, started_at=stale if status == CarePlanJob.STATUS_RUNNING else None)
+        return job
+
+    def test_polling_fails_jobs_lost_to_a_restart(self):
+        job = self.create_stale_job(CarePlanJob.STATUS_PENDING)
+        response_data = self.client.get(f'/api/orders/jobs/{job.id}').json()
+        self.assertEqual(response_data['status'], CarePlanJob.STATUS_FAILED)
+        self.assertIn("worker restarted", response_data['error'])
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_recover_command_settles_stale_running_jobs(self):
+        saved = self.create_stale_job(CarePlanJob.STATUS_RUNNING, care_plan="Generated plan")
+        fresh = CarePlanJob.objects.create(order=saved.order)
+        out = StringIO()
+        call_command('recover_care_plan_jobs', stdout=out)
+        self.assertIn("Recovered 1", out.getvalue())
+        self.assertEqual(CarePlanJob.objects.get(id=saved.id).status, CarePlanJob.STATUS_SUCCEEDED)
+        self.assertEqual(CarePlanJob.objects.get(id=fresh.id).status, CarePlanJob.STATUS_PENDING)
+
+    def test_job_for_deleted_order_fails(self):
+        order = create_order(ORDER_PAYLOAD)
+        job = CarePlanJob.objects.create(order=order)
+        order.delete()
+        run_care_plan_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, CarePlanJob.STATUS_FAILED)
+        self.assertIn("deleted", job.error)
+
+
+class CarePlanCleanerTest(TestCase):
+    SIGNED_PLAN = (
+        "Jane Smith — Comprehensive Pharmacist Care Plan\n"
+        "1) PROBLEM LIST\n"
+        "Provider signature:\n"
+        "Date: 2025-01-15\n"
+        "If you want, I can prepare a patient handout.\n"
+        "Let me know if you need anything else.\n"
+    )
+
+    def stream(self, text, size):
+        cleaner = CarePlanStreamCleaner()
+        output = [cleaner.feed(text[i:i + size]) for i in range(0, len(text), size)]
+        output.append(cleaner.finish())
+        return ''.join(output)
+
+    def test_clean_care_plan_removes_conversational_ending(self):
+        cleaned = clean_care_plan(self.SIGNED_PLAN)
+        self.assertTrue(cleaned.endswith("Date: 2025-01-15"))
+        self.assertNotIn("If you want", cleaned)
+
+    def test_clean_care_plan_keeps_text_without_signature(self):
+        text = "Plan body\nLet me know if you have questions"
+        self.assertEqual(clean_care_plan(text), text)
+
+    def test_clean_care_plan_keeps_marker_before_last_signature(self):
+        text = self.SIGNED_PLAN + "Addendum\nDate: 2025-01-16\nWould you like me to add more?"
+        cleaned = clean_care_plan(text)
+        self.assertIn("If you want", cleaned)
+        self.assertTrue(cleaned.endswith("Date: 2025-01-16"))
+
+    def test_stream_cleaner_matches_clean_care_plan(self):
+        for text in [self.SIGNED_PLAN, self.SIGNED_PLAN + "Date: 2025-01-16\nTrailing", "No signature\nat all"]:
+            for size in [1, 3, 17, len(text)]:
+                self.assertEqual(self.stream(text, size).strip(), clean_care_plan(text))
+
+    def test_stream_cleaner_emits_before_signature_immediately(self):
+        cleaner = CarePlanStreamCleaner()
+        self.assertEqual(cleaner.feed("Jane Sm"), "Jane Sm")
+        self.assertEqual(cleaner.feed("ith\nDate: 2025-01-15\nIf you"), "ith\nDate: 2025-01-15\n")
+
+
+class GenerateOrderStreamTest(TestCase):
+    def post_stream(self):
+        response = self.client.post(
+            '/api/orders/generate/stream',
+            data=json.dumps(ORDER_PAYLOAD),
+            content_type='application/json'
+        )
+        body = b''.join(response.streaming_content).decode() if response.streaming else ''
+        return response, body
+
+    @patch('orders.views.stream_care_plan', return_value=iter(["Plan ", "body\n", "Date: 2025-01-15"]))
+    def test_generate_order_stream(self, mock_stream):
+        response, body = self.post_stream()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn("event: token", body)
+        self.assertIn("event: done", body)
+        order = Order.objects.get()
+        self.assertEqual(order.care_plan, "Plan body\nDate: 2025-01-15")
+        self.assertIsNotNone(order.care_plan_generated_at)
+
+    @patch('orders.views.stream_care_plan', side_effect=Exception("LLM down"))
+    def test_generate_order_stream_failure(self, mock_stream):
+        response, body = self.post_stream()
+        self.assertIn("event: error", body)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_generate_order_stream_invalid_data(self):
+        response = self.client.post(
+            '/api/orders/generate/stream',
+            data=json.dumps({"patient_mrn": "12"}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class CarePlanCacheTest(TestCase):
+    INPUTS = {
+        "patient_records": "BP 120/80\n\nWeight 70kg",
+        "primary_diagnosis": "G70.00",
+        "medication_name": "IVIG (Privigen)",
+        "patient_first_name": "Jane",
+        "patient_last_name": "Smith",
+        "patient_mrn": "999999",
+        "additional_diagnoses": ["I10", "K21.9"],
+        "medication_history": ["Lisinopril"],
+    }
+
+    def setUp(self):
+        care_plan_cache.clear()
+
+    def test_cache_key_normalizes_inputs(self):
+        variant = dict(self.INPUTS)
+        variant["patient_records"] = "  BP 120/80 Weight   70kg "
+        variant["additional_diagnoses"] = ["K21.9", "i10"]
+        variant["medication_name"] = "ivig (privigen)"
+        self.assertEqual(care_plan_cache_key(**self.INPUTS), care_plan_cache_key(**variant))
+
+    def test_cache_key_changes_with_inputs(self):
+        variant = dict(self.INPUTS, medication_name="Rituximab")
+        self.assertNotEqual(care_plan_cache_key(**self.INPUTS), care_plan_cache_key(**variant))
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set("a", "1", 60)
+        cache.set("b", "2", 60)
+        cache.get("a")
+        cache.set("c", "3", 60)
+        self.assertEqual(cache.get("a"), "1")
+        self.assertIsNone(cache.get("b"))
+
+    def test_lru_cache_expires_entries(self):
+        cache = LRUCache(2)
+        cache.set("a", "1", -1)
+        self.assertIsNone(cache.get("a"))
+
+    def test_database_tier_survives_memory_clear(self):
+        care_plan_cache.set("k" * 64, "Cached plan", "gpt-5-mini", "1")
+        care_plan_cache.memory.clear()
+        self.assertEqual(care_plan_cache.get("k" * 64), "Cached plan")
+
+    def test_database_tier_expires_entries(self):
+        care_plan_cache.set("k" * 64, "Cached plan", "gpt-5-mini", "1")
+        care_plan_cache.memory.clear()
+        CarePlanCacheEntry.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.assertIsNone(care_plan_cache.get("k" * 64))
+        self.assertEqual(CarePlanCacheEntry.objects.count(), 0)
+
+    @override_settings(CARE_PLAN_CACHE_MAX_ENTRIES=2)
+    def test_database_tier_size_eviction(self):
+        for i in range(3):
+            care_plan_cache.set(str(i) * 64, f"Plan {i}", "gpt-5-mini", "1")
+            CarePlanCacheEntry.objects.filter(key=str(i) * 64).update(
+                last_accessed_at=timezone.now() - timedelta(minutes=10 - i)
+            )
+        care_plan_cache.evict()
+        self.assertEqual(CarePlanCacheEntry.objects.count(), 2)
+        self.assertFalse(CarePlanCacheEntry.objects.filter(key="0" * 64).exists())
+
+    @patch('orders.llm.generate_care_plan', return_value="Generated plan")
+    def test_generate_order_reports_cache_hit(self, mock_generate):
+        for expected_hit in [False, True]:
+            response = self.client.post(
+                '/api/orders/generate',
+                data=json.dumps(ORDER_PAYLOAD),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 201)
+            response_data = json.loads(response.content)
+            self.assertEqual(response_data['cache_hit'], expected_hit)
+            self.assertEqual(response_data['cache_status'], "hit" if expected_hit else "miss")
+            self.assertEqual(response_data['care_plan'], "Generated plan")
+        self.assertEqual(mock_generate.call_count, 1)
+        self.assertEqual(Order.objects.filter(care_plan="Generated plan").count(), 2)
+
+    @override_settings(CARE_PLAN_CACHE_ENABLED=False)
+    @patch('orders.llm.generate_care_plan', return_value="Generated plan")
+    def test_generate_order_cache_disabled(self, mock_generate):
+        for _ in range(2):
+            self.client.post(
+                '/api/orders/generate',
+                data=json.dumps(ORDER_PAYLOAD),
+                content_type='application/json'
+            )
+        self.assertEqual(mock_generate.call_count, 2)
+
+
+class CarePlanCoalescingTest(TransactionTestCase):
+    @patch('orders.llm.generate_care_plan')
+    def test_coalesced_generations_are_not_reported_as_cache_hits(self, mock_generate):
+        started = threading.Event()
+        release = threading.Event()
+
+        def generate(**kwargs):
+            started.set()
+            release.wait(5)
+            return "Generated plan"
+
+        mock_generate.side_effect = generate
+        inputs = dict(SECTION_INPUTS, patient_records="Coalesced records")
+        results = []
+        leader = threading.Thread(target=lambda: results.append(generate_care_plan_cached(**inputs)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(generate_care_plan_cached(**inputs)))
+        follower.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in [leader, follower]:
+            thread.join(5)
+        self.assertEqual(sorted(results), [("Generated plan", "coalesced"), ("Generated plan", "miss")])
+        self.assertEqual(generate_care_plan_cached(**inputs), ("Generated plan", "hit"))
+        self.assertEqual(mock_generate.call_count, 1)
+
+
+class SingleFlightTest(TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "plan"
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("key", slow)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do("key", slow))) for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        time.sleep(0.2)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [("plan", False), ("plan", True), ("plan", True), ("plan", True)])
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_errors_propagate_to_followers(self):
+        flight = SingleFlight()
+        with self.assertRaises(ValueError):
+            flight.do("key", lambda: (_ for _ in ()).throw(ValueError("boom")))
+        self.assertEqual(flight.do("key", lambda: "retry"), ("retry", False))
+
+    def test_file_lock_excludes_second_holder(self):
+        with tempfile.TemporaryDirectory() as lock_dir:
+            with file_lock(lock_dir, "key", timeout=1) as acquired:
+                self.assertTrue(acquired)
+                result = []
+
+                def contend():
+                    with file_lock(lock_dir, "key", timeout=0.2) as second:
+                        result.append(second)
+
+                thread = threading.Thread(target=contend)
+                thread.start()
+                thread.join(5)
+                self.assertEqual(result, [False])
+            with file_lock(lock_dir, "key", timeout=1) as acquired:
+                self.assertTrue(acquired)
+
+    def test_prune_skips_held_and_recent_lock_files(self):
+        with tempfile.TemporaryDirectory() as lock_dir:
+            for name in ["idle", "held", "recent"]:
+                with file_lock(lock_dir, name, timeout=1):
+                    pass
+            old = time.time() - 3600
+            for name in ["idle", "held"]:
+                os.utime(f"{lock_dir}/{name}.lock", (old, old))
+            with file_lock(lock_dir, "held", timeout=1) as acquired:
+                self.assertTrue(acquired)
+                os.utime(f"{lock_dir}/held.lock", (old, old))
+                out = StringIO()
+                with override_settings(CARE_PLAN_LOCK_DIR=lock_dir):
+                    call_command('prune_care_plan_locks', '--max-age', '60', stdout=out)
+                self.assertIn("Removed 1 lock file(s)", out.getvalue())
+                self.assertEqual(sorted(os.listdir(lock_dir)), ["held.lock", "recent.lock"])
+
+    def test_file_lock_is_not_taken_on_an_unlinked_file(self):
+        with tempfile.TemporaryDirectory() as lock_dir:
+            path = f"{lock_dir}/key.lock"
+            stale = open(path, 'a')
+            os.unlink(path)
+            open(path, 'a').close()
+            self.assertFalse(os.path.sameopenfile(stale.fileno(), os.open(path, os.O_RDONLY)))
+            stale.close()
+            with file_lock(lock_dir, "key", timeout=1) as acquired:
+                self.assertTrue(acquired)
+                with file_lock(lock_dir, "key", timeout=0.2) as second:
+                    self.assertFalse(second)
+
+
+def batch_item(**overrides):
+    item = dict(ORDER_PAYLOAD)
+    item.update(overrides)
+    return item
+
+
+@override_settings(CARE_PLAN_BATCH_CONCURRENCY=1, CARE_PLAN_CACHE_ENABLED=False, CARE_PLAN_JOB_WORKERS=0)
+class GenerateOrderBatchTest(TestCase):
+    def post_batch(self, orders, url='/api/orders/generate/batch'):
+        return self.client.post(url, data=json.dumps({"orders": orders}), content_type='application/json')
+
+    @patch('orders.llm.generate_care_plan', return_value="Generated plan")
+    def test_batch_generates_all_orders(self, mock_generate):
+        Provider.objects.create(name="Dr. Old Name", npi="9999999999")
+        orders = [
+            batch_item(),
+            batch_item(medication_name="Rituximab"),
+            batch_item(patient_mrn="888888", patient_first_name="Bob"),
+        ]
+        response = self.post_batch(orders)
+        self.assertEqual(response.status_code, 201)
+        response_data = json.loads(response.content)
+        self.assertEqual(response_data['succeeded'], 3)
+        self.assertEqual([r['index'] for r in response_data['results']], [0, 1, 2])
+        self.assertEqual(Patient.objects.count(), 2)
+        self.assertEqual(Provider.objects.get(npi="9999999999").name, "Dr. New Provider")
+        self.assertEqual(Order.objects.filter(care_plan="Generated plan").count(), 3)
+        self.assertEqual(OrderDiagnosis.objects.filter(is_primary=True).count(), 3)
+
+    @patch('orders.llm.generate_care_plan', side_effect=["Generated plan", Exception("LLM down")])
+    def test_batch_reports_per_item_failures(self, mock_generate):
+        response = self.post_batch([batch_item(), batch_item(medication_name="Rituximab")])
+        self.assertEqual(response.status_code, 207)
+        results = json.loads(response.content)['results']
+        self.assertEqual(results[0]['status'], "succeeded")
+        self.assertEqual(results[1]['status'], "failed")
+        self.assertIn("LLM down", results[1]['detail'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_batch_rejects_invalid_items(self):
+        response = self.post_batch([batch_item(), batch_item(patient_mrn="12")])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_batch_rejects_scalar_body(self):
+        for body in (5, "abc", None):
+            response = self.client.post('/api/orders/generate/batch', data=json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.count(), 0)
+
+    @override_settings(CARE_PLAN_BATCH_MAX_SIZE=1)
+    def test_batch_rejects_oversized_batch(self):
+        response = self.post_batch([batch_item(), batch_item()])
+        self.assertEqual(response.status_code, 400)
+
+    @patch('orders.llm.generate_care_plan', return_value="Generated plan")
+    def test_batch_async_returns_jobs(self, mock_generate):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_batch([batch_item(), batch_item(medication_name="Rituximab")], '/api/orders/generate/batch?async=1')
+        self.assertEqual(response.status_code, 202)
+        jobs = json.loads(response.content)['jobs']
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(CarePlanJob.objects.filter(status=CarePlanJob.STATUS_SUCCEEDED).count(), 2)
+
+
+@override_settings(CARE_PLAN_BATCH_CONCURRENCY=4, CARE_PLAN_CACHE_ENABLED=False)
+class GenerateOrderBatchConcurrencyTest(TransactionTestCase):
+    @patch('orders.llm.generate_care_plan')
+    def test_batch_runs_generations_concurrently(self, mock_generate):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def generate(**kwargs):
+            barrier.wait()
+            return f"Plan for {kwargs['medication_name']}"
+
+        mock_generate.side_effect = generate
+        orders = [batch_item(medication_name=f"Medication {i}") for i in range(3)]
+        response = self.client.post(
+            '/api/orders/generate/batch',
+            data=json.dumps(orders),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        results = json.loads(response.content)['results']
+        self.assertEqual([r['care_plan'] for r in results], [f"Plan for Medication {i}" for i in range(3)])
+
+
+@override_settings(CARE_PLAN_CACHE_ENABLED=False)
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+
+    def make_request(self, path, payload):
+        return self.factory.post(path, data=json.dumps(payload), content_type='application/json')
+
+    @patch('orders.llm.agenerate_care_plan', new_callable=AsyncMock, return_value="Generated plan")
+    async def test_agenerate_order(self, mock_generate):
+        response = await views.agenerate_order(self.make_request('/api/orders/generate', ORDER_PAYLOAD))
+        self.assertEqual(response.status_code, 201)
+        response_data = json.loads(response.content)
+        self.assertEqual(response_data['care_plan'], "Generated plan")
+        order = await Order.objects.select_related('patient').aget(id=response_data['order_id'])
+        self.assertEqual(order.care_plan, "Generated plan")
+        self.assertEqual(order.patient.mrn, ORDER_PAYLOAD['patient_mrn'])
+
+    @patch('orders.llm.agenerate_care_plan', new_callable=AsyncMock, side_effect=Exception("LLM down"))
+    async def test_agenerate_order_failure_deletes_order(self, mock_generate):
+        response = await views.agenerate_order(self.make_request('/api/orders/generate', ORDER_PAYLOAD))
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(await Order.objects.acount(), 0)
+
+    async def test_agenerate_order_invalid_json(self):
+        request = self.factory.post('/api/orders/generate', data='{not json', content_type='application/json')
+        response = await views.agenerate_order(request)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_non_object_json_body_is_rejected(self):
+        for view, path in [(views.agenerate_order, '/api/orders/generate'), (views.avalidate_order, '/api/orders/validate')]:
+            response = await view(self.make_request(path, []))
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(json.loads(response.content)['detail'], "Request body must be a JSON object")
+
+    @patch('orders.llm.agenerate_care_plan', new_callable=AsyncMock, return_value="Generated plan")
+    async def test_agenerate_order_updates_existing_records_like_sync_view(self, mock_generate):
+        await Provider.objects.acreate(name="Dr. Old Name", npi=ORDER_PAYLOAD['provider_npi'])
+        response = await views.agenerate_order(self.make_request('/api/orders/generate', ORDER_PAYLOAD))
+        self.assertEqual(response.status_code, 201)
+        provider = await Provider.objects.aget(npi=ORDER_PAYLOAD['provider_npi'])
+        self.assertEqual(provider.name, ORDER_PAYLOAD['provider_name'])
+        self.assertEqual(await OrderDailyRollup.objects.acount(), 1)
+
+    async def test_avalidate_order(self):
+        await Patient.objects.acreate(first_name="Jane", last_name="Smith", mrn="999999")
+        response = await views.avalidate_order(self.make_request('/api/orders/validate', ORDER_PAYLOAD))
+        self.assertEqual(response.status_code, 200)
+        response_data = json.loads(response.content)
+        self.assertTrue(response_data['valid'])
+        self.assertEqual(response_data['warnings'][0]['type'], "duplicate_patient")
+
+    async def test_avalidate_order_invalid_data(self):
+        response = await views.avalidate_order(self.make_request('/api/orders/validate', {"patient_mrn": "12"}))
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncSingleFlightTest(TestCase):
+    async def test_concurrent_calls_share_one_task(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "plan"
+
+        results = await asyncio.gather(*[flight.do("key", slow) for _ in range(4)])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [("plan", False), ("plan", True), ("plan", True), ("plan", True)])
+        self.assertEqual(flight.in_flight(), 0)
+
+
+class PromptCompactionTest(TestCase):
+    def test_normalize_whitespace(self):
+        self.assertEqual(normalize_whitespace("  BP   120/80 \t\r\n\n\n\nHR 72  "), "BP 120/80\n\nHR 72")
+
+    def test_drop_duplicate_lines_and_sections(self):
+        text = "Vitals:\nBP 120/80\n\nVitals:\nBP 120/80\n\nVitals:\nBP 120/80\nHR 72\nHR 72"
+        self.assertEqual(drop_duplicates(text), "Vitals:\nBP 120/80\n\nVitals:\nBP 120/80\nHR 72")
+
+    def test_repeated_readings_under_later_headings_are_kept(self):
+        text = "Visit 2026-01-01\nCreatinine 1.1 mg/dL\n\nVisit 2026-02-01\nCreatinine 1.1 mg/dL"
+        self.assertEqual(drop_duplicates(text), text)
+
+    def test_records_within_budget_are_not_truncated(self):
+        result = compact_patient_records("Allergies: penicillin\n\nWeight 70 kg", 1000)
+        self.assertFalse(result.truncated)
+        self.assertEqual(result.text, "Allergies: penicillin\n\nWeight 70 kg")
+        self.assertEqual(result.tokens_after, count_tokens(result.text))
+
+    def test_over_budget_drops_boilerplate_first(self):
+        clinical = "Allergies: penicillin. Creatinine 1.1 mg/dL, eGFR 78, weight 72 kg."
+        boilerplate = "CONFIDENTIAL: This document is intended only for the use of the recipient. " * 5
+        records = "\n\n".join(["Patient A. DOB 1980-01-01", boilerplate, clinical])
+        budget = count_tokens("Patient A. DOB 1980-01-01\n\n" + clinical) + 2
+        result = compact_patient_records(records, budget)
+        self.assertTrue(result.truncated)
+        self.assertNotIn("CONFIDENTIAL", result.text)
+        self.assertIn("Creatinine 1.1", result.text)
+        self.assertLessEqual(result.tokens_after, budget)
+        self.assertGreater(result.tokens_before, result.tokens_after)
+
+    def test_single_oversized_section_is_truncated_to_budget(self):
+        result = compact_patient_records("word " * 2000, 50)
+        self.assertLessEqual(result.tokens_after, 50)
+
+    @override_settings(CARE_PLAN_RECORDS_TOKEN_BUDGET=20)
+    def test_prompt_uses_compacted_records(self):
+        messages = build_care_plan_messages(
+            patient_records="Allergies: none\n\n" + "filler text " * 500,
+            primary_diagnosis="G70.00",
+            medication_name="IVIG",
+            patient_first_name="Jane",
+            patient_last_name="Smith",
+            patient_mrn="999999",
+        )
+        self.assertIn("Allergies: none", messages[1]['content'])
+        self.assertLess(messages[1]['content'].count("filler text"), 500)
+
+
+class OrderAnalyticsTest(TestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(first_name="John", last_name="Doe", mrn="123456")
+        self.provider = Provider.objects.create(name="Dr. Alice Johnson", npi="1234567890")
+        self.other = Provider.objects.create(name="Dr. Bob Lee", npi="2222222222")
+
+    def create_order(self, provider=None, diagnosis="G70.00", care_plan=None, created_at=None):
+        order = Order.objects.create(
+            patient=self.patient,
+            provider=provider or self.provider,
+            primary_diagnosis=diagnosis,
+            medication_name="IVIG",
+            patient_records="Test records",
+            care_plan=care_plan
+        )
+        if created_at:
+            order.created_at = created_at
+            order.save(update_fields=['created_at'])
+        return order
+
+    def rollups(self):
+        return sorted(OrderDailyRollup.objects.values_list('provider__npi', 'primary_diagnosis', 'orders', 'care_plans'))
+
+    def test_rollups_follow_order_lifecycle(self):
+        order = self.create_order()
+        self.create_order(care_plan="Plan")
+        self.create_order(provider=self.other, diagnosis="I10")
+        self.assertEqual(self.rollups(), [("1234567890", "G70.00", 2, 1), ("2222222222", "I10", 1, 0)])
+        save_care_plan(order, "Generated plan")
+        save_care_plan(order, "Regenerated plan")
+        self.assertEqual(self.rollups()[0], ("1234567890", "G70.00", 2, 2))
+        order.delete()
+        self.assertEqual(self.rollups()[0], ("1234567890", "G70.00", 1, 1))
+
+    def test_rollups_follow_order_updates(self):
+        order = self.create_order(care_plan="Plan")
+        order.provider = self.other
+        order.primary_diagnosis = "I10"
+        order.save()
+        self.assertEqual(self.rollups(), [("2222222222", "I10", 1, 1)])
+        order.care_plan = ""
+        order.save(update_fields=['care_plan'])
+        self.assertEqual(self.rollups(), [("2222222222", "I10", 1, 0)])
+        order.delete()
+        self.assertEqual(self.rollups(), [])
+
+    def test_queryset_and_cascade_deletes_update_rollups(self):
+        self.create_order(care_plan="Plan")
+        self.create_order()
+        self.create_order(provider=self.other, diagnosis="I10")
+        Order.objects.filter(provider=self.other).delete()
+        self.assertEqual(self.rollups(), [("1234567890", "G70.00", 2, 1)])
+        self.patient.delete()
+        self.assertEqual(self.rollups(), [])
+
+    def test_care_plan_for_unrolled_order_does_not_create_empty_row(self):
+        order = self.create_order()
+        OrderDailyRollup.objects.all().delete()
+        save_care_plan(order, "Generated plan")
+        self.assertEqual(self.rollups(), [])
+
+    def test_rollup_backfill_migration(self):
+        backfill = import_module('orders.migrations.0007_order_daily_rollup').backfill_order_daily_rollups
+        self.create_order(care_plan="Plan")
+        self.create_order(provider=self.other, diagnosis="I10", created_at=timezone.now() - timedelta(days=3))
+        incremental = self.rollups()
+        OrderDailyRollup.objects.all().delete()
+        backfill(django_apps, None)
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_bulk_created_orders_are_rolled_up(self):
+        create_orders_bulk([batch_item(), batch_item(), batch_item(primary_diagnosis="I10")])
+        self.assertEqual(
+            sorted(OrderDailyRollup.objects.values_list('primary_diagnosis', 'orders')),
+            [("G70.00", 2), ("I10", 1)]
+        )
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.create_order(care_plan="Plan")
+        self.create_order(provider=self.other, diagnosis="I10", created_at=timezone.now() - timedelta(days=3))
+        incremental = self.rollups()
+        OrderDailyRollup.objects.update(orders=99)
+        out = StringIO()
+        call_command('rebuild_order_rollups', stdout=out)
+        self.assertIn("Rebuilt 2 rollup row(s)", out.getvalue())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_analytics_endpoint_buckets(self):
+        now = timezone.now()
+        self.create_order(care_plan="Plan", created_at=datetime(2026, 3, 2, 12, tzinfo=now.tzinfo))
+        self.create_order(created_at=datetime(2026, 3, 3, 12, tzinfo=now.tzinfo))
+        self.create_order(provider=self.other, created_at=datetime(2026, 4, 1, 12, tzinfo=now.tzinfo))
+        response = self.client.get('/api/orders/analytics?bucket=month&start_date=2026-03-01')
+        self.assertEqual(response.status_code, 200)
+        response_data = response.json()
+        self.assertEqual(response_data['total_orders'], 3)
+        self.assertEqual(response_data['series'], [
+            {"period": "2026-03-01", "orders": 2, "care_plans": 1},
+            {"period": "2026-04-01", "orders": 1, "care_plans": 0},
+        ])
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/orders/analytics?provider_npi=1234567890&end_date=2026-03-02')
+        self.assertEqual(response.json()['series'], [{"period": "2026-03-02", "orders": 1, "care_plans": 1}])
+
+    def test_analytics_endpoint_rejects_bad_params(self):
+        self.assertEqual(self.client.get('/api/orders/analytics?bucket=year').status_code, 400)
+        self.assertEqual(self.client.get('/api/orders/analytics?start_date=03/01/2026').status_code, 400)
+
+
+def completion(content):
+    message = type('Message', (), {'content': content})()
+    return type('Completion', (), {'choices': [type('Choice', (), {'message': message})()], 'usage': None})()
+
+
+SECTION_INPUTS = {
+    'patient_records': "Allergies: none",
+    'primary_diagnosis': "G70.00",
+    'medication_name': "IVIG",
+    'patient_first_name': "Jane",
+    'patient_last_name': "Smith",
+    'patient_mrn': "999999",
+}
+
+
+@override_settings(CARE_PLAN_LLM_HEDGING_ENABLED=False, CARE_PLAN_RATE_LIMIT_RPM=0, CARE_PLAN_RATE_LIMIT_TPM=0)
+class ParallelSectionsTest(TestCase):
+    def test_section_messages_cover_every_part_in_order(self):
+        parts = build_care_plan_section_messages(**SECTION_INPUTS)
+        self.assertEqual(len(parts), 7)
+        self.assertIn("**PATIENT HEADER:**", parts[0][1]['content'])
+        self.assertIn("**1) PROBLEM LIST", parts[1][1]['content'])
+        self.assertIn("**6) SUMMARY", parts[6][1]['content'])
+        self.assertIn("**END THIS PART WITH:**", parts[6][1]['content'])
+        self.assertNotIn("**END THIS PART WITH:**", parts[5][1]['content'])
+        self.assertTrue(all("Jane Smith" in part[1]['content'] for part in parts))
+
+    @patch('orders.llm.get_client')
+    @patch('orders.llm._create_completion')
+    def test_sections_are_assembled_in_prompt_order(self, mock_create, mock_client):
+        def create(client, messages, timeout):
+            index = [m[1]['content'] for m in build_care_plan_section_messages(**SECTION_INPUTS)].index(messages[1]['content'])
+            time.sleep(0.01 * (7 - index))
+            return completion(f"**Part {index}**\nIf you want, I can expand this." if index < 6 else f"**Part {index}**\nDate: 2026-01-01")
+        mock_create.side_effect = create
+        care_plan = generate_care_plan_sections(**SECTION_INPUTS)
+        self.assertEqual(mock_create.call_count, 7)
+        self.assertEqual(
+            care_plan,
+            "\n\n".join(f"**Part {i}**" for i in range(6)) + "\n\n**Part 6**\nDate: 2026-01-01"
+        )
+
+    @override_settings(CARE_PLAN_PARALLEL_SECTIONS=True, CARE_PLAN_LLM_MAX_RETRIES=0)
+    @patch('orders.llm.get_client')
+    @patch('orders.llm._create_completion')
+    def test_failed_section_fails_the_care_plan(self, mock_create, mock_client):
+        mock_create.side_effect = [completion("**Part**")] * 6 + [ValueError("bad section")]
+        with self.assertRaisesRegex(Exception, "Failed to generate care plan"):
+            generate_care_plan(**SECTION_INPUTS)
+
+    @patch('orders.llm.get_async_client')
+    @patch('orders.llm._acreate_completion', new_callable=AsyncMock)
+    def test_async_sections_are_assembled_in_prompt_order(self, mock_create, mock_client):
+        mock_create.side_effect = [completion(f"**Part {i}**") for i in range(7)]
+        care_plan = asyncio.run(agenerate_care_plan_sections(**SECTION_INPUTS))
+        self.assertEqual(care_plan, "\n\n".join(f"**Part {i}**" for i in range(7)))
+
+    @patch('orders.llm.get_client')
+    @patch('orders.llm._create_completion')
+    def test_only_trailing_conversation_is_removed_from_sections(self, mock_create, mock_client):
+        middle = "**Part 1**\nThis care plan is intended to be used with the infusion protocol.\nDose 2 g/kg"
+        contents = (
+            ["**Part 0**", middle]
+            + [f"**Part {i}**\nLet me know if you need more." for i in range(2, 6)]
+            + ["**Part 6**\nDate: 2026-01-01\nIf you want, I can expand this."]
+        )
+        prompts = [m[1]['content'] for m in build_care_plan_section_messages(**SECTION_INPUTS)]
+        mock_create.side_effect = lambda client, messages, timeout: completion(contents[prompts.index(messages[1]['content'])])
+        care_plan = generate_care_plan_sections(**SECTION_INPUTS)
+        self.assertEqual(
+            care_plan,
+            "\n\n".join(["**Part 0**", middle] + [f"**Part {i}**" for i in range(2, 6)] + ["**Part 6**\nDate: 2026-01-01"])
+        )
+
+    @override_settings(CARE_PLAN_RATE_LIMIT_COMPLETION_TOKENS=700)
+    @patch('orders.resilience.openai_rate_limiter')
+    @patch('orders.llm.get_client')
+    @patch('orders.llm._create_completion')
+    def test_completion_allowance_is_split_across_sections(self, mock_create, mock_client, mock_limiter):
+        mock_create.return_value = completion("**Part**")
+        generate_care_plan_sections(**SECTION_INPUTS)
+        parts = build_care_plan_section_messages(**SECTION_INPUTS)
+        expected = sorted(sum(count_tokens(m['content']) for m in messages) + 100 for messages in parts)
+        self.assertEqual(sorted(call.kwargs['tokens'] for call in mock_limiter.acquire.call_args_list), expected)
+
+    @override_settings(CARE_PLAN_LLM_MAX_RETRIES=0)
+    @patch('orders.llm.get_client')
+    @patch('orders.llm._create_completion')
+    def test_failed_section_does_not_wait_for_the_others(self, mock_create, mock_client):
+        release = threading.Event()
+
+        def create(client, messages, timeout):
+            if "**PATIENT HEADER:**" in messages[1]['content']:
+                raise ValueError("bad section")
+            release.wait(5)
+            return completion("**Part**")
+
+        mock_create.side_effect = create
+        started = time.monotonic()
+        with self.assertRaisesRegex(ValueError, "bad section"):
+            generate_care_plan_sections(**SECTION_INPUTS)
+        self.assertLess(time.monotonic() - started, 2)
+        release.set()
+
+    @override_settings(CARE_PLAN_PARALLEL_SECTIONS=True, CARE_PLAN_LLM_MAX_RETRIES=0)
+    @patch('orders.llm.get_async_client')
+    @patch('orders.llm._acreate_completion', new_callable=AsyncMock)
+    def test_async_failed_section_cancels_the_others(self, mock_create, mock_client):
+        cancelled = []
+
+        async def create(client, messages, timeout):
+            if "**PATIENT HEADER:**" in messages[1]['content']:
+                raise ValueError("bad section")
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+            return completion("**Part**")
+
+        mock_create.side_effect = create
+        with self.assertRaisesRegex(ValueError, "bad section"):
+            asyncio.run(agenerate_care_plan_sections(**SECTION_INPUTS))
+        self.assertEqual(len(cancelled), 6)
+
+    def test_cache_key_ignores_generation_mode(self):
+        with override_settings(CARE_PLAN_PARALLEL_SECTIONS=False):
+            monolithic = care_plan_cache_key(**SECTION_INPUTS)
+        with override_settings(CARE_PLAN_PARALLEL_SECTIONS=True):
+            sectioned = care_plan_cache_key(**SECTION_INPUTS)
+        self.assertEqual(monolithic, sectioned)
+
+
+@override_settings(
+    CARE_PLAN_LLM_MAX_RETRIES=2,
+    CARE_PLAN_LLM_BACKOFF_BASE_SECONDS=0,
+    CARE_PLAN_CIRCUIT_FAILURE_THRESHOLD=3,
+    CARE_PLAN_LLM_HEDGING_ENABLED=False
+)
+class ResilienceTest(TestCase):
+    def setUp(self):
+        llm_circuit_breaker.reset()
+        llm_latency_tracker.reset()
+
+    def tearDown(self):
+        llm_circuit_breaker.reset()
+        llm_latency_tracker.reset()
+
+    def flaky(self, failures, error=TimeoutError):
+        attempts = []
+
+        def fn(timeout):
+            attempts.append(timeout)
+            if len(attempts) <= failures:
+                raise error("upstream slow")
+            return "response"
+
+        return fn, attempts
+
+    def test_retries_retryable_errors(self):
+        fn, attempts = self.flaky(2)
+        self.assertEqual(call_with_resilience(fn), "response")
+        self.assertEqual(len(attempts), 3)
+
+    def test_gives_up_after_max_retries(self):
+        fn, attempts = self.flaky(5)
+        with self.assertRaises(TimeoutError):
+            call_with_resilience(fn)
+        self.assertEqual(len(attempts), 3)
+
+    def test_does_not_retry_other_errors(self):
+        fn, attempts = self.flaky(1, error=ValueError)
+        with self.assertRaises(ValueError):
+            call_with_resilience(fn)
+        self.assertEqual(len(attempts), 1)
+
+    def test_circuit_opens_and_fails_fast(self):
+        fn, attempts = self.flaky(10)
+        with self.assertRaises(TimeoutError):
+            call_with_resilience(fn)
+        self.assertEqual(llm_circuit_breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            call_with_resilience(fn)
+        self.assertEqual(len(attempts), 3)
+
+    def test_circuit_half_open_trial_closes_on_success(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        breaker.before_call()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_circuit_half_open_allows_a_single_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertTrue(breaker.before_call())
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.release_probe()
+        self.assertTrue(breaker.before_call())
+        breaker.record_success()
+        self.assertFalse(breaker.before_call())
+        self.assertFalse(breaker.before_call())
+
+    @override_settings(CARE_PLAN_CIRCUIT_FAILURE_THRESHOLD=1, CARE_PLAN_CIRCUIT_RESET_SECONDS=0, CARE_PLAN_LLM_MAX_RETRIES=0)
+    def test_non_retryable_probe_error_releases_the_probe(self):
+        llm_circuit_breaker.record_failure()
+        fn, attempts = self.flaky(1, error=ValueError)
+        with self.assertRaises(ValueError):
+            call_with_resilience(fn)
+        self.assertEqual(llm_circuit_breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(call_with_resilience(fn), "response")
+        self.assertEqual(llm_circuit_breaker.state, CircuitBreaker.CLOSED)
+
+    @override_settings(CARE_PLAN_LLM_HEDGING_ENABLED=True, CARE_PLAN_LLM_HEDGE_MIN_SAMPLES=1)
+    def test_hedge_clock_starts_when_the_call_starts(self):
+        llm_latency_tracker.record(0.05)
+        executor = ThreadPoolExecutor(max_workers=1)
+        release = threading.Event()
+        executor.submit(release.wait, 5)
+        calls = []
+
+        def fn(timeout):
+            calls.append(1)
+            return "response"
+
+        try:
+            with patch('orders.resilience._hedge_executor', executor):
+                timer = threading.Timer(0.2, release.set)
+                timer.start()
+                with self.assertNoLogs('orders', level='INFO'):
+                    self.assertEqual(call_with_resilience(fn), "response")
+        finally:
+            release.set()
+            executor.shutdown()
+        self.assertEqual(len(calls), 1)
+
+    @override_settings(CARE_PLAN_LLM_HEDGING_ENABLED=True, CARE_PLAN_LLM_HEDGE_MIN_SAMPLES=1)
+    def test_hedged_request_wins_when_first_is_slow(self):
+        llm_latency_tracker.record(0.01)
+        release = threading.Event()
+        calls = []
+
+        def fn(timeout):
+            calls.append(1)
+            if len(calls) == 1:
+                release.wait(5)
+                return "slow"
+            return "fast"
+
+        self.assertEqual(call_with_resilience(fn), "fast")
+        release.set()
+        self.assertEqual(len(calls), 2)
+
+    @override_settings(CARE_PLAN_LLM_HEDGING_ENABLED=True, CARE_PLAN_LLM_HEDGE_MIN_SAMPLES=1)
+    @patch('orders.resilience.openai_rate_limiter')
+    def test_hedge_reserves_capacity_and_skips_loser_latency(self, mock_limiter):
+        mock_limiter.try_acquire.return_value = 0.0
+        llm_latency_tracker.record(0.01)
+        release = threading.Event()
+        loser_done = threading.Event()
+        calls = []
+
+        def fn(timeout):
+            calls.append(1)
+            if len(calls) == 1:
+                release.wait(5)
+                loser_done.set()
+                return "slow"
+            return "fast"
+
+        self.assertEqual(call_with_resilience(fn, tokens=50), "fast")
+        release.set()
+        loser_done.wait(5)
+        time.sleep(0.05)
+        mock_limiter.acquire.assert_called_once_with(tokens=50)
+        mock_limiter.try_acquire.assert_called_once_with(tokens=50)
+        self.assertEqual(len(llm_latency_tracker._samples), 2)
+
+    @override_settings(CARE_PLAN_LLM_HEDGING_ENABLED=True, CARE_PLAN_LLM_HEDGE_MIN_SAMPLES=1)
+    @patch('orders.resilience.openai_rate_limiter')
+    def test_no_hedge_without_rate_limit_capacity(self, mock_limiter):
+        mock_limiter.try_acquire.return_value = 1.5
+        llm_latency_tracker.record(0.01)
+        calls = []
+
+        def fn(timeout):
+            calls.append(1)
+            time.sleep(0.1)
+            return "response"
+
+        self.assertEqual(call_with_resilience(fn), "response")
+        self.assertEqual(len(calls), 1)
+
+    @override_settings(CARE_PLAN_LLM_HEDGING_ENABLED=True, CARE_PLAN_LLM_HEDGE_MIN_SAMPLES=1)
+    async def test_async_hedge_cancels_loser(self):
+        llm_latency_tracker.record(0.01)
+        cancelled = []
+        calls = []
+
+        async def fn(timeout):
+            calls.append(1)
+            if len(calls) == 1:
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append(1)
+                    raise
+                return "slow"
+            return "fast"
+
+        self.assertEqual(await acall_with_resilience(fn), "fast")
+        self.assertEqual(cancelled, [1])
+
+    @patch('orders.llm.call_with_resilience', side_effect=CircuitOpenError(10))
+    @patch('orders.llm.get_client')
+    def test_generate_order_returns_503_when_circuit_open(self, mock_client, mock_call):
+        response = self.client.post(
+            '/api/orders/generate',
+            data=json.dumps(batch_item(patient_records="Circuit test records")),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(Order.objects.count(), 0)
+
+
+@override_settings(CARE_PLAN_RATE_LIMIT_RPM=2, CARE_PLAN_RATE_LIMIT_TPM=1000, CARE_PLAN_RATE_LIMIT_MAX_WAIT_SECONDS=0)
+class SharedRateLimiterTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = f"{self.tmpdir.name}/rate_limit.sqlite3"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_requests_per_minute_budget(self):
+        limiter = SharedRateLimiter(self.db_path)
+        self.assertEqual(limiter.try_acquire(tokens=10), 0.0)
+        self.assertEqual(limiter.try_acquire(tokens=10), 0.0)
+        wait = limiter.try_acquire(tokens=10)
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 30)
+
+    def test_tokens_per_minute_budget(self):
+        limiter = SharedRateLimiter(self.db_path)
+        self.assertEqual(limiter.try_acquire(tokens=900), 0.0)
+        self.assertGreater(limiter.try_acquire(tokens=200), 0)
+
+    def test_budget_is_shared_between_limiters(self):
+        first = SharedRateLimiter(self.db_path)
+        second = SharedRateLimiter(self.db_path)
+        first.try_acquire()
+        first.try_acquire()
+        self.assertGreater(second.try_acquire(), 0)
+
+    def test_actual_usage_reconciles_estimate(self):
+        limiter = SharedRateLimiter(self.db_path)
+        limiter.try_acquire(tokens=100)
+        limiter.record_usage(estimated_tokens=100, actual_tokens=950)
+        self.assertGreater(limiter.try_acquire(tokens=100), 0)
+
+    def test_acquire_gives_up_after_max_wait(self):
+        limiter = SharedRateLimiter(self.db_path)
+        for _ in range(2):
+            limiter.acquire()
+        started = time.monotonic()
+        limiter.acquire()
+        self.assertLess(time.monotonic() - started, 1)
+
+    @override_settings(CARE_PLAN_RATE_LIMIT_RPM=0, CARE_PLAN_RATE_LIMIT_TPM=0)
+    def test_disabled_limiter_never_waits(self):
+        limiter = SharedRateLimiter(self.db_path)
+        for _ in range(10):
+            self.assertEqual(limiter.acquire(tokens=10 ** 6), 0.0)
+
+    @override_settings(CARE_PLAN_LLM_MAX_RETRIES=2, CARE_PLAN_LLM_BACKOFF_BASE_SECONDS=0, CARE_PLAN_LLM_HEDGING_ENABLED=False)
+    @patch('orders.resilience.openai_rate_limiter')
+    @patch('orders.llm.openai_rate_limiter')
+    @patch('orders.llm.get_client')
+    @patch('orders.llm._create_completion')
+    def test_each_retry_reserves_capacity(self, mock_create, mock_client, mock_limiter, mock_reserve_limiter):
+        llm_circuit_breaker.reset()
+        response = completion("**Plan**\nDate: 2026-01-01")
+        response.usage = type('Usage', (), {'prompt_tokens': 300, 'completion_tokens': 21, 'total_tokens': 321})()
+        mock_create.side_effect = [TimeoutError("slow"), response]
+        generate_care_plan(**SECTION_INPUTS)
+        self.assertEqual(mock_create.call_count, 2)
+        self.assertEqual(mock_reserve_limiter.acquire.call_count, 2)
+        estimated = mock_reserve_limiter.acquire.call_args.kwargs['tokens']
+        mock_limiter.record_usage.assert_called_once_with(estimated, 321)
+
+    @override_settings(CARE_PLAN_LLM_HEDGING_ENABLED=False)
+    @patch('orders.resilience.openai_rate_limiter')
+    @patch('orders.llm.openai_rate_limiter')
+    @patch('orders.llm.get_client')
+    @patch('orders.llm._create_completion')
+    def test_streamed_usage_is_reconciled(self, mock_create, mock_client, mock_limiter, mock_reserve_limiter):
+        llm_circuit_breaker.reset()
+
+        def chunk(content=None, usage=None):
+            delta = type('Delta', (), {'content': content})()
+            choices = [type('Choice', (), {'delta': delta})()] if content is not None else []
+            return type('Chunk', (), {'choices': choices, 'usage': usage})()
+
+        mock_create.return_value = iter([
+            chunk("Plan body\n"),
+            chunk("Date: 2026-01-01"),
+            chunk(usage=type('Usage', (), {'total_tokens': 77})()),
+        ])
+        body = ''.join(stream_care_plan(**dict(SECTION_INPUTS, patient_records="Streamed usage records")))
+        self.assertEqual(body, "Plan body\nDate: 2026-01-01")
+        self.assertEqual(mock_create.call_args.kwargs['stream_options'], {"include_usage": True})
+        self.assertEqual(mock_reserve_limiter.acquire.call_count, 1)
+        mock_limiter.record_usage.assert_called_once_with(mock_reserve_limiter.acquire.call_args.kwargs['tokens'], 77)
+
+
+@override_settings(CARE_PLAN_EXPORT_WORKERS=0, CARE_PLAN_EXPORT_TTL_SECONDS=3600)
+class ExportJobTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(CARE_PLAN_EXPORT_DIR=self.tmpdir.name)
+        self.settings_override.enable()
+        patient = Patient.objects.create(first_name="John", last_name="Doe", mrn="123456")
+        provider = Provider.objects.create(name="Dr. Alice Johnson", npi="1234567890")
+        for i in range(3):
+            Order.objects.create(
+                patient=patient,
+                provider=provider,
+                primary_diagnosis="G70.00" if i else "I10",
+                medication_name=f"Medication {i}",
+                patient_records="Test records"
+            )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+
+    def submit(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/orders/export/jobs', data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        return self.client.get(f"/api/orders/export/jobs/{response.json()['job_id']}").json()
+
+    def test_csv_export_job_renders_file_with_checksum(self):
+        job = self.submit(format="csv", diagnosis="G70.00")
+        self.assertEqual(job['status'], "succeeded")
+        self.assertEqual(job['row_count'], 2)
+        response = self.client.get(job['download_url'])
+        content = b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(len(content), job['file_size'])
+        self.assertEqual(hashlib.sha256(content).hexdigest(), job['checksum'])
+        self.assertEqual(response['ETag'], f'"{job["checksum"]}"')
+        self.assertIn("Medication 2", content.decode())
+        self.assertNotIn("Medication 0", content.decode())
+
+    def test_range_download_resumes(self):
+        job = self.submit(format="xlsx")
+        self.assertEqual(job['status'], "succeeded")
+        full = b''.join(self.client.get(job['download_url']).streaming_content)
+        response = self.client.get(job['download_url'], HTTP_RANGE='bytes=100-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f"bytes 100-{len(full) - 1}/{len(full)}")
+        self.assertEqual(b''.join(response.streaming_content), full[100:])
+        response = self.client.get(job['download_url'], HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), full[-10:])
+        response = self.client.get(job['download_url'], HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(job['download_url'], HTTP_RANGE=f'bytes={len(full)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_expired_exports_are_garbage_collected(self):
+        job = self.submit(format="csv")
+        path = ExportJob.objects.get(id=job['job_id']).file_path
+        ExportJob.objects.filter(id=job['job_id']).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.client.get(job['download_url']).status_code, 410)
+        out = StringIO()
+        call_command('cleanup_exports', stdout=out)
+        self.assertIn("Removed 1 expired export(s)", out.getvalue())
+        self.assertFalse(ExportJob.objects.filter(id=job['job_id']).exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_invalid_export_job_requests(self):
+        response = self.client.post('/api/orders/export/jobs', data=json.dumps({"format": "pdf"}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/orders/export/jobs', data=json.dumps({"start_date": "nope"}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ChangeExportTest(TestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(first_name="John", last_name="Doe", mrn="123456")
+        self.provider = Provider.objects.create(name="Dr. Alice Johnson", npi="1234567890")
+        self.other_patient = Patient.objects.create(first_name="Mary", last_name="Major", mrn="654321")
+        self.orders = [
+            Order.objects.create(
+                patient=patient,
+                provider=self.provider,
+                primary_diagnosis="G70.00",
+                medication_name=f"Medication {i}",
+                patient_records="Test records"
+            )
+            for i, patient in enumerate([self.patient, self.other_patient, self.patient])
+        ]
+
+    def pull(self, cursor=None, format='ndjson'):
+        url = f'/api/orders/export/changes?format={format}'
+        if cursor:
+            url += f'&cursor={cursor}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode()
+        if format == 'ndjson':
+            content = [json.loads(line) for line in content.splitlines()]
+        return content, response['X-Next-Cursor']
+
+    def test_initial_pull_then_no_changes(self):
+        records, cursor = self.pull()
+        self.assertEqual([r['order_id'] for r in records], [o.id for o in self.orders])
+        self.assertEqual(records[0]['patient']['mrn'], "123456")
+        records, next_cursor = self.pull(cursor)
+        self.assertEqual(records, [])
+        self.assertEqual(next_cursor, cursor)
+
+    def test_care_plan_regeneration_and_renames_are_changes(self):
+        _, cursor = self.pull()
+        save_care_plan(self.orders[1], "Regenerated plan")
+        records, cursor = self.pull(cursor)
+        self.assertEqual([(r['order_id'], r['care_plan']) for r in records], [(self.orders[1].id, "Regenerated plan")])
+        upsert_patient({'patient_mrn': "123456", 'patient_first_name': "Jon", 'patient_last_name': "Doe"})
+        records, cursor = self.pull(cursor)
+        self.assertEqual(sorted(r['order_id'] for r in records), [self.orders[0].id, self.orders[2].id])
+        self.assertEqual({r['patient']['first_name'] for r in records}, {"Jon"})
+        upsert_provider({'provider_npi': "1234567890", 'provider_name': "Dr. Alice Johnson-Smith"})
+        records, _ = self.pull(cursor)
+        self.assertEqual(len(records), 3)
+
+    def test_csv_change_export(self):
+        content, cursor = self.pull(format='csv')
+        lines = content.splitlines()
+        self.assertTrue(lines[0].endswith("Last Modified"))
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(cursor)
+
+    def test_invalid_cursor_and_format(self):
+        self.assertEqual(self.client.get('/api/orders/export/changes?cursor=not-a-cursor').status_code, 400)
+        self.assertEqual(self.client.get('/api/orders/export/changes?format=xlsx').status_code, 400)
+
+
+@skipUnless(columnar_export_available(), "pyarrow is not installed")
+class ColumnarExportTest(TestCase):
+    def setUp(self):
+        export_render_cache.clear()
+        patient = Patient.objects.create(first_name="John", last_name="Doe", mrn="123456")
+        provider = Provider.objects.create(name="Dr. Alice Johnson", npi="1234567890")
+        self.orders = [
+            Order.objects.create(
+                patient=patient,
+                provider=provider,
+                primary_diagnosis="G70.00",
+                additional_diagnoses=["I10"] if i else [],
+                medication_name="IVIG",
+                medication_history=["Prednisone 10mg"],
+                patient_records="Test records"
+            )
+            for i in range(3)
+        ]
+        save_care_plan(self.orders[0], "Plan")
+
+    def test_parquet_export_has_typed_columns(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        response = self.client.get('/api/orders/export?format=parquet')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.parquet')
+        self.assertIn('.parquet', response['Content-Disposition'])
+        table = pq.read_table(BytesIO(response.content))
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.schema.field('created_at').type, pa.timestamp('us', tz='UTC'))
+        self.assertEqual(table.schema.field('medication_name').type, pa.dictionary(pa.int32(), pa.string()))
+        self.assertEqual(table.schema.field('additional_diagnoses').type, pa.list_(pa.string()))
+        rows = {row['order_id']: row for row in table.to_pylist()}
+        self.assertEqual(rows[self.orders[0].id]['care_plan_length'], 4)
+        self.assertTrue(rows[self.orders[0].id]['care_plan_generated'])
+        self.assertFalse(rows[self.orders[1].id]['care_plan_generated'])
+        self.assertEqual(rows[self.orders[1].id]['additional_diagnoses'], ["I10"])
+        self.assertEqual(rows[self.orders[1].id]['medication_history'], ["Prednisone 10mg"])
+        columns = pq.read_table(BytesIO(response.content), columns=['order_id', 'primary_diagnosis'])
+        self.assertEqual(columns.column_names, ['order_id', 'primary_diagnosis'])
+
+    def test_arrow_stream_is_written_in_record_batches(self):
+        import pyarrow as pa
+        output = BytesIO()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(write_columnar(output, 'arrow', chunk_size=2), 3)
+        self.assertNotIn('"orders"."care_plan",', ' '.join(q['sql'] for q in queries.captured_queries))
+        reader = pa.ipc.open_stream(output.getvalue())
+        self.assertEqual([batch.num_rows for batch in reader], [2, 1])
+        response = self.client.get('/api/orders/export?format=arrow&diagnosis=G70.00')
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.arrow.stream')
+        self.assertEqual(pa.ipc.open_stream(response.content).read_all().num_rows, 3)
+
+    def test_parquet_export_job(self):
+        import pyarrow.parquet as pq
+        with tempfile.TemporaryDirectory() as tmpdir, override_settings(CARE_PLAN_EXPORT_DIR=tmpdir, CARE_PLAN_EXPORT_WORKERS=0):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/orders/export/jobs', data=json.dumps({"format": "parquet"}), content_type='application/json')
+            job = self.client.get(f"/api/orders/export/jobs/{response.json()['job_id']}").json()
+            self.assertEqual(job['status'], "succeeded")
+            self.assertEqual(job['row_count'], 3)
+            content = b''.join(self.client.get(job['download_url']).streaming_content)
+            self.assertEqual(pq.read_table(BytesIO(content)).num_rows, 3)
+
+
+class FuzzyPatientMatchTest(TestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(first_name="Katherine", last_name="Johnson", mrn="123456")
+        Patient.objects.create(first_name="Mary", last_name="Major", mrn="222222")
+
+    def test_soundex_and_blocking_keys(self):
+        self.assertEqual([soundex(name) for name in ["Robert", "Rupert", "Ashcraft", "Tymczak", "Pfister"]], ["R163", "R163", "A261", "T522", "P236"])
+        self.assertIn("p:J525:K365", patient_blocking_keys("Katherine", "Johnson"))
+        self.assertEqual(patient_blocking_keys("Johnson", "Katherine") & patient_blocking_keys("Katherine", "Johnson"), {"p:J525:K365"})
+        self.assertGreater(name_similarity("Catherine", "Jonson", "Katherine", "Johnson"), 0.85)
+
+    def test_blocking_keys_follow_patient_saves(self):
+        self.assertEqual(
+            set(self.patient.blocking_keys.values_list('key', flat=True)),
+            patient_blocking_keys("Katherine", "Johnson")
+        )
+        self.patient.last_name = "Smith"
+        self.patient.save(update_fields=['last_name'])
+        self.assertIn("l:smi:K365", set(self.patient.blocking_keys.values_list('key', flat=True)))
+        self.assertNotIn("l:joh:K365", set(self.patient.blocking_keys.values_list('key', flat=True)))
+
+    def test_typo_under_different_mrn_is_flagged(self):
+        for first_name, last_name in [("Katherine", "Jonson"), ("Catherine", "Johnson"), ("Johnson", "Katherine")]:
+            with self.assertNumQueries(2):
+                warning = DuplicateChecker.check_similar_patient("999999", first_name, last_name)
+            self.assertEqual(warning.warning_type, "possible_duplicate_patient")
+            self.assertEqual(warning.existing_record["patients"][0]["mrn"], "123456")
+        self.assertIsNone(DuplicateChecker.check_similar_patient("123456", "Katherine", "Johnson"))
+        self.assertIsNone(DuplicateChecker.check_similar_patient("999999", "Mark", "Jones"))
+        result = DuplicateChecker.validate_order("Kathrine", "Johnson", "999999", "Dr. New", "9999999999", "IVIG")
+        self.assertTrue(result["valid"])
+        self.assertEqual([w["type"] for w in result["warnings"]], ["possible_duplicate_patient"])
+
+    def test_bulk_created_patients_get_keys_and_rebuild_command(self):
+        create_orders_bulk([{
+            **ORDER_PAYLOAD,
+            "patient_first_name": "Katy",
+            "patient_last_name": "Johnson",
+            "patient_mrn": "333333",
+        }])
+        self.assertTrue(PatientBlockingKey.objects.filter(patient__mrn="333333", key="l:joh:K300").exists())
+        expected = PatientBlockingKey.objects.count()
+        PatientBlockingKey.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_patient_blocking_keys', stdout=out)
+        self.assertIn(f"Rebuilt {expected} blocking key(s)", out.getvalue())
+        self.assertEqual(PatientBlockingKey.objects.count(), expected)
+
+
+@override_settings(CARE_PLAN_PRESENCE_RECONCILE_SECONDS=3600)
+class PresenceFilterTest(TestCase):
+    def setUp(self):
+        known_mrns.reset()
+        known_npis.reset()
+        Patient.objects.create(first_name="John", last_name="Doe", mrn="123456")
+        Provider.objects.create(name="Dr. Alice Johnson", npi="1234567890")
+
+    def tearDown(self):
+        known_mrns.reset()
+        known_npis.reset()
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        values = [f"{i:06d}" for i in range(1000)]
+        for value in values:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in values))
+        false_positives = sum(1 for i in range(1000, 11000) if f"{i:06d}" in bloom)
+        self.assertLess(false_positives, 300)
+
+    def test_new_identifiers_skip_lookups(self):
+        self.assertTrue(known_mrns.might_exist("123456"))
+        self.assertTrue(known_npis.might_exist("1234567890"))
+        with self.assertNumQueries(2):
+            result = DuplicateChecker.validate_order("Jane", "Smith", "999999", "Dr. New Provider", "9999999999", "IVIG")
+        self.assertTrue(result["valid"])
+        result = DuplicateChecker.validate_order("Jane", "Smith", "999999", "Dr. Alice Johnson", "9999999999", "IVIG")
+        self.assertEqual([e["type"] for e in result["errors"]], ["duplicate_provider_npi_mismatch"])
+
+    def test_saves_and_bulk_creates_update_the_filter(self):
+        self.assertFalse(known_mrns.might_exist("555555"))
+        Patient.objects.create(first_name="Mary", last_name="Major", mrn="555555")
+        self.assertTrue(known_mrns.might_exist("555555"))
+        create_orders_bulk([{**ORDER_PAYLOAD, "patient_mrn": "666666", "provider_npi": "6666666666"}])
+        self.assertTrue(known_mrns.might_exist("666666"))
+        self.assertTrue(known_npis.might_exist("6666666666"))
+
+    def test_rows_written_elsewhere_are_reconciled(self):
+        self.assertFalse(known_mrns.might_exist("777777"))
+        Patient.objects.bulk_create([Patient(first_name="Out", last_name="Side", mrn="777777")])
+        self.assertFalse(known_mrns.might_exist("777777"))
+        with override_settings(CARE_PLAN_PRESENCE_RECONCILE_SECONDS=0):
+            self.assertTrue(known_mrns.might_exist("777777"))
+        result = DuplicateChecker.validate_order("Out", "Side", "777777", "Dr. Alice Johnson", "1234567890", "IVIG")
+        self.assertEqual(result["warnings"][0]["type"], "duplicate_patient")
+
+    def test_rows_committed_out_of_id_order_are_reconciled(self):
+        self.assertFalse(known_mrns.might_exist("100000"))
+        with override_settings(CARE_PLAN_PRESENCE_RECONCILE_SECONDS=0):
+            Patient.objects.bulk_create([Patient(id=1000, first_name="Late", last_name="Id", mrn="100000")])
+            self.assertTrue(known_mrns.might_exist("100000"))
+            Patient.objects.bulk_create([Patient(id=900, first_name="Out", last_name="Side", mrn="888888")])
+            self.assertEqual(known_mrns.existing(["888888", "999999"]), {"888888"})
+        results = DuplicateChecker.validate_orders([{**ORDER_PAYLOAD, "patient_first_name": "Out", "patient_last_name": "Side", "patient_mrn": "888888"}])
+        self.assertEqual(results[0]["warnings"][0]["type"], "duplicate_patient")
@@ -1,11 +1,25 @@
+from django.conf import settings
 from django.urls import path
 from . import views
+if settings.CARE_PLAN_ASYNC_VIEWS:
+    validate_view, generate_view = views.avalidate_order, views.agenerate_order
+else:
+    validate_view, generate_view = views.validate_order, views.generate_order
 urlpatterns = [
-    path('validate', views.validate_order, name='validate_order'),
-    path('generate', views.generate_order, name='generate_order'),
+    path('validate', validate_view, name='validate_order'),
+    path('validate/batch', views.validate_order_batch, name='validate_order_batch'),
+    path('generate', generate_view, name='generate_order'),
+    path('generate/batch', views.generate_order_batch, name='generate_order_batch'),
+    path('generate/stream', views.generate_order_stream, name='generate_order_stream'),
+    path('jobs/<uuid:job_id>', views.get_job, name='get_job'),
     path('export/all', views.export_all_care_plans, name='export_all_care_plans'),
     path('export/stats', views.export_stats, name='export_stats'),
+    path('export/changes', views.export_changes, name='export_changes'),
+    path('export/jobs', views.create_export_job, name='create_export_job'),
+    path('export/jobs/<uuid:job_id>', views.get_export_job, name='get_export_job'),
+    path('export/jobs/<uuid:job_id>/download', views.download_export_job, name='download_export_job'),
     path('export', views.export_orders, name='export_orders'),
+    path('analytics', views.order_analytics, name='order_analytics'),
     path('<int:order_id>', views.get_order, name='get_order'),
     path('', views.get_orders, name='get_orders'),
 ]
\ No newline at end of file
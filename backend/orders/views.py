@@ -1,23 +1,64 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
 from django.utils import timezone
-from django.http import HttpResponse, StreamingHttpResponse, FileResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, FileResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
+from asgiref.sync import sync_to_async
 from datetime import datetime
+from pathlib import Path
+from typing import Optional
 import logging
+import os
 import re
 import json
 from io import BytesIO
-from .models import Patient, Provider, Order
+from .models import Patient, Provider, Order, CarePlanJob, ExportJob
 from .serializers import (
     OrderCreateSerializer,
+    OrderBatchSerializer,
     OrderResponseSerializer,
     ValidationResponseSerializer,
-    CarePlanResponseSerializer
+    CarePlanResponseSerializer,
+    CarePlanJobSerializer,
+    ExportJobSerializer
 )
-from .llm import generate_care_plan
+from .services import (
+    create_order,
+    acreate_order,
+    create_orders_bulk,
+    generate_for_order,
+    agenerate_for_order,
+    generate_for_orders,
+    care_plan_inputs,
+    save_care_plan
+)
+from .cache import export_render_cache
+from .llm import CACHE_HIT, stream_care_plan
+from .resilience import CircuitOpenError
+from .jobs import recover_stale_care_plan_jobs, submit_care_plan_job, submit_export_job
 from .duplicate_checker import DuplicateChecker
-from .export import export_to_csv, export_to_excel, get_export_filename, get_orders_for_export
+from .analytics import BUCKETS, order_timeseries
+from .export import (
+    care_plan_export_queryset,
+    care_plan_export_record,
+    columnar_export_available,
+    filter_by_diagnosis,
+    stream_care_plans_ndjson,
+    stream_csv,
+    decode_change_cursor,
+    encode_change_cursor,
+    export_cache_key,
+    export_to_columnar_file,
+    export_to_excel_file,
+    export_watermark,
+    get_export_filename,
+    get_export_stats,
+    latest_change_position,
+    stream_changes
+)
 logger = logging.getLogger('orders')
 @api_view(['GET'])
 def api_root(request):
@@ -63,6 +104,39 @@ def validate_order(request):
             {"detail": f"Internal server error: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+def _batch_payload(request):
+    if isinstance(request.data, list):
+        return request.data, None
+    if isinstance(request.data, dict):
+        return request.data.get('orders'), None
+    return None, Response(
+        {"detail": "Request body must be a JSON array or an object with an 'orders' list"},
+        status=status.HTTP_400_BAD_REQUEST
+    )
+@api_view(['POST'])
+def validate_order_batch(request):
+    payload, error_response = _batch_payload(request)
+    if error_response:
+        return error_response
+    logger.info(f"Batch validation request received - orders: {len(payload) if isinstance(payload, list) else 'N/A'}")
+    serializer = OrderBatchSerializer(data={"orders": payload}, context={"max_size": settings.CARE_PLAN_VALIDATE_BATCH_MAX_SIZE})
+    if not serializer.is_valid():
+        logger.warning(f"Batch validation failed: {serializer.errors}")
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    results = DuplicateChecker.validate_orders(serializer.validated_data['orders'])
+    for index, result in enumerate(results):
+        result["index"] = index
+    valid = sum(1 for result in results if result["valid"])
+    logger.info(f"Batch validation complete - valid: {valid}, invalid: {len(results) - valid}")
+    return Response(
+        {
+            "total": len(results),
+            "valid": valid,
+            "invalid": len(results) - valid,
+            "results": results,
+        },
+        status=status.HTTP_200_OK if valid == len(results) else status.HTTP_207_MULTI_STATUS
+    )
 @api_view(['POST'])
 def generate_order(request):
     logger.info(f"Generate order request received - MRN: {request.data.get('patient_mrn', 'N/A')}, Medication: {request.data.get('medication_name', 'N/A')}")
@@ -72,62 +146,20 @@ def generate_order(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     data = serializer.validated_data
     logger.debug(f"Generating care plan for patient MRN: {data['patient_mrn']}, medication: {data['medication_name']}")
-    patient, created = Patient.objects.get_or_create(
-        mrn=data['patient_mrn'],
-        defaults={
-            'first_name': data['patient_first_name'],
-            'last_name': data['patient_last_name']
-        }
-    )
-    if created:
-        logger.info(f"New patient created - MRN: {patient.mrn}, Name: {patient.first_name} {patient.last_name}")
-    if patient.first_name != data['patient_first_name'] or patient.last_name != data['patient_last_name']:
-        logger.info(f"Updating patient names - MRN: {patient.mrn}")
-        patient.first_name = data['patient_first_name']
-        patient.last_name = data['patient_last_name']
-        patient.save()
-    try:
-        provider = Provider.objects.get(npi=data['provider_npi'])
-        logger.debug(f"Existing provider found - NPI: {provider.npi}, Name: {provider.name}")
-        if provider.name != data['provider_name']:
-            logger.info(f"Updating provider name - NPI: {provider.npi}, Old: {provider.name}, New: {data['provider_name']}")
-            provider.name = data['provider_name']
-            provider.save()
-    except Provider.DoesNotExist:
-        logger.info(f"New provider created - NPI: {data['provider_npi']}, Name: {data['provider_name']}")
-        provider = Provider.objects.create(
-            npi=data['provider_npi'],
-            name=data['provider_name']
+    order = create_order(data)
+    if request.query_params.get('async', '').lower() in ('1', 'true', 'yes'):
+        job = submit_care_plan_job(order)
+        return Response(
+            CarePlanJobSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED
         )
-    order = Order.objects.create(
-        patient=patient,
-        provider=provider,
-        primary_diagnosis=data['primary_diagnosis'],
-        additional_diagnoses=data.get('additional_diagnoses', []),
-        medication_name=data['medication_name'],
-        medication_history=data.get('medication_history', []),
-        patient_records=data['patient_records'],
-    )
-    logger.info(f"Order created - ID: {order.id}, Patient MRN: {patient.mrn}, Medication: {data['medication_name']}")
     try:
-        logger.info(f"Starting LLM care plan generation for order ID: {order.id}")
-        care_plan = generate_care_plan(
-            patient_records=data['patient_records'],
-            primary_diagnosis=data['primary_diagnosis'],
-            medication_name=data['medication_name'],
-            additional_diagnoses=data.get('additional_diagnoses', []),
-            medication_history=data.get('medication_history', []),
-            patient_first_name=data['patient_first_name'],
-            patient_last_name=data['patient_last_name'],
-            patient_mrn=data['patient_mrn'],
-        )
-        order.care_plan = care_plan
-        order.care_plan_generated_at = timezone.now()
-        order.save()
-        logger.info(f"Care plan generated successfully for order ID: {order.id}, length: {len(care_plan)} chars")
+        care_plan, cache_status = generate_for_order(order)
         response_serializer = CarePlanResponseSerializer(data={
             "care_plan": care_plan,
-            "order_id": order.id
+            "order_id": order.id,
+            "cache_hit": cache_status == CACHE_HIT,
+            "cache_status": cache_status
         })
         response_serializer.is_valid()
         return Response(response_serializer.validated_data, status=status.HTTP_201_CREATED)
@@ -137,15 +169,170 @@ def generate_order(request):
         logger.error(f"Traceback: {traceback.format_exc()}")
         order.delete()
         logger.info(f"Order {order.id} deleted due to care plan generation failure")
+        if isinstance(e, CircuitOpenError):
+            return Response(
+                {"detail": f"Failed to generate care plan: {str(e)}"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(int(e.retry_after) + 1)}
+            )
         return Response(
             {"detail": f"Failed to generate care plan: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+def _parse_json_body(request):
+    try:
+        payload = json.loads(request.body or b'{}')
+    except json.JSONDecodeError as e:
+        return None, JsonResponse({"detail": f"JSON parse error - {str(e)}"}, status=400)
+    if not isinstance(payload, dict):
+        return None, JsonResponse({"detail": "Request body must be a JSON object"}, status=400)
+    return payload, None
+@csrf_exempt
+@require_POST
+async def avalidate_order(request):
+    payload, error_response = _parse_json_body(request)
+    if error_response:
+        return error_response
+    try:
+        logger.info(f"Async validation request received - MRN: {payload.get('patient_mrn', 'N/A')}, NPI: {payload.get('provider_npi', 'N/A')}")
+        serializer = OrderCreateSerializer(data=payload)
+        if not serializer.is_valid():
+            logger.warning(f"Validation failed: {serializer.errors}")
+            return JsonResponse(serializer.errors, status=400)
+        data = serializer.validated_data
+        validation_result = await sync_to_async(DuplicateChecker.validate_order)(
+            patient_first_name=data['patient_first_name'],
+            patient_last_name=data['patient_last_name'],
+            patient_mrn=data['patient_mrn'],
+            provider_name=data['provider_name'],
+            provider_npi=data['provider_npi'],
+            medication_name=data['medication_name'],
+            primary_diagnosis=data.get('primary_diagnosis'),
+            additional_diagnoses=data.get('additional_diagnoses', []),
+            medication_history=data.get('medication_history', [])
+        )
+        logger.info(f"Validation complete - MRN: {data['patient_mrn']}, valid: {validation_result['valid']}, errors: {len(validation_result['errors'])}, warnings: {len(validation_result['warnings'])}")
+        return JsonResponse(validation_result, status=200 if validation_result['valid'] else 400)
+    except Exception as e:
+        import traceback
+        logger.error(f"Error in avalidate_order: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return JsonResponse({"detail": f"Internal server error: {str(e)}"}, status=500)
+@csrf_exempt
+@require_POST
+async def agenerate_order(request):
+    payload, error_response = _parse_json_body(request)
+    if error_response:
+        return error_response
+    logger.info(f"Async generate order request received - MRN: {payload.get('patient_mrn', 'N/A')}, Medication: {payload.get('medication_name', 'N/A')}")
+    serializer = OrderCreateSerializer(data=payload)
+    if not serializer.is_valid():
+        logger.warning(f"Generate order validation failed: {serializer.errors}")
+        return JsonResponse(serializer.errors, status=400)
+    order = await acreate_order(serializer.validated_data)
+    if request.GET.get('async', '').lower() in ('1', 'true', 'yes'):
+        job = await sync_to_async(submit_care_plan_job)(order)
+        return JsonResponse(CarePlanJobSerializer(job).data, status=202)
+    try:
+        care_plan, cache_status = await agenerate_for_order(order)
+        return JsonResponse(
+            {"care_plan": care_plan, "order_id": order.id, "cache_hit": cache_status == CACHE_HIT, "cache_status": cache_status},
+            status=201
+        )
+    except Exception as e:
+        logger.error(f"Failed to generate care plan for order ID: {order.id}, error: {str(e)}")
+        import traceback
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        order_id = order.id
+        await order.adelete()
+        logger.info(f"Order {order_id} deleted due to care plan generation failure")
+        if isinstance(e, CircuitOpenError):
+            response = JsonResponse({"detail": f"Failed to generate care plan: {str(e)}"}, status=503)
+            response['Retry-After'] = str(int(e.retry_after) + 1)
+            return response
+        return JsonResponse({"detail": f"Failed to generate care plan: {str(e)}"}, status=500)
+@api_view(['POST'])
+def generate_order_batch(request):
+    payload, error_response = _batch_payload(request)
+    if error_response:
+        return error_response
+    logger.info(f"Batch generate request received - orders: {len(payload) if isinstance(payload, list) else 'N/A'}")
+    serializer = OrderBatchSerializer(data={"orders": payload})
+    if not serializer.is_valid():
+        logger.warning(f"Batch generate validation failed: {serializer.errors}")
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    orders = create_orders_bulk(serializer.validated_data['orders'])
+    if request.query_params.get('async', '').lower() in ('1', 'true', 'yes'):
+        jobs = [submit_care_plan_job(order) for order in orders]
+        return Response(
+            {"jobs": CarePlanJobSerializer(jobs, many=True).data},
+            status=status.HTTP_202_ACCEPTED
+        )
+    results = generate_for_orders(orders, settings.CARE_PLAN_BATCH_CONCURRENCY)
+    succeeded = sum(1 for result in results if result["status"] == "succeeded")
+    logger.info(f"Batch generate complete - succeeded: {succeeded}, failed: {len(results) - succeeded}")
+    return Response(
+        {
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results,
+        },
+        status=status.HTTP_201_CREATED if succeeded == len(results) else status.HTTP_207_MULTI_STATUS
+    )
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+@api_view(['POST'])
+def generate_order_stream(request):
+    logger.info(f"Streaming generate order request received - MRN: {request.data.get('patient_mrn', 'N/A')}, Medication: {request.data.get('medication_name', 'N/A')}")
+    serializer = OrderCreateSerializer(data=request.data)
+    if not serializer.is_valid():
+        logger.warning(f"Generate order validation failed: {serializer.errors}")
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    order = create_order(serializer.validated_data)
+    def event_stream():
+        yield _sse_event("order", {"order_id": order.id})
+        parts = []
+        try:
+            logger.info(f"Starting streaming LLM care plan generation for order ID: {order.id}")
+            for text in stream_care_plan(**care_plan_inputs(order)):
+                parts.append(text)
+                yield _sse_event("token", {"text": text})
+            care_plan = ''.join(parts).strip()
+            save_care_plan(order, care_plan)
+            yield _sse_event("done", {"order_id": order.id, "care_plan": care_plan})
+        except GeneratorExit:
+            logger.warning(f"Client disconnected during care plan stream for order ID: {order.id}")
+            order.delete()
+            logger.info(f"Order {order.id} deleted due to interrupted care plan stream")
+            raise
+        except Exception as e:
+            logger.error(f"Failed to stream care plan for order ID: {order.id}, error: {str(e)}")
+            import traceback
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            order.delete()
+            logger.info(f"Order {order.id} deleted due to care plan generation failure")
+            yield _sse_event("error", {"detail": f"Failed to generate care plan: {str(e)}"})
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+@api_view(['GET'])
+def get_job(request, job_id):
+    try:
+        recover_stale_care_plan_jobs(id=job_id)
+        job = CarePlanJob.objects.select_related('order').get(id=job_id)
+    except CarePlanJob.DoesNotExist:
+        return Response(
+            {"detail": "Job not found"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(CarePlanJobSerializer(job).data)
 @api_view(['GET'])
 def get_orders(request):
     skip = int(request.query_params.get('skip', 0))
     limit = int(request.query_params.get('limit', 100))
-    orders = Order.objects.all()[skip:skip+limit]
+    orders = filter_by_diagnosis(Order.objects.all(), request.query_params.get('diagnosis'))[skip:skip+limit]
     serializer = OrderResponseSerializer(orders, many=True)
     return Response(serializer.data)
 @api_view(['GET'])
@@ -161,35 +348,121 @@ def get_order(request, order_id):
         )
 @api_view(['GET'])
 def export_all_care_plans(request):
-    orders = Order.objects.filter(care_plan__isnull=False).exclude(care_plan='')
-    export_data = []
-    for order in orders:
-        export_data.append({
-            "order_id": order.id,
-            "patient": {
-                "name": f"{order.patient.first_name} {order.patient.last_name}",
-                "mrn": order.patient.mrn,
-            },
-            "provider": {
-                "name": order.provider.name,
-                "npi": order.provider.npi,
-            },
-            "primary_diagnosis": order.primary_diagnosis,
-            "medication": order.medication_name,
-            "care_plan": order.care_plan,
-            "created_at": order.created_at.isoformat(),
-        })
+    try:
+        start_date = parse_start_date(request.query_params['start_date']) if request.query_params.get('start_date') else None
+        end_date = parse_end_date(request.query_params['end_date']) if request.query_params.get('end_date') else None
+    except ValueError:
+        return Response(
+            {"detail": "Invalid date format. Use YYYY-MM-DD"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    provider_npi = request.query_params.get('provider_npi')
+    diagnosis = request.query_params.get('diagnosis')
+    
+    if request.query_params.get('stream') in ('1', 'true', 'ndjson'):
+        after_order_id = request.query_params.get('after_order_id')
+        if after_order_id is not None and not after_order_id.isdigit():
+            return Response(
+                {"detail": "Invalid after_order_id. Must be an order id"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        logger.info(f"NDJSON care plan export requested - after_order_id: {after_order_id}")
+        return StreamingHttpResponse(
+            stream_care_plans_ndjson(
+                start_date, end_date, provider_npi, diagnosis,
+                after_order_id=int(after_order_id) if after_order_id is not None else None
+            ),
+            content_type='application/x-ndjson'
+        )
+    
+    orders = care_plan_export_queryset(start_date, end_date, provider_npi, diagnosis)
+    export_data = [care_plan_export_record(order) for order in orders]
     return Response({
         "total_orders": len(export_data),
         "orders": export_data,
     })
 
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+def parse_start_date(value: str) -> datetime:
+    if 'T' in value:
+        start_date = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    else:
+        start_date = datetime.strptime(value, '%Y-%m-%d')
+    if start_date.tzinfo is None:
+        start_date = timezone.make_aware(start_date)
+    return start_date
+def parse_end_date(value: str) -> datetime:
+    if 'T' in value:
+        end_date = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    else:
+        end_date = datetime.strptime(value, '%Y-%m-%d')
+        end_date = end_date.replace(hour=23, minute=59, second=59)
+    if end_date.tzinfo is None:
+        end_date = timezone.make_aware(end_date)
+    return end_date
+def _export_filters(params) -> dict:
+    return {
+        "start_date": parse_start_date(params['start_date']) if params.get('start_date') else None,
+        "end_date": parse_end_date(params['end_date']) if params.get('end_date') else None,
+        "provider_npi": params.get('provider_npi'),
+        "diagnosis": params.get('diagnosis'),
+    }
+def _orders_export_kind(request) -> Optional[str]:
+    format_param = request.GET.get('format', 'csv').lower()
+    format_param = 'xlsx' if format_param == 'excel' else format_param
+    return f"orders:{format_param}" if format_param in EXPORT_CONTENT_TYPES else None
+def _stats_export_kind(request) -> str:
+    return f"stats:{request.GET.get('top', settings.CARE_PLAN_STATS_TOP_N)}"
+def _export_cache_state(request, kind: Optional[str]) -> dict:
+    if kind is None:
+        return {}
+    state = getattr(request, '_export_cache_state', None)
+    if state is None:
+        try:
+            filters = _export_filters(request.GET)
+        except ValueError:
+            state = {}
+        else:
+            watermark = export_watermark(**filters)
+            state = {"key": export_cache_key(kind, filters, watermark), "watermark": watermark}
+        request._export_cache_state = state
+    return state
+def _export_etag(kind_func):
+    def etag(request, *args, **kwargs):
+        state = _export_cache_state(request, kind_func(request))
+        return f'"{state["key"]}"' if state else None
+    return etag
+def _export_last_modified(kind_func):
+    def last_modified(request, *args, **kwargs):
+        state = _export_cache_state(request, kind_func(request))
+        return state["watermark"]["last_modified"] if state else None
+    return last_modified
+def _cache_stream(chunks, key: str):
+    parts = []
+    size = 0
+    for chunk in chunks:
+        data = chunk.encode() if isinstance(chunk, str) else chunk
+        if parts is not None:
+            size += len(data)
+            if size > export_render_cache.max_bytes:
+                parts = None
+            else:
+                parts.append(data)
+        yield data
+    if parts is not None:
+        export_render_cache.set(key, b''.join(parts))
+@condition(etag_func=_export_etag(_orders_export_kind), last_modified_func=_export_last_modified(_orders_export_kind))
 def export_orders(request):
     try:
         format_param = request.GET.get('format', 'csv').lower()
-        if format_param not in ['csv', 'excel', 'xlsx']:
+        if format_param not in ['csv', 'excel', 'xlsx', 'parquet', 'arrow']:
             return HttpResponse(
-                json.dumps({"detail": "Invalid format. Must be 'csv' or 'excel'"}),
+                json.dumps({"detail": "Invalid format. Must be 'csv', 'excel', 'parquet' or 'arrow'"}),
                 content_type='application/json',
                 status=400
             )
@@ -197,6 +470,13 @@ def export_orders(request):
         if format_param == 'excel':
             format_param = 'xlsx'
         
+        if format_param in ('parquet', 'arrow') and not columnar_export_available():
+            return HttpResponse(
+                json.dumps({"detail": "Parquet and Arrow exports require pyarrow to be installed"}),
+                content_type='application/json',
+                status=400
+            )
+        
         start_date_str = request.GET.get('start_date')
         end_date_str = request.GET.get('end_date')
         provider_npi = request.GET.get('provider_npi')
@@ -207,12 +487,7 @@ def export_orders(request):
         
         if start_date_str:
             try:
-                if 'T' in start_date_str:
-                    start_date = datetime.fromisoformat(start_date_str.replace('Z', '+00:00'))
-                else:
-                    start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-                if start_date.tzinfo is None:
-                    start_date = timezone.make_aware(start_date)
+                start_date = parse_start_date(start_date_str)
             except ValueError:
                 return HttpResponse(
                     json.dumps({"detail": "Invalid start_date format. Use YYYY-MM-DD"}),
@@ -222,13 +497,7 @@ def export_orders(request):
         
         if end_date_str:
             try:
-                if 'T' in end_date_str:
-                    end_date = datetime.fromisoformat(end_date_str.replace('Z', '+00:00'))
-                else:
-                    end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-                    end_date = end_date.replace(hour=23, minute=59, second=59)
-                if end_date.tzinfo is None:
-                    end_date = timezone.make_aware(end_date)
+                end_date = parse_end_date(end_date_str)
             except ValueError:
                 return HttpResponse(
                     json.dumps({"detail": "Invalid end_date format. Use YYYY-MM-DD"}),
@@ -238,19 +507,44 @@ def export_orders(request):
         
         logger.info(f"Export request - format: {format_param}, start_date: {start_date}, end_date: {end_date}, provider_npi: {provider_npi}, diagnosis: {diagnosis}")
         
+        cache_key = _export_cache_state(request, f"orders:{format_param}")["key"]
+        cached = export_render_cache.get(cache_key)
+        
         if format_param == 'csv':
-            csv_content = export_to_csv(start_date, end_date, provider_npi, diagnosis)
             filename = get_export_filename('csv', start_date, end_date)
-            response = HttpResponse(csv_content, content_type='text/csv')
+            if cached is not None:
+                response = HttpResponse(cached, content_type='text/csv')
+                logger.info(f"CSV export served from render cache - filename: {filename}")
+            else:
+                response = StreamingHttpResponse(
+                    _cache_stream(stream_csv(start_date, end_date, provider_npi, diagnosis), cache_key),
+                    content_type='text/csv'
+                )
+                logger.info(f"CSV export streaming - filename: {filename}")
             response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            logger.info(f"CSV export completed - filename: {filename}")
             return response
-        elif format_param == 'xlsx':
-            excel_content = export_to_excel(start_date, end_date, provider_npi, diagnosis)
-            filename = get_export_filename('xlsx', start_date, end_date)
-            response = HttpResponse(excel_content, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        elif format_param in ('xlsx', 'parquet', 'arrow'):
+            filename = get_export_filename(format_param, start_date, end_date)
+            content_type = EXPORT_CONTENT_TYPES[format_param]
+            if cached is not None:
+                response = HttpResponse(cached, content_type=content_type)
+                logger.info(f"{format_param} export served from render cache - filename: {filename}")
+            else:
+                if format_param == 'xlsx':
+                    export_file = export_to_excel_file(start_date, end_date, provider_npi, diagnosis)
+                else:
+                    export_file = export_to_columnar_file(format_param, start_date, end_date, provider_npi, diagnosis)
+                size = export_file.seek(0, os.SEEK_END)
+                export_file.seek(0)
+                if size <= export_render_cache.max_bytes:
+                    with export_file:
+                        content = export_file.read()
+                    export_render_cache.set(cache_key, content)
+                    response = HttpResponse(content, content_type=content_type)
+                else:
+                    response = FileResponse(export_file, content_type=content_type)
             response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            logger.info(f"Excel export completed - filename: {filename}")
+            logger.info(f"{format_param} export completed - filename: {filename}")
             return response
         
         return HttpResponse(
@@ -270,7 +564,138 @@ def export_orders(request):
             status=500
         )
 
+def export_changes(request):
+    format_param = request.GET.get('format', 'ndjson').lower()
+    if format_param not in ('csv', 'ndjson'):
+        return JsonResponse({"detail": "Invalid format. Must be 'csv' or 'ndjson'"}, status=400)
+    cursor = request.GET.get('cursor')
+    since = None
+    if cursor:
+        try:
+            since = decode_change_cursor(cursor)
+        except ValueError as e:
+            return JsonResponse({"detail": str(e)}, status=400)
+    
+    until = latest_change_position()
+    if until is not None and since is not None and until <= since:
+        until = None
+    next_cursor = encode_change_cursor(until) if until is not None else (cursor or '')
+    logger.info(f"Change export requested - format: {format_param}, since: {since}, until: {until}")
+    
+    response = StreamingHttpResponse(
+        stream_changes(format_param, since, until),
+        content_type='text/csv' if format_param == 'csv' else 'application/x-ndjson'
+    )
+    response['X-Next-Cursor'] = next_cursor
+    response['Cache-Control'] = 'no-store'
+    return response
+@api_view(['POST'])
+def create_export_job(request):
+    format_param = str(request.data.get('format', 'csv')).lower()
+    if format_param == 'excel':
+        format_param = 'xlsx'
+    if format_param not in EXPORT_CONTENT_TYPES:
+        return Response(
+            {"detail": "Invalid format. Must be 'csv', 'excel', 'parquet' or 'arrow'"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if format_param in ('parquet', 'arrow') and not columnar_export_available():
+        return Response(
+            {"detail": "Parquet and Arrow exports require pyarrow to be installed"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    start_date = None
+    end_date = None
+    try:
+        if request.data.get('start_date'):
+            start_date = parse_start_date(request.data['start_date'])
+        if request.data.get('end_date'):
+            end_date = parse_end_date(request.data['end_date'])
+    except ValueError:
+        return Response(
+            {"detail": "Invalid date format. Use YYYY-MM-DD"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    filters = {
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+        "provider_npi": request.data.get('provider_npi') or None,
+        "diagnosis": request.data.get('diagnosis') or None,
+    }
+    job = submit_export_job(format_param, filters, get_export_filename(format_param, start_date, end_date))
+    return Response(ExportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 @api_view(['GET'])
+def get_export_job(request, job_id):
+    try:
+        job = ExportJob.objects.get(id=job_id)
+    except ExportJob.DoesNotExist:
+        return Response(
+            {"detail": "Export job not found"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(ExportJobSerializer(job).data)
+def _read_range(file, length: int, chunk_size: int = 64 * 1024):
+    try:
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+def _parse_range(header: str, size: int):
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if not match.group(1):
+        return max(size - int(match.group(2)), 0), size - 1
+    start = int(match.group(1))
+    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    return start, end
+def download_export_job(request, job_id):
+    try:
+        job = ExportJob.objects.get(id=job_id)
+    except ExportJob.DoesNotExist:
+        return JsonResponse({"detail": "Export job not found"}, status=404)
+    if job.status != ExportJob.STATUS_SUCCEEDED:
+        return JsonResponse({"detail": f"Export job is {job.status}"}, status=409)
+    path = Path(job.file_path)
+    if (job.expires_at and job.expires_at <= timezone.now()) or not path.exists():
+        return JsonResponse({"detail": "Export file has expired"}, status=410)
+    
+    size = job.file_size
+    etag = f'"{job.checksum}"'
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and request.META.get('HTTP_IF_RANGE', etag) == etag:
+        byte_range = _parse_range(range_header, size)
+    
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=EXPORT_CONTENT_TYPES[job.format])
+    else:
+        start, end = byte_range
+        if start >= size or start > end:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        file = open(path, 'rb')
+        file.seek(start)
+        response = StreamingHttpResponse(
+            _read_range(file, end - start + 1),
+            status=206,
+            content_type=EXPORT_CONTENT_TYPES[job.format]
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+        logger.info(f"Export job {job_id} partial download - bytes {start}-{end}/{size}")
+    response['Content-Disposition'] = f'attachment; filename="{job.filename}"'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['X-Checksum-SHA256'] = job.checksum
+    return response
+@api_view(['GET'])
+@condition(etag_func=_export_etag(_stats_export_kind), last_modified_func=_export_last_modified(_stats_export_kind))
 def export_stats(request):
     try:
         start_date_str = request.query_params.get('start_date')
@@ -283,12 +708,7 @@ def export_stats(request):
         
         if start_date_str:
             try:
-                if 'T' in start_date_str:
-                    start_date = datetime.fromisoformat(start_date_str.replace('Z', '+00:00'))
-                else:
-                    start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-                if start_date.tzinfo is None:
-                    start_date = timezone.make_aware(start_date)
+                start_date = parse_start_date(start_date_str)
             except ValueError:
                 return Response(
                     {"detail": "Invalid start_date format. Use YYYY-MM-DD"},
@@ -297,23 +717,29 @@ def export_stats(request):
         
         if end_date_str:
             try:
-                if 'T' in end_date_str:
-                    end_date = datetime.fromisoformat(end_date_str.replace('Z', '+00:00'))
-                else:
-                    end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-                    end_date = end_date.replace(hour=23, minute=59, second=59)
-                if end_date.tzinfo is None:
-                    end_date = timezone.make_aware(end_date)
+                end_date = parse_end_date(end_date_str)
             except ValueError:
                 return Response(
                     {"detail": "Invalid end_date format. Use YYYY-MM-DD"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
-        orders = get_orders_for_export(start_date, end_date, provider_npi, diagnosis)
+        try:
+            top = int(request.query_params.get('top', settings.CARE_PLAN_STATS_TOP_N))
+            if top < 1:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {"detail": "Invalid top. Must be a positive integer"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        total_orders = len(orders)
-        care_plans_generated = sum(1 for order in orders if order.care_plan)
+        cache_key = _export_cache_state(request, _stats_export_kind(request))["key"]
+        stats = export_render_cache.get(cache_key)
+        if stats is None:
+            stats = get_export_stats(start_date, end_date, provider_npi, diagnosis, top)
+            export_render_cache.set(cache_key, stats)
+        stats = dict(stats)
         
         if start_date and end_date:
             date_range = f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
@@ -324,18 +750,9 @@ def export_stats(request):
         else:
             date_range = "All time"
         
-        providers = list(set(order.provider.name for order in orders))
-        diagnoses = list(set(order.primary_diagnosis for order in orders))
-        
-        stats = {
-            "total_orders": total_orders,
-            "care_plans_generated": care_plans_generated,
-            "date_range": date_range,
-            "providers": providers,
-            "diagnoses": diagnoses
-        }
+        stats["date_range"] = date_range
         
-        logger.info(f"Export stats requested - total_orders: {total_orders}, care_plans_generated: {care_plans_generated}")
+        logger.info(f"Export stats requested - total_orders: {stats['total_orders']}, care_plans_generated: {stats['care_plans_generated']}")
         return Response(stats)
         
     except Exception as e:
@@ -346,4 +763,37 @@ def export_stats(request):
         return Response(
             {"detail": f"Internal server error: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+@api_view(['GET'])
+def order_analytics(request):
+    bucket = request.query_params.get('bucket', 'day').lower()
+    if bucket not in BUCKETS:
+        return Response(
+            {"detail": f"Invalid bucket. Must be one of: {', '.join(BUCKETS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    days = {}
+    for param in ('start_date', 'end_date'):
+        value = request.query_params.get(param)
+        if value:
+            try:
+                days[param] = datetime.strptime(value, '%Y-%m-%d').date()
+            except ValueError:
+                return Response(
+                    {"detail": f"Invalid {param} format. Use YYYY-MM-DD"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+    series = order_timeseries(
+        start_day=days.get('start_date'),
+        end_day=days.get('end_date'),
+        provider_npi=request.query_params.get('provider_npi'),
+        diagnosis=request.query_params.get('diagnosis'),
+        bucket=bucket
+    )
+    logger.info(f"Analytics requested - bucket: {bucket}, periods: {len(series)}")
+    return Response({
+        "bucket": bucket,
+        "total_orders": sum(point["orders"] for point in series),
+        "care_plans_generated": sum(point["care_plans"] for point in series),
+        "series": series,
+    })
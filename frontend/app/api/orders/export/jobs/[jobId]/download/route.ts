@@ -0,0 +1,49 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+const BACKEND_URL = process.env.BACKEND_URL || 'http://127.0.0.1:8000';
+
+const FORWARDED_RESPONSE_HEADERS = [
+  'Content-Type',
+  'Content-Length',
+  'Content-Range',
+  'Content-Disposition',
+  'Accept-Ranges',
+  'ETag',
+  'X-Checksum-SHA256',
+];
+
+export async function GET(
+  request: NextRequest,
+  { params }: { params: { jobId: string } }
+) {
+  try {
+    const headers: Record<string, string> = {};
+    const range = request.headers.get('Range');
+    const ifRange = request.headers.get('If-Range');
+    if (range) headers['Range'] = range;
+    if (ifRange) headers['If-Range'] = ifRange;
+    
+    const response = await fetch(`${BACKEND_URL}/api/orders/export/jobs/${encodeURIComponent(params.jobId)}/download`, {
+      method: 'GET',
+      headers,
+      cache: 'no-store',
+    });
+    
+    const responseHeaders = new Headers();
+    for (const name of FORWARDED_RESPONSE_HEADERS) {
+      const value = response.headers.get(name);
+      if (value) responseHeaders.set(name, value);
+    }
+    
+    return new NextResponse(response.body, {
+      status: response.status,
+      headers: responseHeaders,
+    });
+  } catch (error: any) {
+    console.error('Export download proxy error:', error);
+    return NextResponse.json(
+      { detail: error.message || 'Internal server error' },
+      { status: 500 }
+    );
+  }
+}
@@ -0,0 +1,28 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+const BACKEND_URL = process.env.BACKEND_URL || 'http://127.0.0.1:8000';
+
+export async function GET(
+  request: NextRequest,
+  { params }: { params: { jobId: string } }
+) {
+  try {
+    const response = await fetch(`${BACKEND_URL}/api/orders/export/jobs/${encodeURIComponent(params.jobId)}`, {
+      method: 'GET',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      cache: 'no-store',
+    });
+    
+    const data = await response.json();
+    
+    return NextResponse.json(data, { status: response.status });
+  } catch (error: any) {
+    console.error('Export job status proxy error:', error);
+    return NextResponse.json(
+      { detail: error.message || 'Internal server error' },
+      { status: 500 }
+    );
+  }
+}
@@ -0,0 +1,27 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+const BACKEND_URL = process.env.BACKEND_URL || 'http://127.0.0.1:8000';
+
+export async function POST(request: NextRequest) {
+  try {
+    const body = await request.json();
+    
+    const response = await fetch(`${BACKEND_URL}/api/orders/export/jobs`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(body),
+    });
+    
+    const data = await response.json();
+    
+    return NextResponse.json(data, { status: response.status });
+  } catch (error: any) {
+    console.error('Export job proxy error:', error);
+    return NextResponse.json(
+      { detail: error.message || 'Internal server error' },
+      { status: 500 }
+    );
+  }
+}
@@ -20,9 +20,6 @@ export async function GET(request: NextRequest) {
     
     const response = await fetch(`${BACKEND_URL}/api/orders/export?${params.toString()}`, {
       method: 'GET',
-      headers: {
-        'Accept': format === 'csv' || format === 'xlsx' ? (format === 'csv' ? 'text/csv' : 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet') : 'text/csv',
-      },
     });
     
     if (!response.ok) {
@@ -40,11 +37,11 @@ export async function GET(request: NextRequest) {
     }
     
     const blob = await response.blob();
-    const filename = response.headers.get('Content-Disposition')?.split('filename=')[1]?.replace(/"/g, '') || `export.${format === 'csv' ? 'csv' : 'xlsx'}`;
+    const filename = response.headers.get('Content-Disposition')?.split('filename=')[1]?.replace(/"/g, '') || `export.${format === 'excel' ? 'xlsx' : format}`;
     
     return new NextResponse(blob, {
       headers: {
-        'Content-Type': format === 'csv' ? 'text/csv' : 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'Content-Type': response.headers.get('Content-Type') || 'application/octet-stream',
         'Content-Disposition': `attachment; filename="${filename}"`,
       },
     });